@@ -1,23 +1,45 @@
 import asyncio
+import os
 from typing import Optional
 from contextlib import AsyncExitStack
-import json
 
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
+import mcp.types as types
 
-from anthropic import Anthropic
+from anthropic import AsyncAnthropic
 from dotenv import load_dotenv
 
 load_dotenv()  # load environment variables from .env
 
+MODEL = os.getenv("ANTHROPIC_MODEL", "claude-3-5-sonnet-20241022")
+# Mark the tool block as cacheable so repeated queries reuse it from the prompt cache
+PROMPT_CACHING = os.getenv("ANTHROPIC_PROMPT_CACHING", "false").lower() in ("1", "true", "yes")
+MAX_TOOL_CONCURRENCY = int(os.getenv("MCP_MAX_TOOL_CONCURRENCY", "8"))
+TOOL_TIMEOUT = float(os.getenv("MCP_TOOL_TIMEOUT", "30"))
+MAX_TURNS = int(os.getenv("MCP_MAX_TURNS", "10"))
+
 class MCPClient:
-    def __init__(self):
-        print('HERE')
+    def __init__(
+        self,
+        anthropic: Optional[AsyncAnthropic] = None,
+        prompt_caching: bool = PROMPT_CACHING,
+        max_tool_concurrency: int = MAX_TOOL_CONCURRENCY,
+        tool_timeout: float = TOOL_TIMEOUT,
+        max_turns: int = MAX_TURNS
+    ):
         # Initialize session and client objects
         self.session: Optional[ClientSession] = None
         self.exit_stack = AsyncExitStack()
-        self.anthropic = Anthropic()
+        # AsyncAnthropic honours ANTHROPIC_BASE_URL, so a stub endpoint can stand in for the API
+        self.anthropic = anthropic or AsyncAnthropic()
+        self.prompt_caching = prompt_caching
+        self._tools: Optional[list[dict]] = None
+        self._tools_lock = asyncio.Lock()
+        self._notification_task: Optional[asyncio.Task] = None
+        self._tool_slots = asyncio.Semaphore(max_tool_concurrency)
+        self.tool_timeout = tool_timeout
+        self.max_turns = max_turns
 
     async def connect_to_server(self, server_script_path: str):
         """Connect to an MCP server
@@ -42,78 +64,104 @@ class MCPClient:
         self.session = await self.exit_stack.enter_async_context(ClientSession(self.stdio, self.write))
         
         await self.session.initialize()
-        
-        # List available tools
-        response = await self.session.list_tools()
-        tools = response.tools
-        # print("\nConnected to server with tools:", [tool.name for tool in tools])
+        self._notification_task = asyncio.create_task(self._watch_notifications())
+
+        # Prime the tool catalog
+        await self.get_tools()
+
+    async def _watch_notifications(self):
+        """Drain server messages, dropping the tool catalog when the server's list changes"""
+        async for message in self.session.incoming_messages:
+            if isinstance(message, types.ServerNotification) and isinstance(message.root, types.ToolListChangedNotification):
+                self._tools = None
+
+    async def get_tools(self) -> list[dict]:
+        """Get the tool definitions for Claude, listing them from the server only when needed"""
+        if self._tools is None:
+            async with self._tools_lock:
+                if self._tools is None:
+                    response = await self.session.list_tools()
+                    tools = [{
+                        "name": tool.name,
+                        "description": tool.description,
+                        "input_schema": tool.inputSchema
+                    } for tool in response.tools]
+                    if self.prompt_caching and tools:
+                        tools[-1]["cache_control"] = {"type": "ephemeral"}
+                    self._tools = tools
+        return self._tools
 
     async def process_query(self, query: str) -> str:
-        """Process a query using Claude and available tools"""
+        """Process a query using Claude and available tools
+
+        Runs the agent loop until Claude stops requesting tools. All tool_use
+        blocks of one turn are executed concurrently and their results are
+        returned to Claude together in the next turn.
+        """
         messages = [
             {
                 "role": "user",
                 "content": query
             }
         ]
+        final_text = []
 
-        response = await self.session.list_tools()
-        available_tools = [{ 
-            "name": tool.name,
-            "description": tool.description,
-            "input_schema": tool.inputSchema
-        } for tool in response.tools]
-        # print("\nSchema being sent to Claude:", json.dumps(available_tools, indent=2))
-
-        # Initial Claude API call
-        response = self.anthropic.messages.create(
-            model="claude-3-5-sonnet-20241022",
-            max_tokens=1000,
-            messages=messages,
-            tools=available_tools
-        )
+        for _ in range(self.max_turns):
+            available_tools = await self.get_tools()
+            response = await self.anthropic.messages.create(
+                model=MODEL,
+                max_tokens=1000,
+                messages=messages,
+                tools=available_tools
+            )
+
+            tool_uses = []
+            for content in response.content:
+                if content.type == 'text':
+                    final_text.append(content.text)
+                elif content.type == 'tool_use':
+                    tool_uses.append(content)
+                    final_text.append(f"[Calling tool {content.name} with args {content.input}]")
+
+            if response.stop_reason != "tool_use" or not tool_uses:
+                break
+
+            messages.append({
+                "role": "assistant",
+                "content": [content.model_dump() for content in response.content]
+            })
+            tool_results = await asyncio.gather(*(self._call_tool(content) for content in tool_uses))
+            messages.append({
+                "role": "user",
+                "content": list(tool_results)
+            })
 
-        # Process response and handle tool calls
-        tool_results = []
-        final_text = []
+        return "\n".join(final_text)
 
-        for content in response.content:
-            if content.type == 'text':
-                final_text.append(content.text)
-                # print(f"Text content: {content.text}")
-            elif content.type == 'tool_use':
-                tool_name = content.name
-                tool_args = content.input
-                # print(f"Calling tool {tool_name} with args {tool_args}")
-                
-                # Execute tool call
-                result = await self.session.call_tool(tool_name, tool_args)
-                # print(f"Tool result: {result}")
-                tool_results.append({"call": tool_name, "result": result})
-                final_text.append(f"[Calling tool {tool_name} with args {tool_args}]")
-
-                # Continue conversation with tool results
-                if hasattr(content, 'text') and content.text:
-                    messages.append({
-                      "role": "assistant",
-                      "content": content.text
-                    })
-                messages.append({
-                    "role": "user", 
-                    "content": result.content
-                })
-
-                # Get next response from Claude
-                response = self.anthropic.messages.create(
-                    model="claude-3-5-sonnet-20241022",
-                    max_tokens=1000,
-                    messages=messages,
+    async def _call_tool(self, content) -> dict:
+        """Execute one tool_use block and build its tool_result"""
+        async with self._tool_slots:
+            try:
+                result = await asyncio.wait_for(
+                    self.session.call_tool(content.name, content.input),
+                    self.tool_timeout
                 )
+            except asyncio.TimeoutError:
+                return self._tool_result(content.id, f"Tool {content.name} timed out after {self.tool_timeout}s", True)
+            except Exception as e:
+                return self._tool_result(content.id, f"Tool {content.name} failed: {e}", True)
+        text = "\n".join(block.text for block in result.content if block.type == "text")
+        return self._tool_result(content.id, text, result.isError)
+
+    @staticmethod
+    def _tool_result(tool_use_id: str, text: str, is_error: bool) -> dict:
+        return {
+            "type": "tool_result",
+            "tool_use_id": tool_use_id,
+            "content": text,
+            "is_error": is_error
+        }
 
-                final_text.append(response.content[0].text)
-
-        return "\n".join(final_text)
-        
     async def chat_loop(self):
         """Run an interactive chat loop"""
         print("\nMCP Client Started!")
@@ -121,7 +169,8 @@ class MCPClient:
         
         while True:
             try:
-                query = input("\nQuery: ").strip()
+                # input() blocks, so read it off the event loop
+                query = (await asyncio.to_thread(input, "\nQuery: ")).strip()
                 
                 if query.lower() == 'quit':
                     break
@@ -134,6 +183,8 @@ class MCPClient:
 
     async def cleanup(self):
         """Clean up resources"""
+        if self._notification_task is not None:
+            self._notification_task.cancel()
         await self.exit_stack.aclose()
 
 async def main():
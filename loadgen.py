@@ -0,0 +1,298 @@
+"""Load generator for the MCP TCP transport
+
+Opens N connections and sends a weighted mix of MCP requests, either at a
+fixed total rate (open loop) or as fast as responses come back (closed loop).
+Reports throughput, error rate and a latency histogram, and the server's CPU
+time and memory as read from its ha://metrics resource before and after the run.
+With --local it starts an in-process server backed by a simulated Home
+Assistant; that server shares this process, so its CPU time and memory include
+the load generator's own.
+
+    python loadgen.py --local --connections 50 --rate 500 --duration 10
+    python loadgen.py --port 8888 --connections 200 --closed-loop --in-flight 4
+
+With --replay the local server answers from traffic recorded with
+HOMEASSISTANT_RECORD instead of the simulator, at the recorded speed or, with
+--replay-speed fast, as fast as possible.
+
+    python loadgen.py --local --replay traffic.jsonl.gz --closed-loop
+"""
+import argparse
+import asyncio
+import bisect
+import json
+import math
+import os
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+sys.path.append(str(Path(__file__).parent / "src"))
+
+# Request names from REQUESTS and their relative weight. render_template is left out because
+# the simulator needs jinja2 to render templates
+DEFAULT_MIX = "lock-lock=3,light-turn_on=3,climate-set_temperature=1,tools/list=1"
+
+REQUESTS = {
+    "tools/list": ("tools/list", {}),
+    "resources/list": ("resources/list", {}),
+    "lock-lock": ("tools/call", {"name": "lock-lock", "arguments": {"entity_id": "front_door"}}),
+    "lock-unlock": ("tools/call", {"name": "lock-unlock", "arguments": {"entity_id": "front_door"}}),
+    "light-turn_on": ("tools/call", {"name": "light-turn_on", "arguments": {"entity_id": "ceiling_lights", "brightness_pct": 40}}),
+    "light-turn_off": ("tools/call", {"name": "light-turn_off", "arguments": {"entity_id": "ceiling_lights"}}),
+    "climate-set_temperature": ("tools/call", {"name": "climate-set_temperature", "arguments": {"entity_id": "climate", "temperature": 70}}),
+    "render_template": ("tools/call", {"name": "render_template", "arguments": {"template": "{{ states.lock | list | count }}"}}),
+}
+
+
+class LatencyHistogram:
+    """Log-linear latency histogram (about 1% precision, microsecond resolution)"""
+
+    def __init__(self):
+        self._counts: Dict[int, int] = {}
+        self.count = 0
+        self.max = 0.0
+
+    @staticmethod
+    def _bucket(seconds: float) -> int:
+        return int(math.log(max(seconds * 1e6, 1.0), 1.01))
+
+    def record(self, seconds: float) -> None:
+        bucket = self._bucket(seconds)
+        self._counts[bucket] = self._counts.get(bucket, 0) + 1
+        self.count += 1
+        self.max = max(self.max, seconds)
+
+    def percentile(self, percent: float) -> float:
+        if not self.count:
+            return 0.0
+        target = math.ceil(self.count * percent / 100)
+        seen = 0
+        for bucket in sorted(self._counts):
+            seen += self._counts[bucket]
+            if seen >= target:
+                return min(1.01 ** (bucket + 1) / 1e6, self.max)
+        return self.max
+
+
+class LoadConnection:
+    """One pipelined client connection correlating responses by id"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._reader = reader
+        self._writer = writer
+        self._next_id = 1
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._reader_task = asyncio.create_task(self._read_loop())
+
+    @classmethod
+    async def open(cls, host: str, port: int) -> "LoadConnection":
+        reader, writer = await asyncio.open_connection(host, port, limit=16 * 1024 * 1024)
+        return cls(reader, writer)
+
+    async def request(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        message_id = self._next_id
+        self._next_id += 1
+        future = asyncio.get_running_loop().create_future()
+        self._pending[message_id] = future
+        self._writer.write(json.dumps({"jsonrpc": "2.0", "id": message_id, "method": method, "params": params}).encode() + b"\n")
+        await self._writer.drain()
+        return await future
+
+    async def close(self) -> None:
+        self._reader_task.cancel()
+        self._writer.close()
+
+    async def _read_loop(self) -> None:
+        try:
+            while line := await self._reader.readline():
+                response = json.loads(line)
+                future = self._pending.pop(response.get("id"), None)
+                if future is not None and not future.done():
+                    future.set_result(response)
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Connection closed"))
+
+
+class LoadGenerator:
+    def __init__(self, connections: List[LoadConnection], mix: List[Tuple[str, float]], seed: int = 0):
+        self._connections = connections
+        self._names = [name for name, _ in mix]
+        total = sum(weight for _, weight in mix)
+        self._cumulative = [sum(weight for _, weight in mix[:i + 1]) / total for i in range(len(mix))]
+        self._random = random.Random(seed)
+        self.histogram = LatencyHistogram()
+        self.per_request: Dict[str, LatencyHistogram] = {name: LatencyHistogram() for name in self._names}
+        self.errors = 0
+        self.sent = 0
+
+    def _pick(self) -> str:
+        return self._names[bisect.bisect_left(self._cumulative, self._random.random())]
+
+    async def _send(self, connection: LoadConnection, scheduled: float) -> None:
+        name = self._pick()
+        method, params = REQUESTS[name]
+        self.sent += 1
+        try:
+            response = await connection.request(method, params)
+            failed = "error" in response or response.get("result", {}).get("isError", False)
+        except Exception:
+            failed = True
+        # Measured from the scheduled send time so a stalled server can't hide queueing delay
+        latency = time.perf_counter() - scheduled
+        self.histogram.record(latency)
+        self.per_request[name].record(latency)
+        self.errors += failed
+
+    async def run_open_loop(self, rate: float, duration: float) -> None:
+        """Send at a fixed total rate regardless of response times"""
+        tasks = set()
+        start = time.perf_counter()
+        interval = 1.0 / rate
+        for index in range(int(rate * duration)):
+            scheduled = start + index * interval
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            connection = self._connections[index % len(self._connections)]
+            task = asyncio.create_task(self._send(connection, scheduled))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.wait(tasks)
+
+    async def run_closed_loop(self, in_flight: int, duration: float) -> None:
+        """Keep a fixed number of requests outstanding on every connection"""
+        deadline = time.perf_counter() + duration
+
+        async def worker(connection: LoadConnection) -> None:
+            while time.perf_counter() < deadline:
+                await self._send(connection, time.perf_counter())
+
+        await asyncio.gather(*(worker(c) for c in self._connections for _ in range(in_flight)))
+
+
+async def start_local_server(latency: float, entities: int, seed: int, replay: Optional[str] = None, replay_speed: str = "recorded"):
+    """Start an in-process MCP TCP server backed by a simulated or replayed Home Assistant"""
+    os.environ.setdefault("HOMEASSISTANT_TOKEN", "loadgen")
+    os.environ.setdefault("HOMEASSISTANT_BASE_URL", "http://homeassistant.loadgen")
+    from home_assistant_mcp.server import HomeAssistantMcpServer
+    from home_assistant_mcp.simulator import HomeAssistantSimulator
+    from home_assistant_mcp.recording import TrafficReplay
+    from home_assistant_mcp.tcp import TcpTransport
+
+    if replay is not None:
+        http_transport = TrafficReplay(replay, replay_speed).http_transport()
+    else:
+        http_transport = HomeAssistantSimulator(entities=entities, seed=seed, latency=latency).http_transport()
+    ha_server = HomeAssistantMcpServer(http_transport=http_transport)
+    await ha_server.warm_up()
+    transport = TcpTransport(ha_server, port=0)
+    await transport.start()
+    return ha_server, transport
+
+
+async def read_metrics(connection: LoadConnection) -> Optional[Dict[str, float]]:
+    """The server's ha://metrics, or None if it doesn't offer them"""
+    response = await connection.request("resources/read", {"uri": "ha://metrics"})
+    if "error" in response:
+        return None
+    return json.loads(response["result"]["contents"][0]["text"])
+
+
+def server_usage(before: Optional[Dict[str, float]], after: Optional[Dict[str, float]], elapsed: float, local: bool) -> Optional[Dict[str, Any]]:
+    if not before or not after or "process.cpu_seconds" not in after:
+        return None
+    cpu = after["process.cpu_seconds"] - before["process.cpu_seconds"]
+    return {
+        "cpu_seconds": round(cpu, 3),
+        "cpu_percent": round(cpu / elapsed * 100, 1),
+        "max_rss_mb": after.get("process.max_rss_mb"),
+        # An in-process server is measured together with the load generator
+        "includes_load_generator": local
+    }
+
+
+def parse_mix(value: str) -> List[Tuple[str, float]]:
+    mix = []
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        if name not in REQUESTS:
+            raise SystemExit(f"Unknown request {name}; choose from {', '.join(REQUESTS)}")
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+def report(generator: LoadGenerator, elapsed: float, usage: Optional[Dict[str, float]]) -> Dict[str, Any]:
+    def summary(histogram: LatencyHistogram) -> Dict[str, float]:
+        return {
+            "count": histogram.count,
+            **{f"p{p:g}_ms": round(histogram.percentile(p) * 1000, 3) for p in (50, 90, 99, 99.9)},
+            "max_ms": round(histogram.max * 1000, 3)
+        }
+
+    return {
+        "requests": generator.sent,
+        "throughput_rps": round(generator.histogram.count / elapsed, 1),
+        "error_rate": round(generator.errors / max(generator.histogram.count, 1), 4),
+        "latency": summary(generator.histogram),
+        "per_request": {name: summary(h) for name, h in generator.per_request.items() if h.count},
+        "server": usage
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8888)
+    parser.add_argument("--local", action="store_true", help="start an in-process server with a simulated Home Assistant")
+    parser.add_argument("--ha-latency", type=float, default=0.005, help="mean simulated Home Assistant latency in seconds")
+    parser.add_argument("--ha-entities", type=int, default=1000, help="synthetic entities in the simulated Home Assistant")
+    parser.add_argument("--replay", help="with --local, answer from a recording of Home Assistant traffic")
+    parser.add_argument("--replay-speed", choices=["recorded", "fast"], default="recorded")
+    parser.add_argument("--connections", type=int, default=10)
+    parser.add_argument("--rate", type=float, default=100, help="total requests per second (open loop)")
+    parser.add_argument("--closed-loop", action="store_true", help="send as fast as responses arrive")
+    parser.add_argument("--in-flight", type=int, default=1, help="outstanding requests per connection (closed loop)")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="weighted requests, e.g. lock-lock=3,tools/list=1")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    ha_server = transport = None
+    host, port = args.host, args.port
+    if args.local:
+        ha_server, transport = await start_local_server(args.ha_latency, args.ha_entities, args.seed, args.replay, args.replay_speed)
+        host, port = transport.host, transport.port
+
+    connections = await asyncio.gather(*(LoadConnection.open(host, port) for _ in range(args.connections)))
+    for connection in connections:
+        await connection.request("initialize", {})
+    generator = LoadGenerator(list(connections), parse_mix(args.mix), args.seed)
+
+    metrics_before = await read_metrics(connections[0])
+    start = time.perf_counter()
+    if args.closed_loop:
+        await generator.run_closed_loop(args.in_flight, args.duration)
+    else:
+        await generator.run_open_loop(args.rate, args.duration)
+    elapsed = time.perf_counter() - start
+    metrics_after = await read_metrics(connections[0])
+
+    usage = server_usage(metrics_before, metrics_after, elapsed, args.local)
+    if usage is not None and transport is not None:
+        usage["connections"] = transport.connection_count
+
+    print(json.dumps(report(generator, elapsed, usage), indent=2))
+    await asyncio.gather(*(connection.close() for connection in connections))
+    if transport is not None:
+        await transport.close()
+        await ha_server.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
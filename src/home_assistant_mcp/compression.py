@@ -0,0 +1,92 @@
+from typing import Callable, Dict, Iterable, Optional, Tuple
+import base64
+import gzip
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Capability a TCP client sends under capabilities.experimental to receive compressed messages
+COMPRESSION_CAPABILITY = "homeassistant/compression"
+# Method of the JSON-RPC envelope that carries a compressed message
+COMPRESSED_METHOD = "homeassistant/compressed"
+# A compressed message must save at least this share of the bytes to be sent compressed
+MIN_SAVING = 0.1
+
+# Preferred first; brotli compresses JSON better but is an optional dependency
+CODECS: Dict[str, Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]] = {}
+if brotli is not None:
+    CODECS["br"] = (lambda data: brotli.compress(data, quality=5), brotli.decompress)
+CODECS["gzip"] = (lambda data: gzip.compress(data, compresslevel=5), gzip.decompress)
+CODECS["deflate"] = (lambda data: zlib.compress(data, 5), zlib.decompress)
+ZLIB_WBITS = {"gzip": 31, "deflate": 15}
+
+
+def accept_encoding(enabled: bool = True) -> str:
+    """Accept-Encoding for requests to Home Assistant, limited to what httpx can decode here"""
+    if not enabled:
+        return "identity"
+    return ", ".join(CODECS)
+
+
+def negotiate(offered: Iterable[str]) -> Optional[str]:
+    """The first encoding the peer offers that is available here"""
+    for encoding in offered:
+        if encoding in CODECS:
+            return encoding
+    return None
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    return CODECS[encoding][0](data)
+
+
+def decompress(data: bytes, encoding: str, max_bytes: Optional[int] = None) -> bytes:
+    """Decompress, refusing output beyond max_bytes without producing more than that"""
+    if encoding not in CODECS:
+        raise ValueError(f"Unsupported encoding {encoding}")
+    if max_bytes is None:
+        result = CODECS[encoding][1](data)
+    elif encoding == "br":
+        result = _brotli_decompress(data, max_bytes + 1)
+    else:
+        result = zlib.decompressobj(ZLIB_WBITS[encoding]).decompress(data, max_bytes + 1)
+    if max_bytes is not None and len(result) > max_bytes:
+        raise ValueError(f"Decompressed message exceeds {max_bytes} bytes")
+    return result
+
+
+def _brotli_decompress(data: bytes, limit: int) -> bytes:
+    """Brotli output up to about limit bytes; complete if shorter than that"""
+    try:
+        return brotli.Decompressor().process(data, output_buffer_limit=limit)
+    except TypeError:
+        # brotli before 1.2 can't stop early, so it could be made to inflate without bound
+        raise ValueError("Brotli messages need brotli 1.2 or later here to limit their size") from None
+
+
+def envelope(data: bytes, encoding: str, min_bytes: int) -> Optional[bytes]:
+    """A serialized JSON-RPC message as a compressed envelope, or None if that doesn't pay off
+
+    Messages under min_bytes are not worth the CPU time; the envelope is
+    also skipped when compression saves less than MIN_SAVING, as for short
+    or already dense payloads.
+    """
+    if len(data) < min_bytes:
+        return None
+    encoded = base64.b64encode(compress(data, encoding))
+    wrapped = b'{"jsonrpc":"2.0","method":"' + COMPRESSED_METHOD.encode() + b'","params":{"encoding":"' \
+        + encoding.encode() + b'","data":"' + encoded + b'"}}'
+    if len(wrapped) > len(data) * (1 - MIN_SAVING):
+        return None
+    return wrapped
+
+
+def open_envelope(params: dict, max_bytes: Optional[int] = None) -> bytes:
+    """The serialized message inside a compressed envelope"""
+    return decompress(base64.b64decode(params["data"]), params["encoding"], max_bytes)
@@ -0,0 +1,178 @@
+from typing import Any, Callable, Dict, Optional
+import asyncio
+import json
+
+import httpx
+from websockets.asyncio.client import connect, ClientConnection
+from websockets.exceptions import ConnectionClosed
+
+from .state import StateCache
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class CommandNotSentError(ConnectionError):
+    """A command never reached Home Assistant, so it is safe to retry elsewhere"""
+
+
+class CommandError(httpx.HTTPError):
+    """Home Assistant answered a command with an error
+
+    An httpx.HTTPError, so callers handle it like a failed REST request.
+    """
+
+    def __init__(self, code: Optional[str], message: Optional[str]):
+        super().__init__(f"{code}: {message}")
+        self.code = code
+
+
+class HomeAssistantEventStream:
+    """Persistent connection to the Home Assistant WebSocket API
+
+    Subscribes to `state_changed` events, loads a full state snapshot after every
+    (re)connect and keeps the given StateCache in sync. Commands are multiplexed
+    over the single connection and correlated by message id.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        token: str,
+        state_cache: StateCache,
+        reconnect_delay: float = 1.0,
+        max_reconnect_delay: float = 30.0,
+        connect_websocket: Callable = connect
+    ):
+        self._url = base_url.rstrip("/").replace("http", "ws", 1) + "/api/websocket"
+        self._token = token
+        self._state_cache = state_cache
+        self._reconnect_delay = reconnect_delay
+        self._max_reconnect_delay = max_reconnect_delay
+        # websockets connect(), or a stand-in that records or replays traffic
+        self._connect_websocket = connect_websocket
+        self._ws: Optional[ClientConnection] = None
+        self._next_id = 1
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._subscription_id: Optional[int] = None
+        # Events received while the snapshot is loading are replayed on top of it
+        self._backlog: Optional[list] = None
+        self._task: Optional[asyncio.Task] = None
+        self.connected = asyncio.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        """Start the background connection task"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Stop the background connection task"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run(self) -> None:
+        """Connect and keep reconnecting with exponential backoff"""
+        delay = self._reconnect_delay
+        while True:
+            try:
+                await self._connect_once()
+                delay = self._reconnect_delay
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Event stream disconnected: {e}; reconnecting in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self._max_reconnect_delay)
+
+    async def send_command(self, message: Dict[str, Any]) -> Any:
+        """Send a command over the connection and wait for its result
+
+        Raises CommandNotSentError if there is no connection or sending fails,
+        ConnectionError if the connection closes before the result arrives and
+        CommandError if Home Assistant answers with an error.
+        """
+        if self._ws is None:
+            raise CommandNotSentError("Home Assistant WebSocket is not connected")
+        message_id = self._next_id
+        self._next_id += 1
+        future = asyncio.get_running_loop().create_future()
+        self._pending[message_id] = future
+        try:
+            try:
+                await self._ws.send(json.dumps({**message, "id": message_id}))
+            except ConnectionClosed as e:
+                raise CommandNotSentError(f"Home Assistant WebSocket closed: {e}") from e
+            return await future
+        finally:
+            self._pending.pop(message_id, None)
+
+    async def _connect_once(self) -> None:
+        async with self._connect_websocket(self._url, max_size=None) as ws:
+            await self._authenticate(ws)
+            self._ws = ws
+            reader = asyncio.create_task(self._read_loop(ws))
+            try:
+                self._backlog = []
+                self._subscription_id = self._next_id
+                await self.send_command({"type": "subscribe_events", "event_type": "state_changed"})
+                states = await self.send_command({"type": "get_states"})
+                self._state_cache.replace_all(states)
+                backlog, self._backlog = self._backlog, None
+                for data in backlog:
+                    self._state_cache.set(data["entity_id"], data.get("new_state"))
+                self._state_cache.live = True
+                self.connected.set()
+                logger.info(f"Event stream connected, {len(states)} entities synced")
+                await reader
+            finally:
+                reader.cancel()
+                self._ws = None
+                self._subscription_id = None
+                self._backlog = None
+                self._state_cache.live = False
+                self.connected.clear()
+                for future in self._pending.values():
+                    if not future.done():
+                        future.set_exception(ConnectionError("Home Assistant WebSocket closed"))
+
+    async def _authenticate(self, ws: ClientConnection) -> None:
+        message = json.loads(await ws.recv())
+        if message.get("type") != "auth_required":
+            raise ConnectionError(f"Unexpected handshake message: {message.get('type')}")
+        await ws.send(json.dumps({"type": "auth", "access_token": self._token}))
+        message = json.loads(await ws.recv())
+        if message.get("type") != "auth_ok":
+            raise ConnectionError(f"Authentication failed: {message.get('message', message.get('type'))}")
+
+    async def _read_loop(self, ws: ClientConnection) -> None:
+        async for raw in ws:
+            payload = json.loads(raw)
+            # HA may coalesce several messages into one JSON array
+            for message in payload if isinstance(payload, list) else (payload,):
+                self._dispatch(message)
+
+    def _dispatch(self, message: dict) -> None:
+        if message.get("type") == "event" and message.get("id") == self._subscription_id:
+            data = message["event"]["data"]
+            if self._backlog is not None:
+                self._backlog.append(data)
+                return
+            self._state_cache.set(data["entity_id"], data.get("new_state"))
+        elif message.get("type") == "result":
+            future = self._pending.get(message.get("id"))
+            if future is None or future.done():
+                return
+            if message.get("success"):
+                future.set_result(message.get("result"))
+            else:
+                error = message.get("error") or {}
+                future.set_exception(CommandError(error.get("code"), error.get("message")))
@@ -0,0 +1,131 @@
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional, TextIO
+import io
+import logging
+import queue
+import random
+import sys
+import time
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+def _match(name: str, settings: Dict[str, float]) -> Optional[str]:
+    """Find the most specific logger prefix of name that has a setting"""
+    while True:
+        if name in settings:
+            return name
+        if "." not in name:
+            return "" if "" in settings else None
+        name = name.rsplit(".", 1)[0]
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of records below WARNING, per logger prefix"""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self._rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        prefix = _match(record.name, self._rates)
+        return prefix is None or random.random() < self._rates[prefix]
+
+
+class RateLimitFilter(logging.Filter):
+    """Cap records below ERROR at a number per second, per logger prefix"""
+
+    def __init__(self, limits: Dict[str, float]):
+        super().__init__()
+        self._limits = limits
+        # logger prefix -> (tokens, last refill)
+        self._buckets: Dict[str, tuple[float, float]] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.ERROR:
+            return True
+        prefix = _match(record.name, self._limits)
+        if prefix is None:
+            return True
+        limit = self._limits[prefix]
+        now = time.monotonic()
+        tokens, last = self._buckets.get(prefix, (limit, now))
+        tokens = min(limit, tokens + (now - last) * limit)
+        if tokens < 1:
+            self._buckets[prefix] = (tokens, now)
+            return False
+        self._buckets[prefix] = (tokens - 1, now)
+        return True
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """Queue records untouched so formatting happens on the listener thread"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class StdoutGuard(io.TextIOBase):
+    """Stand-in for sys.stdout that reroutes stray writes to the log
+
+    Over the stdio transport stdout carries the MCP protocol, so a single
+    print() would corrupt the stream.
+    """
+
+    def __init__(self, original: TextIO):
+        # Keep the replaced stream alive; collecting it would close the shared buffer
+        self.original = original
+        self._logger = logging.getLogger("stdout")
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        if text.strip():
+            self._logger.warning(f"Intercepted write to stdout: {text.rstrip()}")
+        return len(text)
+
+
+def protect_stdout() -> TextIO:
+    """Replace sys.stdout with a guard and return a stream to the real stdout
+
+    The returned stream is reserved for the MCP transport.
+    """
+    original = sys.stdout.original if isinstance(sys.stdout, StdoutGuard) else sys.stdout
+    original.flush()
+    sys.stdout = StdoutGuard(original)
+    return io.TextIOWrapper(original.buffer, encoding="utf-8")
+
+
+def configure_logging(
+    level: int | str = logging.INFO,
+    sample_rates: Dict[str, float] | None = None,
+    rate_limits: Dict[str, float] | None = None,
+    stream: TextIO | None = None
+) -> QueueListener:
+    """Route all logging through a queue drained by a background thread
+
+    Filtering happens on the calling thread, before anything is queued;
+    formatting and writing to stderr happen on the listener thread. Returns the
+    started listener, which must be stopped to flush pending records.
+    """
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    records: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    queue_handler = _DeferredQueueHandler(records)
+    if sample_rates:
+        queue_handler.addFilter(SamplingFilter(sample_rates))
+    if rate_limits:
+        queue_handler.addFilter(RateLimitFilter(rate_limits))
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = QueueListener(records, handler, respect_handler_level=True)
+    listener.start()
+    return listener
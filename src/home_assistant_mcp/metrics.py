@@ -0,0 +1,57 @@
+from typing import Any, Callable, Dict, Tuple
+import weakref
+
+
+class Counter:
+    """A monotonically increasing count"""
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: int = 1) -> None:
+        self.value += amount
+
+
+class Metrics:
+    """Process-wide counters and gauges
+
+    Counters are created on first use and incremented in place. Gauges are
+    callables evaluated only when a snapshot is taken, so exposing a derived
+    value (a hit rate, a queue length) costs nothing on the hot path. A gauge
+    reads an attribute of its owner and holds the owner weakly: registering
+    one doesn't keep the owner alive, and the gauge goes away with it.
+    """
+
+    def __init__(self):
+        self._counters: Dict[str, Counter] = {}
+        self._gauges: Dict[str, Tuple[weakref.ref, Callable[[Any], float]]] = {}
+
+    def counter(self, name: str) -> Counter:
+        counter = self._counters.get(name)
+        if counter is None:
+            counter = self._counters[name] = Counter()
+        return counter
+
+    def gauge(self, name: str, owner: Any, read: Callable[[Any], float]) -> None:
+        """Register (or replace) a value computed at snapshot time as read(owner)"""
+        self._gauges[name] = (weakref.ref(owner), read)
+
+    def snapshot(self) -> Dict[str, float]:
+        values: Dict[str, float] = {name: counter.value for name, counter in self._counters.items()}
+        for name, (owner, read) in list(self._gauges.items()):
+            instance = owner()
+            if instance is None:
+                del self._gauges[name]
+            else:
+                values[name] = read(instance)
+        return dict(sorted(values.items()))
+
+    def reset(self) -> None:
+        """Forget every counter and gauge"""
+        self._counters.clear()
+        self._gauges.clear()
+
+
+# Process-wide registry, exposed as the ha://metrics resource
+metrics = Metrics()
@@ -0,0 +1,141 @@
+from typing import Awaitable, Callable, Dict, List, Optional
+import asyncio
+import time
+
+from .metrics import metrics
+from .state import StateCache
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class StatePoller:
+    """Keep a StateCache in sync by polling /api/states
+
+    A fallback for deployments where the WebSocket API is unreachable. Each
+    snapshot is diffed against the previous one by `last_updated`, and only
+    changed, added and removed entities are written to the cache, so listeners
+    see the same change events as with the event stream. Polling runs at
+    min_interval while tool calls keep arriving and backs off to max_interval
+    once they stop for active_window seconds. The first call after an idle
+    period marks the cache stale until a fresh snapshot lands, so it never
+    reads a state that is up to max_interval old.
+
+    While paused() is true (the event stream is connected) nothing is polled.
+    """
+
+    def __init__(
+        self,
+        fetch_states: Callable[[], Awaitable[List[dict]]],
+        state_cache: StateCache,
+        min_interval: float = 1.0,
+        max_interval: float = 30.0,
+        active_window: float = 60.0,
+        paused: Callable[[], bool] = lambda: False
+    ):
+        self._fetch_states = fetch_states
+        self._state_cache = state_cache
+        self._min_interval = min_interval
+        self._max_interval = max_interval
+        self._active_window = active_window
+        self._paused = paused
+        self._previous: Dict[str, Optional[str]] = {}
+        self._last_activity = 0.0
+        self._last_poll = 0.0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.interval = min_interval
+        self.synced = asyncio.Event()
+        self._polls = metrics.counter("poller.polls")
+        self._changes = metrics.counter("poller.changes")
+        self._failures = metrics.counter("poller.failures")
+        metrics.gauge("poller.interval", self, lambda poller: poller.interval)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        if not self.running:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def touch(self) -> None:
+        """Record client activity: poll at the fast rate, right away if the cache is behind"""
+        now = time.monotonic()
+        self._last_activity = now
+        if self.interval > self._min_interval:
+            self.interval = self._min_interval
+            if self.synced.is_set() and now - self._last_poll > self._min_interval:
+                self._state_cache.live = False
+            self._wakeup.set()
+
+    async def run(self) -> None:
+        while True:
+            if self._paused():
+                # The event stream owns the cache; resync from scratch once it drops
+                self._previous = {}
+                self.synced.clear()
+                self.interval = self._min_interval
+            else:
+                await self.poll()
+                self.interval = self._next_interval()
+            # Not wait_for: it can swallow a cancel that races with touch()
+            wakeup = asyncio.ensure_future(self._wakeup.wait())
+            try:
+                await asyncio.wait([wakeup], timeout=self.interval)
+            finally:
+                wakeup.cancel()
+            self._wakeup.clear()
+
+    async def poll(self) -> None:
+        """Fetch a snapshot and apply what changed since the previous one"""
+        try:
+            states = await self._fetch_states()
+            if not isinstance(states, list):
+                raise ValueError(f"unexpected response {states!r:.100}")
+        except Exception as e:
+            self._failures.inc()
+            if self.synced.is_set():
+                logger.warning(f"Polling states failed: {e}")
+            self.synced.clear()
+            if not self._paused():
+                self._state_cache.live = False
+            return
+        if self._paused():
+            return
+        self._polls.inc()
+        self._last_poll = time.monotonic()
+        current = {state["entity_id"]: state.get("last_updated") for state in states}
+        if not self._previous:
+            self._state_cache.replace_all(states)
+            changes = len(states)
+        else:
+            changes = 0
+            for state in states:
+                entity_id = state["entity_id"]
+                if self._previous.get(entity_id, ...) != current[entity_id]:
+                    self._state_cache.set(entity_id, state)
+                    changes += 1
+            for entity_id in self._previous.keys() - current.keys():
+                self._state_cache.set(entity_id, None)
+                changes += 1
+        self._previous = current
+        self._changes.inc(changes)
+        if not self.synced.is_set():
+            logger.info(f"Polling states every {self._min_interval:g}-{self._max_interval:g}s, {len(states)} entities synced")
+        self._state_cache.live = True
+        self.synced.set()
+
+    def _next_interval(self) -> float:
+        if time.monotonic() - self._last_activity < self._active_window:
+            return self._min_interval
+        return min(self.interval * 2, self._max_interval)
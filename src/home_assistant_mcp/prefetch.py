@@ -0,0 +1,170 @@
+from collections import Counter as Tally, OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+import asyncio
+import json
+import time
+
+from .cache import TTLCache
+from .metrics import metrics
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Entities whose next access, and whose area, we keep track of
+MAX_TRACKED_ENTITIES = 1024
+# Seconds before the entities sharing an area with an entity are looked up again
+AREA_TTL_SECONDS = 3600.0
+# A successor must have followed an entity this often, and this share of the time, to be prefetched
+MIN_TRANSITIONS = 2
+MIN_TRANSITION_SHARE = 0.2
+
+AREA_ENTITIES_TEMPLATE = (
+    "{% set area = area_id(entity_id) %}"
+    "{{ (area_entities(area) if area else []) | tojson }}"
+)
+
+
+class Prefetcher:
+    """Warm entity states an agent is likely to read next
+
+    Every entity a tool call touches is recorded. Entities that often followed
+    it before, and entities in the same area, are then fetched in the
+    background into a short-lived cache which answers the next read of each
+    entity once. Upstream requests made for prefetching, including area
+    lookups, are capped by a token bucket of `budget` requests per minute.
+    """
+
+    def __init__(
+        self,
+        fetch_state: Callable[[str], Awaitable[dict]],
+        render_template: Callable[[str, dict], Awaitable[str]],
+        budget: float = 30.0,
+        ttl: float = 2.0,
+        max_related: int = 4
+    ):
+        self._fetch_state = fetch_state
+        self._render_template = render_template
+        self._budget = budget
+        self._tokens = budget
+        self._refilled_at = time.monotonic()
+        self._max_related = max_related
+        self._warm: TTLCache[str, dict] = TTLCache(max_entries=max_related * 64, ttl=ttl)
+        # Entities predicted to be read next; only their reads count as hits or misses
+        self._predicted: TTLCache[str, bool] = TTLCache(max_entries=max_related * 64, ttl=ttl)
+        self._successors: "OrderedDict[str, Tally]" = OrderedDict()
+        self._areas: TTLCache[str, List[str]] = TTLCache(max_entries=MAX_TRACKED_ENTITIES, ttl=AREA_TTL_SECONDS)
+        self._previous: Dict[int, str] = {}
+        # Entities being fetched, with how often they were invalidated meanwhile
+        self._inflight: Dict[str, int] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._requests = metrics.counter("prefetch.requests")
+        self._hits = metrics.counter("prefetch.hits")
+        self._misses = metrics.counter("prefetch.misses")
+        self._skipped = metrics.counter("prefetch.skipped_budget")
+        metrics.gauge("prefetch.hit_rate", self, Prefetcher.hit_rate)
+
+    def hit_rate(self) -> float:
+        reads = self._hits.value + self._misses.value
+        return round(self._hits.value / reads, 4) if reads else 0.0
+
+    def take(self, entity_id: str) -> Optional[dict]:
+        """Return a prefetched state, consuming it"""
+        predicted = self._predicted.get(entity_id, count=False)
+        self._predicted.pop(entity_id)
+        state = self._warm.get(entity_id, count=False)
+        if state is None:
+            if predicted:
+                self._misses.inc()
+            return None
+        self._warm.pop(entity_id)
+        self._hits.inc()
+        return state
+
+    def invalidate(self, entity_id: str) -> None:
+        """Drop a prefetched state that a command is about to change"""
+        self._warm.pop(entity_id)
+        if entity_id in self._inflight:
+            self._inflight[entity_id] += 1
+
+    def observe(self, entity_id: str, session=None) -> None:
+        """Record an access and start prefetching what usually comes next"""
+        previous = self._previous.get(id(session))
+        self._previous[id(session)] = entity_id
+        if previous is not None and previous != entity_id:
+            self._record(previous, entity_id)
+        task = asyncio.get_running_loop().create_task(self._prefetch(entity_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def remove_session(self, session) -> None:
+        self._previous.pop(id(session), None)
+
+    async def stop(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.wait(self._tasks)
+
+    def related(self, entity_id: str) -> List[str]:
+        """Entities to prefetch after an access, most likely first"""
+        candidates: List[str] = []
+        tally = self._successors.get(entity_id)
+        if tally:
+            total = sum(tally.values())
+            candidates.extend(
+                successor for successor, count in tally.most_common()
+                if count >= MIN_TRANSITIONS and count / total >= MIN_TRANSITION_SHARE
+            )
+        domain = entity_id.split(".", 1)[0]
+        neighbors = [e for e in self._areas.get(entity_id, count=False) or () if e != entity_id]
+        # Same-domain neighbors first: the other lights of a room are likelier than its sensors
+        neighbors.sort(key=lambda e: e.split(".", 1)[0] != domain)
+        candidates.extend(neighbors)
+        return list(dict.fromkeys(candidates))[:self._max_related]
+
+    def _record(self, previous: str, entity_id: str) -> None:
+        tally = self._successors.get(previous)
+        if tally is None:
+            tally = self._successors[previous] = Tally()
+            if len(self._successors) > MAX_TRACKED_ENTITIES:
+                self._successors.popitem(last=False)
+        else:
+            self._successors.move_to_end(previous)
+        tally[entity_id] += 1
+
+    def _spend(self) -> bool:
+        now = time.monotonic()
+        self._tokens = min(self._budget, self._tokens + (now - self._refilled_at) * self._budget / 60)
+        self._refilled_at = now
+        if self._tokens < 1:
+            self._skipped.inc()
+            return False
+        self._tokens -= 1
+        return True
+
+    async def _prefetch(self, entity_id: str) -> None:
+        try:
+            if entity_id not in self._areas and self._spend():
+                self._requests.inc()
+                members = json.loads(await self._render_template(AREA_ENTITIES_TEMPLATE, {"entity_id": entity_id}))
+                for member in members:
+                    self._areas.set(member, members)
+                if entity_id not in self._areas:
+                    self._areas.set(entity_id, [])
+            for related in self.related(entity_id):
+                self._predicted.set(related, True)
+                if related in self._warm or related in self._inflight or not self._spend():
+                    continue
+                self._inflight[related] = 0
+                try:
+                    self._requests.inc()
+                    state = await self._fetch_state(related)
+                finally:
+                    invalidated = self._inflight.pop(related)
+                # A command sent while the request was in flight makes the result stale
+                if not invalidated:
+                    self._warm.set(related, state)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.debug(f"Prefetch after {entity_id} failed: {e}")
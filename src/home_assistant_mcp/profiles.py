@@ -0,0 +1,245 @@
+from fnmatch import fnmatchcase
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from mcp.types import Tool
+
+from .cache import TTLCache
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Key of the profile in the client's initialize capabilities.experimental
+PROFILE_CAPABILITY = "homeassistant/toolProfile"
+SCOPE_TOOL = "set_tool_scope"
+# Seconds before areas whose entities could not be resolved are tried again
+AREA_RETRY_SECONDS = 30.0
+
+
+class ToolProfile:
+    """The part of the tool catalog a session sees
+
+    Each filter is optional: `domains` keeps domain tools of those domains,
+    `areas` keeps domain tools of domains with an entity in those areas, and
+    `tools` keeps tools whose name matches one of the (fnmatch) patterns.
+    Server-level tools are only filtered by `tools`.
+    """
+
+    def __init__(
+        self,
+        domains: Optional[List[str]] = None,
+        areas: Optional[List[str]] = None,
+        tools: Optional[List[str]] = None
+    ):
+        self.domains = frozenset(domains) if domains else None
+        self.areas = tuple(sorted(set(areas))) if areas else None
+        self.tools = tuple(tools) if tools else None
+
+    @classmethod
+    def from_settings(cls, settings: Dict[str, Any]) -> "ToolProfile":
+        """Build a profile from {"domains": [...], "areas": [...], "tools": [...]}"""
+        values = {}
+        for key in ("domains", "areas", "tools"):
+            value = settings.get(key)
+            if isinstance(value, str):
+                value = [item.strip() for item in value.split(",") if item.strip()]
+            if value is not None and not (isinstance(value, list) and all(isinstance(v, str) for v in value)):
+                raise ValueError(f"Tool profile {key} must be a list of strings")
+            values[key] = value
+        return cls(**values)
+
+    def allows(self, name: str, domain: Optional[str], area_domains: Optional[Set[str]]) -> bool:
+        if name == SCOPE_TOOL:
+            return True
+        if self.tools is not None and not any(fnmatchcase(name, pattern) for pattern in self.tools):
+            return False
+        if domain is None:
+            return True
+        if self.domains is not None and domain not in self.domains:
+            return False
+        return area_domains is None or domain in area_domains
+
+    def to_dict(self) -> Dict[str, Optional[List[str]]]:
+        return {
+            "domains": sorted(self.domains) if self.domains else None,
+            "areas": list(self.areas) if self.areas else None,
+            "tools": list(self.tools) if self.tools else None
+        }
+
+
+class _SessionScope:
+    def __init__(self, profile: ToolProfile):
+        self.profile = profile
+        self.tools: Optional[List[Tool]] = None
+        # Domains in the default and the session's areas that tools was filtered with
+        self.area_domains: Optional[Tuple[Optional[Set[str]], Optional[Set[str]]]] = None
+
+
+class ToolScopes:
+    """Per-session tool profiles and paginated tool listing
+
+    The default profile is the operator's and bounds every session: a profile
+    the client sends under `capabilities.experimental["homeassistant/toolProfile"]`
+    or sets with the scope tool can only narrow it further. Which domains have
+    entities in an area is looked up with a template and kept for area_ttl
+    seconds. If the lookup fails, a session's area filter is skipped until it is
+    retried, while the default profile's areas keep their last known domains, or
+    none: the default is a security bound and must not widen.
+    The visible catalog of a session is reused until its profile or the
+    domains in its areas change.
+    """
+
+    tools = {
+        SCOPE_TOOL: {
+            "name": SCOPE_TOOL,
+            "description": "Limit the tools offered in this session to some domains, areas or tool names. "
+                           "Omitted filters are removed; call with no arguments to see every tool the server offers.",
+            "schema": {
+                "type": "object",
+                "properties": {
+                    "domains": {"type": "array", "items": {"type": "string"}, "description": "e.g. [\"light\", \"lock\"]"},
+                    "areas": {"type": "array", "items": {"type": "string"}, "description": "Area names or IDs"},
+                    "tools": {"type": "array", "items": {"type": "string"}, "description": "Tool names, * wildcards allowed"}
+                }
+            }
+        }
+    }
+
+    def __init__(
+        self,
+        catalog: Callable[[], List[Tool]],
+        tool_domains: Dict[str, Optional[str]],
+        default: ToolProfile,
+        resolve_area_entities: Callable[[Tuple[str, ...]], Awaitable[List[str]]],
+        page_size: int = 0,
+        area_ttl: float = 300.0
+    ):
+        self._catalog = catalog
+        self._tool_domains = tool_domains
+        self._default = default
+        self._resolve_area_entities = resolve_area_entities
+        self._page_size = page_size
+        self._sessions: Dict[int, _SessionScope] = {}
+        self._area_domains: TTLCache[Tuple[str, ...], Set[str]] = TTLCache(max_entries=256, ttl=area_ttl)
+        self._area_failures: TTLCache[Tuple[str, ...], bool] = TTLCache(max_entries=256, ttl=AREA_RETRY_SECONDS)
+        # Domains last found in the default profile's areas, used while looking them up fails
+        self._default_area_domains: Set[str] = set()
+
+    async def warm(self) -> None:
+        """Resolve the default profile's areas so the first session does not wait for it"""
+        if self._default.areas:
+            await self._domains_in_areas(self._default.areas, default=True)
+
+    def open_session(self, session: Any, client_settings: Optional[Dict[str, Any]] = None) -> None:
+        """Set a session's profile from its initialization options"""
+        profile = ToolProfile.from_settings(client_settings) if client_settings else ToolProfile()
+        self._sessions[id(session)] = _SessionScope(profile)
+
+    def remove_session(self, session: Any) -> None:
+        self._sessions.pop(id(session), None)
+
+    def profile(self, session: Any) -> ToolProfile:
+        """The profile the session asked for; the default profile applies as well"""
+        return self._scope(session).profile
+
+    async def visible_tools(self, session: Any) -> List[Tool]:
+        """Tools both the default profile and the session's profile allow"""
+        scope = self._scope(session)
+        profile = scope.profile
+        area_domains = (
+            await self._domains_in_areas(self._default.areas, default=True),
+            await self._domains_in_areas(profile.areas)
+        )
+        if scope.tools is None or scope.area_domains != area_domains:
+            default_areas, session_areas = area_domains
+            scope.tools = [
+                tool for tool in self._catalog()
+                if self._default.allows(tool.name, self._tool_domains.get(tool.name), default_areas)
+                and profile.allows(tool.name, self._tool_domains.get(tool.name), session_areas)
+            ]
+            scope.area_domains = area_domains
+        return scope.tools
+
+    async def list_tools(
+        self,
+        session: Any,
+        cursor: Optional[str] = None,
+        paginate: bool = True
+    ) -> Tuple[List[Tool], Optional[str]]:
+        """One page of the session's tools and the cursor of the next page"""
+        tools = await self.visible_tools(session)
+        try:
+            start = int(cursor) if cursor else 0
+        except ValueError:
+            raise ValueError(f"Invalid cursor: {cursor}")
+        if start < 0:
+            raise ValueError(f"Invalid cursor: {cursor}")
+        if not (paginate and self._page_size):
+            return tools[start:], None
+        end = start + self._page_size
+        return tools[start:end], str(end) if end < len(tools) else None
+
+    async def is_visible(self, session: Any, name: str) -> bool:
+        return any(tool.name == name for tool in await self.visible_tools(session))
+
+    async def profile_allows(self, profile: Optional[ToolProfile], name: str) -> bool:
+        """Whether the default profile and a session profile (if any) allow a tool, e.g. one a session handed over"""
+        domain = self._tool_domains.get(name)
+        if not self._default.allows(name, domain, await self._domains_in_areas(self._default.areas, default=True)):
+            return False
+        return profile is None or profile.allows(name, domain, await self._domains_in_areas(profile.areas))
+
+    async def set_scope(self, session: Any, settings: Dict[str, Any]) -> bool:
+        """Replace a session's profile within the default one; returns whether its visible tools changed"""
+        profile = ToolProfile.from_settings(settings)
+        scope = self._scope(session)
+        before = [tool.name for tool in await self.visible_tools(session)]
+        scope.profile = profile
+        scope.tools = None
+        after = [tool.name for tool in await self.visible_tools(session)]
+        return before != after
+
+    def _scope(self, session: Any) -> _SessionScope:
+        scope = self._sessions.get(id(session))
+        if scope is None:
+            settings = None
+            client_params = getattr(session, "client_params", None)
+            if client_params is not None and client_params.capabilities.experimental:
+                settings = client_params.capabilities.experimental.get(PROFILE_CAPABILITY)
+            self.open_session(session, settings)
+            scope = self._sessions[id(session)]
+        return scope
+
+    def invalidate_areas(self) -> None:
+        """Look the areas up again on next use, e.g. after entities moved between areas"""
+        self._area_domains.clear()
+        self._area_failures.clear()
+
+    async def _domains_in_areas(self, areas: Optional[Tuple[str, ...]], default: bool = False) -> Optional[Set[str]]:
+        """Domains with an entity in the areas, or None to not filter by area
+
+        When the lookup fails, the default profile's areas (default=True) fail
+        closed with their last known domains; a session's areas are not filtered.
+        """
+        if not areas:
+            return None
+        if self._area_failures.get(areas, count=False):
+            return self._default_area_domains if default else None
+        domains = self._area_domains.get(areas, count=False)
+        if domains is None:
+            try:
+                entity_ids = await self._resolve_area_entities(areas)
+            except Exception as e:
+                if default:
+                    kept = ", ".join(sorted(self._default_area_domains)) or "none"
+                    logger.warning(f"Could not resolve entities of default areas {', '.join(areas)}, "
+                                   f"keeping their last known domains ({kept}): {e}")
+                else:
+                    logger.warning(f"Could not resolve entities of areas {', '.join(areas)}, filtering by domain only: {e}")
+                self._area_failures.set(areas, True)
+                return self._default_area_domains if default else None
+            domains = {entity_id.split(".", 1)[0] for entity_id in entity_ids}
+            self._area_domains.set(areas, domains)
+            logger.debug(f"Areas {', '.join(areas)} contain domains {', '.join(sorted(domains))}")
+        if default:
+            self._default_area_domains = domains
+        return domains
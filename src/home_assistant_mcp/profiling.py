@@ -0,0 +1,235 @@
+from collections import Counter as StackCounter, deque
+from types import CodeType, FrameType
+from typing import Any, Awaitable, Deque, Dict, Generator, List, Optional
+import asyncio
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+from .metrics import metrics
+
+import logging
+logger = logging.getLogger(__name__)
+
+MAX_SLOW_CALLBACKS = 100
+MAX_STACK_DEPTH = 64
+
+
+class _ToolStats:
+    __slots__ = ("calls", "wall", "wall_max", "cpu", "cpu_max")
+
+    def __init__(self):
+        self.calls = 0
+        self.wall = 0.0
+        self.wall_max = 0.0
+        self.cpu = 0.0
+        self.cpu_max = 0.0
+
+    def add(self, wall: float, cpu: float) -> None:
+        self.calls += 1
+        self.wall += wall
+        self.wall_max = max(self.wall_max, wall)
+        self.cpu += cpu
+        self.cpu_max = max(self.cpu_max, cpu)
+
+    def to_dict(self) -> Dict[str, float]:
+        return {
+            "calls": self.calls,
+            "wall_ms_total": round(self.wall * 1000, 3),
+            "wall_ms_max": round(self.wall_max * 1000, 3),
+            "cpu_ms_total": round(self.cpu * 1000, 3),
+            "cpu_ms_max": round(self.cpu_max * 1000, 3)
+        }
+
+
+class _Measured:
+    """Awaitable that runs a coroutine and adds up the CPU time of each of its steps"""
+
+    def __init__(self, profiler: "Profiler", tool: str, coro: Awaitable[Any]):
+        self._profiler = profiler
+        self._tool = tool
+        self._coro = coro
+        self.cpu = 0.0
+
+    def __await__(self) -> Generator[Any, Any, Any]:
+        coro = self._coro.__await__()
+        profiler = self._profiler
+        value: Any = None
+        error: Optional[BaseException] = None
+        while True:
+            outer = profiler._running_tool
+            profiler._running_tool = self._tool
+            started = time.thread_time()
+            try:
+                yielded = coro.throw(error) if error is not None else coro.send(value)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                self.cpu += time.thread_time() - started
+                profiler._running_tool = outer
+            try:
+                value, error = (yield yielded), None
+            except BaseException as e:
+                value, error = None, e
+
+
+class Profiler:
+    """Opt-in sampling profiler for the event loop thread
+
+    While running, a background thread samples the event loop thread's stack
+    at a fixed interval and counts the samples as folded stacks (the input of
+    flamegraph.pl and speedscope), labelled with the tool being executed.
+    Idle samples, i.e. the loop waiting in select(), are not kept. A
+    heartbeat task on the loop lets the same thread detect callbacks that
+    block the loop for longer than the slow callback threshold and record
+    the stack that was running. A sampled fraction of tool calls is timed
+    for wall and CPU time; CPU time counts only the steps of that call, not
+    other tasks interleaved with it.
+    """
+
+    def __init__(self):
+        self.running = False
+        self.sample_rate = 1.0
+        self.interval = 0.01
+        self.slow_callback = 0.1
+        self._running_tool: Optional[str] = None
+        self._stacks: StackCounter = StackCounter()
+        self._tools: Dict[str, _ToolStats] = {}
+        self._slow: Deque[Dict[str, Any]] = deque(maxlen=MAX_SLOW_CALLBACKS)
+        self._labels: Dict[CodeType, str] = {}
+        self._idle_samples = 0
+        self._started = 0.0
+        self._beat = 0.0
+        self._loop_thread: Optional[int] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._slow_counter = metrics.counter("profiler.slow_callbacks")
+
+    def start(self, sample_rate: float = 1.0, interval: float = 0.01, slow_callback: float = 0.1) -> None:
+        """Start profiling the running event loop, discarding earlier samples"""
+        if self.running:
+            return
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.slow_callback = slow_callback
+        self.reset()
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._started = time.time()
+        self._stop.clear()
+        self._heartbeat = asyncio.get_running_loop().create_task(self._run_heartbeat())
+        self._thread = threading.Thread(target=self._sample, name="profiler", daemon=True)
+        self._thread.start()
+        self.running = True
+        logger.info(f"Profiling every {interval * 1000:.0f} ms, {sample_rate:.0%} of tool calls timed")
+
+    async def stop(self) -> None:
+        """Stop sampling; collected samples are kept until the next start"""
+        if not self.running:
+            return
+        self.running = False
+        self._stop.set()
+        self._heartbeat.cancel()
+        await asyncio.gather(self._heartbeat, return_exceptions=True)
+        await asyncio.to_thread(self._thread.join)
+        self._heartbeat = self._thread = None
+
+    def reset(self) -> None:
+        self._stacks.clear()
+        self._tools.clear()
+        self._slow.clear()
+        self._idle_samples = 0
+
+    async def measure(self, tool: str, coro: Awaitable[Any]) -> Any:
+        """Await a tool call, timing it if profiling is running and the call is sampled"""
+        if not self.running or random.random() >= self.sample_rate:
+            return await coro
+        measured = _Measured(self, tool, coro)
+        started = time.perf_counter()
+        try:
+            return await measured
+        finally:
+            stats = self._tools.get(tool)
+            if stats is None:
+                stats = self._tools[tool] = _ToolStats()
+            stats.add(time.perf_counter() - started, measured.cpu)
+
+    def summary(self) -> Dict[str, Any]:
+        """Per-tool timings, sample counts and the slowest callbacks seen"""
+        return {
+            "running": self.running,
+            "started": self._started,
+            "samples": sum(self._stacks.values()),
+            "idle_samples": self._idle_samples,
+            "tools": {tool: stats.to_dict() for tool, stats in sorted(self._tools.items())},
+            "slow_callbacks": sorted(self._slow, key=lambda s: s["duration_ms"], reverse=True)
+        }
+
+    def dump(self, directory: str) -> Dict[str, str]:
+        """Write the folded stacks and the summary to a directory (blocking)"""
+        os.makedirs(directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        stacks_path = os.path.join(directory, f"stacks-{stamp}.folded")
+        summary_path = os.path.join(directory, f"profile-{stamp}.json")
+        with open(stacks_path, "w", encoding="utf-8") as file:
+            # dict() copies in one step, so the sampler thread can keep counting
+            for stack, count in sorted(dict(self._stacks).items(), key=lambda item: -item[1]):
+                file.write(f"{stack} {count}\n")
+        with open(summary_path, "w", encoding="utf-8") as file:
+            json.dump(self.summary(), file, indent=2)
+        logger.info(f"Wrote profile to {stacks_path} and {summary_path}")
+        return {"stacks": stacks_path, "summary": summary_path}
+
+    async def _run_heartbeat(self) -> None:
+        while True:
+            self._beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+    def _sample(self) -> None:
+        stall_beat = None
+        stall: Optional[Dict[str, Any]] = None
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            tool = self._running_tool
+            stack = self._fold(frame, tool)
+            if stack is None:
+                self._idle_samples += 1
+            else:
+                self._stacks[stack] += 1
+
+            beat = self._beat
+            lag = time.monotonic() - beat - self.interval
+            if lag >= self.slow_callback and stack is not None:
+                if beat != stall_beat:
+                    stall_beat = beat
+                    stall = {"duration_ms": 0.0, "tool": tool, "stack": stack, "at": time.time()}
+                    self._slow.append(stall)
+                    self._slow_counter.inc()
+                stall["duration_ms"] = round(lag * 1000, 1)
+            # Frames keep their locals alive
+            frame = None
+
+    def _fold(self, frame: FrameType, tool: Optional[str]) -> Optional[str]:
+        """The stack as root-first 'function (file:line)' labels, or None while the loop is idle"""
+        if frame.f_code.co_filename.endswith("selectors.py"):
+            return None
+        labels: List[str] = []
+        while frame is not None and len(labels) < MAX_STACK_DEPTH:
+            code = frame.f_code
+            label = self._labels.get(code)
+            if label is None:
+                label = self._labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            labels.append(label)
+            frame = frame.f_back
+        labels.append(f"tool:{tool}" if tool else "event_loop")
+        return ";".join(reversed(labels))
+
+
+# Process-wide profiler, started by the server or the profile tool
+profiler = Profiler()
@@ -0,0 +1,83 @@
+from typing import Awaitable, Callable, Dict, Iterable, Optional
+
+from .cache import TTLCache
+from .metrics import metrics
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class _Reads:
+    """Fetches of an entity in flight, and how often it was invalidated while they ran"""
+
+    __slots__ = ("version", "count")
+
+    def __init__(self):
+        self.version = 0
+        self.count = 0
+
+
+class StateReadCache:
+    """Read-through cache of entity states fetched from the REST API
+
+    Answers repeated reads of an entity, e.g. several `*-get_state` calls in
+    one agent turn, without a request to Home Assistant. How long a state is
+    reused depends on its domain: sensors change all the time, locks and
+    thermostats rarely change by themselves. Entries are dropped when a
+    service call targets the entity or reports it changed, and a read that
+    was in flight during such a call is not stored.
+    """
+
+    def __init__(self, ttls: Dict[str, float], default_ttl: float = 2.0, max_entries: int = 1024):
+        self._ttls = ttls
+        self._default_ttl = default_ttl
+        self._entries: TTLCache[str, dict] = TTLCache(max_entries=max_entries, ttl=default_ttl)
+        # Only entities with a fetch in flight, so it does not grow with every entity ever invalidated
+        self._reads: Dict[str, _Reads] = {}
+        self._hits = metrics.counter("read_cache.hits")
+        self._misses = metrics.counter("read_cache.misses")
+        self._invalidations = metrics.counter("read_cache.invalidations")
+        metrics.gauge("read_cache.hit_rate", self, StateReadCache.hit_rate)
+        metrics.gauge("read_cache.entries", self, lambda cache: float(len(cache._entries)))
+
+    def hit_rate(self) -> float:
+        reads = self._hits.value + self._misses.value
+        return round(self._hits.value / reads, 4) if reads else 0.0
+
+    def ttl(self, entity_id: str) -> float:
+        return self._ttls.get(entity_id.split(".", 1)[0], self._default_ttl)
+
+    def get(self, entity_id: str) -> Optional[dict]:
+        state = self._entries.get(entity_id, count=False)
+        if state is None:
+            self._misses.inc()
+        else:
+            self._hits.inc()
+        return state
+
+    async def fetch(self, entity_id: str, fetch: Callable[[str], Awaitable[dict]]) -> dict:
+        """Fetch a state and keep it, unless the entity was invalidated while the fetch ran"""
+        reads = self._reads.get(entity_id)
+        if reads is None:
+            reads = self._reads[entity_id] = _Reads()
+        version = reads.version
+        reads.count += 1
+        try:
+            state = await fetch(entity_id)
+        finally:
+            reads.count -= 1
+            if not reads.count:
+                del self._reads[entity_id]
+        ttl = self.ttl(entity_id)
+        if ttl > 0 and reads.version == version and "entity_id" in state:
+            self._entries.set(entity_id, state, ttl)
+        return state
+
+    def invalidate(self, entity_ids: Iterable[str]) -> None:
+        """Drop entries of entities a service call targets or changed"""
+        for entity_id in entity_ids:
+            self._entries.pop(entity_id)
+            reads = self._reads.get(entity_id)
+            if reads is not None:
+                reads.version += 1
+            self._invalidations.inc()
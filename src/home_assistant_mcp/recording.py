@@ -0,0 +1,341 @@
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Deque, Dict, List, Optional, Tuple
+import asyncio
+import gzip
+import json
+import queue
+import re
+import threading
+import time
+
+import httpx
+from websockets.exceptions import ConnectionClosedOK
+
+from .metrics import metrics
+
+import logging
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+# Values of these keys never reach a recording: tokens, alarm codes
+REDACTED_KEYS = frozenset({"access_token", "token", "password", "code"})
+REDACTED = "REDACTED"
+# Tokens in URLs, e.g. the entity_picture of a camera: /api/camera_proxy/camera.porch?token=...
+_TOKEN_PARAMETER = re.compile(r"((?:^|[?&])(?:access_)?token=)[^&#\s\"']*")
+
+
+def _redact(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {key: REDACTED if key in REDACTED_KEYS else _redact(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_redact(item) for item in value]
+    if isinstance(value, str) and "token=" in value:
+        return _TOKEN_PARAMETER.sub(lambda match: match.group(1) + REDACTED, value)
+    return value
+
+
+def _request_body(content: bytes) -> Optional[str]:
+    """A request body as recorded and as matched on replay"""
+    if not content:
+        return None
+    try:
+        return json.dumps(_redact(json.loads(content)), sort_keys=True, separators=(",", ":"))
+    except ValueError:
+        return content.decode("utf-8", "replace")
+
+
+def _response_body(text: str) -> str:
+    """A response body as recorded"""
+    try:
+        return json.dumps(_redact(json.loads(text)), separators=(",", ":"))
+    except ValueError:
+        return _redact(text)
+
+
+def _path(request: httpx.Request) -> str:
+    """A request's path and query as recorded and as matched on replay"""
+    return _redact(request.url.raw_path.decode())
+
+
+class TrafficRecorder:
+    """Record Home Assistant traffic to a gzipped JSON lines file
+
+    Wraps the REST client's transport and the event stream's WebSocket
+    connection. Each request is written with its response and duration, and
+    each WebSocket message with its direction, all stamped with the offset
+    from the start of the recording. Request and response headers are not
+    kept, and token and code values are redacted, as are tokens in URLs.
+    Entries are written from a background thread.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._started = time.monotonic()
+        self._connections = 0
+        self._queue: "queue.SimpleQueue[Optional[Dict[str, Any]]]" = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="traffic-recorder", daemon=True)
+        self._thread.start()
+        self._write({"kind": "header", "version": FORMAT_VERSION, "recorded_at": time.time()})
+        logger.info(f"Recording Home Assistant traffic to {path}")
+
+    def offset(self) -> float:
+        return round(time.monotonic() - self._started, 6)
+
+    def transport(self, inner: httpx.AsyncBaseTransport) -> httpx.AsyncBaseTransport:
+        return _RecordingTransport(self, inner)
+
+    def connect(self, connect_websocket: Callable) -> Callable:
+        """Wrap a websockets connect() so the messages of its connections are recorded"""
+        @asynccontextmanager
+        async def recording_connect(url: str, **kwargs) -> AsyncIterator["_RecordingConnection"]:
+            async with connect_websocket(url, **kwargs) as ws:
+                self._connections += 1
+                connection = self._connections
+                self._write({"kind": "ws_open", "t": self.offset(), "connection": connection})
+                try:
+                    yield _RecordingConnection(self, ws, connection)
+                finally:
+                    self._write({"kind": "ws_close", "t": self.offset(), "connection": connection})
+        return recording_connect
+
+    def close(self) -> None:
+        """Flush and close the file (blocking)"""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _write(self, entry: Dict[str, Any]) -> None:
+        self._queue.put(entry)
+
+    def _run(self) -> None:
+        with gzip.open(self.path, "wt", encoding="utf-8") as file:
+            while True:
+                entry = self._queue.get()
+                if entry is None:
+                    return
+                file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+
+class _RecordingTransport(httpx.AsyncBaseTransport):
+    def __init__(self, recorder: TrafficRecorder, inner: httpx.AsyncBaseTransport):
+        self._recorder = recorder
+        self._inner = inner
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        entry: Dict[str, Any] = {
+            "kind": "http",
+            "t": self._recorder.offset(),
+            "method": request.method,
+            "path": _path(request),
+            "request": _request_body(request.content)
+        }
+        started = time.monotonic()
+        try:
+            response = await self._inner.handle_async_request(request)
+            try:
+                raw = b"".join([chunk async for chunk in response.stream])
+            finally:
+                await response.aclose()
+        except Exception as e:
+            entry.update(duration=round(time.monotonic() - started, 6), error=type(e).__name__, message=_redact(str(e)))
+            self._recorder._write(entry)
+            raise
+        # Decoded for the recording; the client still gets the response as sent
+        decoded = httpx.Response(response.status_code, headers=response.headers, content=raw)
+        entry.update(
+            duration=round(time.monotonic() - started, 6),
+            status=response.status_code,
+            type=response.headers.get("content-type"),
+            body=_response_body(decoded.text)
+        )
+        self._recorder._write(entry)
+        return httpx.Response(response.status_code, headers=response.headers, content=raw, extensions=response.extensions)
+
+    async def aclose(self) -> None:
+        await self._inner.aclose()
+
+
+class _RecordingConnection:
+    """Proxy of a websockets ClientConnection that records each message"""
+
+    def __init__(self, recorder: TrafficRecorder, ws, connection: int):
+        self._recorder = recorder
+        self._ws = ws
+        self._connection = connection
+
+    def _record(self, direction: str, raw: str | bytes) -> None:
+        try:
+            message = _redact(json.loads(raw))
+        except ValueError:
+            return
+        self._recorder._write({
+            "kind": "ws", "t": self._recorder.offset(), "connection": self._connection, "dir": direction, "message": message
+        })
+
+    async def send(self, raw: str) -> None:
+        self._record("out", raw)
+        await self._ws.send(raw)
+
+    async def recv(self) -> str | bytes:
+        raw = await self._ws.recv()
+        self._record("in", raw)
+        return raw
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        async for raw in self._ws:
+            self._record("in", raw)
+            yield raw
+
+
+class TrafficReplay:
+    """Answer the REST client and the event stream from a recording
+
+    Requests are matched by method, path and body. Repeated requests get the
+    recorded responses in order, and the last one once those run out, so a
+    benchmark can run longer than the recording. Unrecorded requests get a
+    404. Each WebSocket connection replays one recorded connection: a message
+    Home Assistant sent is delivered once the client has sent as many
+    messages as it had at that point, with ids rewritten to the ids the
+    client uses now. With speed "recorded" responses and events keep their
+    recorded timing; with "fast" they are delivered as soon as possible.
+    """
+
+    def __init__(self, path: str, speed: str = "recorded"):
+        if speed not in ("recorded", "fast"):
+            raise ValueError(f"Unknown replay speed {speed}")
+        self.path = path
+        self.realtime = speed == "recorded"
+        self._responses: Dict[Tuple[str, str, Optional[str]], Deque[Dict[str, Any]]] = {}
+        self._last: Dict[Tuple[str, str, Optional[str]], Dict[str, Any]] = {}
+        self._connections: Deque[List[Dict[str, Any]]] = deque()
+        self._misses = metrics.counter("replay.misses")
+        self._load()
+
+    def _load(self) -> None:
+        connections: Dict[int, List[Dict[str, Any]]] = {}
+        with gzip.open(self.path, "rt", encoding="utf-8") as file:
+            for line in file:
+                entry = json.loads(line)
+                kind = entry["kind"]
+                if kind == "header" and entry["version"] != FORMAT_VERSION:
+                    raise ValueError(f"Unsupported recording version {entry['version']}")
+                if kind == "http":
+                    key = (entry["method"], entry["path"], entry["request"])
+                    self._responses.setdefault(key, deque()).append(entry)
+                elif kind in ("ws_open", "ws"):
+                    connections.setdefault(entry["connection"], []).append(entry)
+        self._connections.extend(connections[connection] for connection in sorted(connections))
+        logger.info(f"Replaying {sum(map(len, self._responses.values()))} requests and "
+                    f"{len(self._connections)} WebSocket connections from {self.path}")
+
+    def http_transport(self) -> httpx.AsyncBaseTransport:
+        return _ReplayTransport(self)
+
+    def response_for(self, request: httpx.Request) -> Optional[Dict[str, Any]]:
+        key = (request.method, _path(request), _request_body(request.content))
+        recorded = self._responses.get(key)
+        if recorded:
+            self._last[key] = recorded.popleft()
+        entry = self._last.get(key)
+        if entry is None:
+            self._misses.inc()
+        return entry
+
+    @asynccontextmanager
+    async def connect(self, url: str, **kwargs) -> AsyncIterator["_ReplayConnection"]:
+        """Stand-in for websockets connect(), replaying the next recorded connection"""
+        if not self._connections:
+            raise ConnectionRefusedError("No more recorded WebSocket connections")
+        connection = _ReplayConnection(self._connections.popleft(), self.realtime)
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+
+class _ReplayTransport(httpx.AsyncBaseTransport):
+    def __init__(self, replay: TrafficReplay):
+        self._replay = replay
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        entry = self._replay.response_for(request)
+        if entry is None:
+            return httpx.Response(404, json={"message": "Not in the recording"})
+        if self._replay.realtime:
+            await asyncio.sleep(entry["duration"])
+        if "error" in entry:
+            raise getattr(httpx, entry["error"], httpx.TransportError)(entry["message"], request=request)
+        headers = {"content-type": entry["type"]} if entry.get("type") else {}
+        return httpx.Response(entry["status"], headers=headers, content=entry["body"].encode())
+
+
+class _ReplayConnection:
+    """Plays Home Assistant's side of one recorded WebSocket connection"""
+
+    def __init__(self, entries: List[Dict[str, Any]], realtime: bool):
+        opened_at = entries[0]["t"] if entries and entries[0]["kind"] == "ws_open" else 0.0
+        # What the client sent, in order, and what Home Assistant answered after how many of those
+        self._recorded_ids: List[Any] = []
+        self._script: Deque[Tuple[int, float, Any]] = deque()
+        for entry in entries:
+            if entry["kind"] != "ws":
+                continue
+            if entry["dir"] == "out":
+                self._recorded_ids.append(entry["message"].get("id") if isinstance(entry["message"], dict) else None)
+            else:
+                self._script.append((len(self._recorded_ids), entry["t"] - opened_at, entry["message"]))
+        self._realtime = realtime
+        self._started = time.monotonic()
+        self._ids: Dict[Any, Any] = {}
+        self._sent = 0
+        self._progress = asyncio.Event()
+        self._closed = asyncio.Event()
+
+    async def send(self, raw: str) -> None:
+        if self._closed.is_set():
+            raise ConnectionClosedOK(None, None)
+        message = json.loads(raw)
+        if self._sent < len(self._recorded_ids) and self._recorded_ids[self._sent] is not None:
+            self._ids[self._recorded_ids[self._sent]] = message.get("id")
+        self._sent += 1
+        self._progress.set()
+
+    async def recv(self) -> str:
+        if not self._script:
+            # The recording ends here; stay connected, like an idle Home Assistant
+            await self._closed.wait()
+            raise ConnectionClosedOK(None, None)
+        sent_before, offset, message = self._script[0]
+        while self._sent < sent_before and not self._closed.is_set():
+            self._progress.clear()
+            await self._progress.wait()
+        if self._realtime:
+            await asyncio.sleep(max(0.0, offset - (time.monotonic() - self._started)))
+        if self._closed.is_set():
+            raise ConnectionClosedOK(None, None)
+        self._script.popleft()
+        return json.dumps(self._rewrite(message))
+
+    def _rewrite(self, message: Any) -> Any:
+        if isinstance(message, list):
+            return [self._rewrite(item) for item in message]
+        if isinstance(message, dict) and "id" in message:
+            return {**message, "id": self._ids.get(message["id"], message["id"])}
+        return message
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        try:
+            while True:
+                yield await self.recv()
+        except ConnectionClosedOK:
+            return
+
+    def close(self) -> None:
+        self._closed.set()
+        self._progress.set()
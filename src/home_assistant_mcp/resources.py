@@ -0,0 +1,188 @@
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+import asyncio
+import json
+import time
+
+from mcp.server.session import ServerSession
+from mcp.types import Resource
+from pydantic import AnyUrl
+
+from .metrics import metrics
+from .state import StateCache, StateRecord
+
+import logging
+logger = logging.getLogger(__name__)
+
+STATE_URI_PREFIX = "ha://state/"
+DOMAIN_URI_PREFIX = "ha://domain/"
+METRICS_URI = "ha://metrics"
+
+
+def state_uri(entity_id: str) -> str:
+    return f"{STATE_URI_PREFIX}{entity_id}"
+
+
+def domain_uri(domain: str) -> str:
+    return f"{DOMAIN_URI_PREFIX}{domain}"
+
+
+class _Subscriber:
+    """Resource subscriptions of a single client session
+
+    Updates are coalesced: a URI is sent at most once per interval no matter how
+    often the underlying entity changes in between.
+    """
+
+    def __init__(self, session: ServerSession, interval: float, on_closed: Callable[["_Subscriber"], None]):
+        self.session = session
+        self.uris: Set[str] = set()
+        self._interval = interval
+        self._on_closed = on_closed
+        self._pending: Set[str] = set()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._last_flush = 0.0
+
+    def mark(self, uri: str) -> None:
+        self._pending.add(uri)
+        if self._flush_task is None:
+            delay = max(0.0, self._last_flush + self._interval - time.monotonic())
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush(delay))
+
+    def close(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+
+    async def _flush(self, delay: float) -> None:
+        if delay:
+            await asyncio.sleep(delay)
+        pending, self._pending = self._pending, set()
+        self._last_flush = time.monotonic()
+        self._flush_task = None
+        try:
+            for uri in pending:
+                await self.session.send_resource_updated(AnyUrl(uri))
+        except Exception as e:
+            logger.info(f"Dropping resource subscriber: {e}")
+            self._on_closed(self)
+
+
+class ResourceManager:
+    """Expose entity states as MCP resources with push subscriptions
+
+    `ha://state/{entity_id}` is a single entity, `ha://domain/{domain}` is every
+    entity of a domain, and `ha://metrics` holds the server's own counters. Subscriptions are indexed by URI so each state change
+    only touches the sessions subscribed to that entity or its domain.
+    """
+
+    def __init__(
+        self,
+        state_cache: StateCache,
+        get_state: Callable[[str], Awaitable[dict]],
+        get_all_states: Callable[[], Awaitable[List[dict]]],
+        domains: List[str],
+        coalesce_interval: float = 1.0
+    ):
+        self._state_cache = state_cache
+        self._get_state = get_state
+        self._get_all_states = get_all_states
+        self._domains = domains
+        self._coalesce_interval = coalesce_interval
+        self._subscribers: Dict[int, _Subscriber] = {}
+        self._subscriptions: Dict[str, Set[_Subscriber]] = {}
+        state_cache.add_listener(self._on_state_changed)
+
+    def list_resources(self) -> List[Resource]:
+        """List domain resources and a resource per known entity"""
+        resources = [
+            Resource(
+                uri=METRICS_URI,
+                name="server metrics",
+                description="Counters of the MCP server, e.g. cache and prefetch hit rates",
+                mimeType="application/json"
+            )
+        ]
+        resources.extend(
+            Resource(
+                uri=domain_uri(domain),
+                name=f"{domain} states",
+                description=f"Current state of every {domain} entity",
+                mimeType="application/json"
+            )
+            for domain in self._domains
+        )
+        for record in self._state_cache.records():
+            resources.append(Resource(
+                uri=state_uri(record.entity_id),
+                name=record.attribute("friendly_name", record.entity_id),
+                mimeType="application/json"
+            ))
+        return resources
+
+    async def read_resource(self, uri: str) -> str:
+        """Read a resource, preferring the state cache over a REST request"""
+        if uri == METRICS_URI:
+            return json.dumps(metrics.snapshot())
+        if uri.startswith(STATE_URI_PREFIX):
+            entity_id = uri[len(STATE_URI_PREFIX):]
+            state = self._state_cache.get(entity_id)
+            if state is None:
+                state = await self._get_state(entity_id)
+            return json.dumps(state)
+        if uri.startswith(DOMAIN_URI_PREFIX):
+            domain = uri[len(DOMAIN_URI_PREFIX):]
+            if self._state_cache.live:
+                states = self._state_cache.get_domain(domain)
+            else:
+                prefix = f"{domain}."
+                states = [s for s in await self._get_all_states() if s["entity_id"].startswith(prefix)]
+            return json.dumps(states)
+        raise ValueError(f"Unknown resource: {uri}")
+
+    def subscribe(self, session: ServerSession, uri: str) -> None:
+        """Subscribe a session to update notifications for a resource"""
+        if not uri.startswith((STATE_URI_PREFIX, DOMAIN_URI_PREFIX)):
+            raise ValueError(f"Unknown resource: {uri}")
+        subscriber = self._subscribers.get(id(session))
+        if subscriber is None:
+            subscriber = _Subscriber(session, self._coalesce_interval, self._remove_subscriber)
+            self._subscribers[id(session)] = subscriber
+        subscriber.uris.add(uri)
+        self._subscriptions.setdefault(uri, set()).add(subscriber)
+
+    def unsubscribe(self, session: ServerSession, uri: str) -> None:
+        """Remove a session's subscription to a resource"""
+        subscriber = self._subscribers.get(id(session))
+        if subscriber is None:
+            return
+        subscriber.uris.discard(uri)
+        self._discard(uri, subscriber)
+        if not subscriber.uris:
+            self._remove_subscriber(subscriber)
+
+    def remove_session(self, session: ServerSession) -> None:
+        """Drop every subscription of a session that has ended"""
+        subscriber = self._subscribers.get(id(session))
+        if subscriber is not None:
+            self._remove_subscriber(subscriber)
+
+    def _remove_subscriber(self, subscriber: _Subscriber) -> None:
+        subscriber.close()
+        self._subscribers.pop(id(subscriber.session), None)
+        for uri in subscriber.uris:
+            self._discard(uri, subscriber)
+        subscriber.uris.clear()
+
+    def _discard(self, uri: str, subscriber: _Subscriber) -> None:
+        subscribers = self._subscriptions.get(uri)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._subscriptions[uri]
+
+    def _on_state_changed(self, entity_id: str, old_state: Optional[StateRecord], new_state: Optional[StateRecord]) -> None:
+        if not self._subscriptions:
+            return
+        for uri in (state_uri(entity_id), domain_uri(entity_id.split(".", 1)[0])):
+            for subscriber in self._subscriptions.get(uri, ()):
+                subscriber.mark(uri)
@@ -1,47 +1,280 @@
 import os
 import json
 import logging
+import signal
 import sys
+import time
+from contextvars import ContextVar
 from collections.abc import Sequence
 from typing import Dict, Any
 import httpx
 import asyncio
+import anyio
+from websockets.asyncio.client import connect as connect_websocket
 from dotenv import load_dotenv
 from mcp.server.stdio import stdio_server
-from mcp.server import Server
-from mcp.types import Tool, TextContent, ImageContent, EmbeddedResource
+from mcp.server import Server, NotificationOptions
+import mcp.types as types
+from mcp.types import Tool, TextContent, ImageContent, EmbeddedResource, Resource
+from pydantic import AnyUrl
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
 
 from home_assistant_mcp.models.entity import EntityDomain
+from home_assistant_mcp.state import StateCache
+from home_assistant_mcp.events import HomeAssistantEventStream, CommandNotSentError
+from home_assistant_mcp.poller import StatePoller
+from home_assistant_mcp.resources import ResourceManager
+from home_assistant_mcp.store import PersistentStateStore
+from home_assistant_mcp.tracing import tracer, JsonLinesExporter
+from home_assistant_mcp.profiling import profiler
+from home_assistant_mcp.metrics import metrics
+from home_assistant_mcp.log import configure_logging, protect_stdout
+from home_assistant_mcp.tcp import TcpTransport, TIMEOUT_META
+from home_assistant_mcp.compression import accept_encoding
+from home_assistant_mcp.recording import TrafficRecorder, TrafficReplay
+from home_assistant_mcp.prefetch import Prefetcher
+from home_assistant_mcp.read_cache import StateReadCache
+from home_assistant_mcp.profiles import ToolProfile, ToolScopes, SCOPE_TOOL
+from home_assistant_mcp.validation import validate
 from home_assistant_mcp.services.light import LightService
 from home_assistant_mcp.services.climate import ClimateService
 from home_assistant_mcp.services.lock import LockService
 from home_assistant_mcp.services.humidifier import HumidifierService
 from home_assistant_mcp.services.alarm_control_panel import AlarmControlPanelService
+from home_assistant_mcp.services.state import StateService
+from home_assistant_mcp.services.template import TemplateService
+from home_assistant_mcp.services.rules import RuleService
+from home_assistant_mcp.services.plans import PlanService
+from home_assistant_mcp.services.diagnostics import DiagnosticsService
 # Import other services as needed
 
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    stream=sys.stderr
-)
 logger = logging.getLogger(__name__)
 
+
+def _max_rss_mb() -> float:
+    """Peak resident memory of the process"""
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(max_rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def parse_number_settings(value: str | None) -> Dict[str, float]:
+    """Parse `name=number,name=number` settings, e.g. per logger or per domain"""
+    settings = {}
+    for item in (value or "").split(","):
+        if "=" in item:
+            name, number = item.split("=", 1)
+            settings[name.strip()] = float(number)
+    return settings
+
+
 load_dotenv()
 
 API_KEY = os.getenv("HOMEASSISTANT_TOKEN")
 HOMEASSISTANT_BASE_URL = os.getenv("HOMEASSISTANT_BASE_URL")
+EVENT_STREAM_ENABLED = os.getenv("HOMEASSISTANT_EVENT_STREAM", "true").lower() in ("1", "true", "yes")
+# Send service calls over the event stream's WebSocket while it is connected
+WS_SERVICE_CALLS_ENABLED = os.getenv("HOMEASSISTANT_WS_SERVICE_CALLS", "true").lower() in ("1", "true", "yes")
+# Poll /api/states whenever the event stream is not connected (or disabled)
+STATE_POLL_ENABLED = os.getenv("HOMEASSISTANT_STATE_POLL", "false").lower() in ("1", "true", "yes")
+STATE_POLL_MIN_SECONDS = float(os.getenv("HOMEASSISTANT_STATE_POLL_MIN_SECONDS", "1.0"))
+STATE_POLL_MAX_SECONDS = float(os.getenv("HOMEASSISTANT_STATE_POLL_MAX_SECONDS", "30.0"))
+STATE_POLL_ACTIVE_SECONDS = float(os.getenv("HOMEASSISTANT_STATE_POLL_ACTIVE_SECONDS", "60.0"))
+RESOURCE_COALESCE_SECONDS = float(os.getenv("HOMEASSISTANT_RESOURCE_COALESCE_SECONDS", "1.0"))
+TEMPLATE_CACHE_TTL = float(os.getenv("HOMEASSISTANT_TEMPLATE_CACHE_TTL", "5.0"))
+TEMPLATE_CACHE_SIZE = int(os.getenv("HOMEASSISTANT_TEMPLATE_CACHE_SIZE", "256"))
+TEMPLATE_TIMEOUT = float(os.getenv("HOMEASSISTANT_TEMPLATE_TIMEOUT", "10.0"))
+STATE_DB_PATH = os.getenv("HOMEASSISTANT_STATE_DB")
+STATE_DB_FLUSH_SECONDS = float(os.getenv("HOMEASSISTANT_STATE_DB_FLUSH_SECONDS", "1.0"))
+STATE_DB_WARM_SECONDS = float(os.getenv("HOMEASSISTANT_STATE_DB_WARM_SECONDS", "30.0"))
+READ_CACHE_ENABLED = os.getenv("HOMEASSISTANT_READ_CACHE", "true").lower() in ("1", "true", "yes")
+READ_CACHE_SIZE = int(os.getenv("HOMEASSISTANT_READ_CACHE_SIZE", "1024"))
+READ_CACHE_TTL = float(os.getenv("HOMEASSISTANT_READ_CACHE_TTL", "2.0"))
+# Per-domain overrides, e.g. "sensor=1,lock=10"; 0 never caches a domain
+READ_CACHE_TTLS = {
+    "sensor": 1.0,
+    "binary_sensor": 1.0,
+    "lock": 10.0,
+    "climate": 10.0,
+    "alarm_control_panel": 10.0,
+    **parse_number_settings(os.getenv("HOMEASSISTANT_READ_CACHE_TTLS"))
+}
+PREFETCH_ENABLED = os.getenv("HOMEASSISTANT_PREFETCH", "false").lower() in ("1", "true", "yes")
+PREFETCH_BUDGET = float(os.getenv("HOMEASSISTANT_PREFETCH_BUDGET", "30"))
+PREFETCH_TTL = float(os.getenv("HOMEASSISTANT_PREFETCH_TTL", "2.0"))
+TRACE_FILE = os.getenv("HOMEASSISTANT_TRACE_FILE")
+TRACE_SAMPLE_RATE = float(os.getenv("HOMEASSISTANT_TRACE_SAMPLE_RATE", "0.01"))
+PROFILE_ENABLED = os.getenv("HOMEASSISTANT_PROFILE", "false").lower() in ("1", "true", "yes")
+PROFILE_DIR = os.getenv("HOMEASSISTANT_PROFILE_DIR", "profiles")
+PROFILE_SAMPLE_RATE = float(os.getenv("HOMEASSISTANT_PROFILE_SAMPLE_RATE", "1.0"))
+PROFILE_INTERVAL = float(os.getenv("HOMEASSISTANT_PROFILE_INTERVAL", "0.01"))
+SLOW_CALLBACK_SECONDS = float(os.getenv("HOMEASSISTANT_SLOW_CALLBACK_SECONDS", "0.1"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HOMEASSISTANT_HTTP_MAX_CONNECTIONS", "20"))
+# Ask Home Assistant (or a proxy in front of it) for compressed responses
+HTTP_COMPRESSION = os.getenv("HOMEASSISTANT_HTTP_COMPRESSION", "true").lower() in ("1", "true", "yes")
+WARMUP_CONNECTIONS = int(os.getenv("HOMEASSISTANT_WARMUP_CONNECTIONS", "4"))
+WARMUP_TIMEOUT = float(os.getenv("HOMEASSISTANT_WARMUP_TIMEOUT", "10.0"))
+DRAIN_TIMEOUT = float(os.getenv("HOMEASSISTANT_DRAIN_TIMEOUT", "10.0"))
+# Deadline of a tool call unless the request sets a shorter one (0 for none)
+TOOL_TIMEOUT = float(os.getenv("HOMEASSISTANT_TOOL_TIMEOUT", "0")) or None
+# Record Home Assistant traffic to a file, or answer from such a file instead of Home Assistant
+RECORD_FILE = os.getenv("HOMEASSISTANT_RECORD")
+REPLAY_FILE = os.getenv("HOMEASSISTANT_REPLAY")
+REPLAY_SPEED = os.getenv("HOMEASSISTANT_REPLAY_SPEED", "recorded")
+TRANSPORT = os.getenv("HOMEASSISTANT_MCP_TRANSPORT", "stdio")
+TCP_HOST = os.getenv("HOMEASSISTANT_MCP_HOST", "127.0.0.1")
+TCP_PORT = int(os.getenv("HOMEASSISTANT_MCP_PORT", "8888"))
+TCP_MAX_IN_FLIGHT = int(os.getenv("HOMEASSISTANT_MCP_MAX_IN_FLIGHT", "32"))
+TCP_IDLE_TIMEOUT = float(os.getenv("HOMEASSISTANT_MCP_IDLE_TIMEOUT", "0")) or None
+TCP_COMPRESSION = os.getenv("HOMEASSISTANT_MCP_COMPRESSION", "true").lower() in ("1", "true", "yes")
+TCP_COMPRESS_MIN_BYTES = int(os.getenv("HOMEASSISTANT_MCP_COMPRESS_MIN_BYTES", "2048"))
+# Default tool profile, e.g. HOMEASSISTANT_TOOL_DOMAINS=light,lock or HOMEASSISTANT_TOOLS=lock-*,wait_for_state
+TOOL_PROFILE = ToolProfile.from_settings({
+    "domains": os.getenv("HOMEASSISTANT_TOOL_DOMAINS"),
+    "areas": os.getenv("HOMEASSISTANT_TOOL_AREAS"),
+    "tools": os.getenv("HOMEASSISTANT_TOOLS")
+})
+# Seconds the domains found in the profile areas are reused before they are looked up again
+TOOL_AREAS_TTL = float(os.getenv("HOMEASSISTANT_TOOL_AREAS_TTL", "300"))
+TOOLS_PAGE_SIZE = int(os.getenv("HOMEASSISTANT_TOOLS_PAGE_SIZE", "0"))
+LOG_LEVEL = os.getenv("HOMEASSISTANT_LOG_LEVEL", "INFO").upper()
+# e.g. "mcp.server=0.1" keeps 10% of records below WARNING from that logger
+LOG_SAMPLING = parse_number_settings(os.getenv("HOMEASSISTANT_LOG_SAMPLING"))
+# e.g. "home_assistant_mcp.events=5" allows 5 records per second below ERROR
+LOG_RATE_LIMITS = parse_number_settings(os.getenv("HOMEASSISTANT_LOG_RATE_LIMITS"))
 
 if not API_KEY:
     raise ValueError("HOMEASSISTANT_TOKEN is required. Please set it in the .env file.")
 if not HOMEASSISTANT_BASE_URL:
     raise ValueError("HOMEASSISTANT_BASE_URL is required. Please set it in the .env file.")
 
+# Tools whose handler takes the calling session, so the tools they run stay within its scope
+SESSION_TOOLS = frozenset({*PlanService.tools, "add_rule"})
+
+# Set while a tool call runs, so calls it makes itself (plan steps) are not counted or refused
+_in_tool_call: ContextVar[bool] = ContextVar("in_tool_call", default=False)
+
 
 class HomeAssistantMcpServer:
-    def __init__(self):
+    def __init__(self, http_transport: httpx.AsyncBaseTransport | None = None):
+        connect = connect_websocket
+        if REPLAY_FILE and http_transport is None:
+            replay = TrafficReplay(REPLAY_FILE, REPLAY_SPEED)
+            http_transport, connect = replay.http_transport(), replay.connect
+        # Custom transports let tests and benchmarks stand in for Home Assistant
+        self._http_transport = http_transport
+        limits = httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_CONNECTIONS)
+        self._recorder = TrafficRecorder(RECORD_FILE) if RECORD_FILE else None
+        if self._recorder is not None:
+            http_transport = self._recorder.transport(http_transport or httpx.AsyncHTTPTransport(limits=limits))
+            connect = self._recorder.connect(connect)
+        # One pooled client, so requests reuse open connections to Home Assistant
+        self._client = httpx.AsyncClient(
+            transport=http_transport,
+            headers={"Authorization": f"Bearer {API_KEY}", "Accept-Encoding": accept_encoding(HTTP_COMPRESSION)},
+            limits=limits
+        )
+        self.ready = asyncio.Event()
+        self._warm_up_task: asyncio.Task | None = None
+        self._accepting = True
+        self._in_flight = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        metrics.gauge("server.ready", self, lambda server: float(server.ready.is_set()))
+        metrics.gauge("server.in_flight", self, lambda server: float(server._in_flight))
+        # The whole process, so a load generator can measure the server from outside
+        metrics.gauge("process.cpu_seconds", self, lambda server: round(time.process_time(), 3))
+        if resource is not None:
+            metrics.gauge("process.max_rss_mb", self, lambda server: _max_rss_mb())
+        self._cancelled_calls = metrics.counter("tool_calls.cancelled")
+        self._expired_calls = metrics.counter("tool_calls.deadline_exceeded")
         self._services: Dict[EntityDomain, Any] = {}
         self._initialize_services()
+        self._state_cache = StateCache()
+        self._state_store = PersistentStateStore(STATE_DB_PATH, STATE_DB_FLUSH_SECONDS) if STATE_DB_PATH else None
+        # Until this deadline, states loaded from the store are served while the stream resyncs
+        self._warm_until = 0.0
+        self._event_stream = HomeAssistantEventStream(
+            HOMEASSISTANT_BASE_URL,
+            API_KEY,
+            self._state_cache,
+            connect_websocket=connect
+        )
+        self._service_calls_ws = metrics.counter("service_calls.websocket")
+        self._service_calls_rest = metrics.counter("service_calls.rest")
+        self._service_calls_fallback = metrics.counter("service_calls.websocket_fallbacks")
+        self._poller = StatePoller(
+            self.get_all_states,
+            self._state_cache,
+            min_interval=STATE_POLL_MIN_SECONDS,
+            max_interval=STATE_POLL_MAX_SECONDS,
+            active_window=STATE_POLL_ACTIVE_SECONDS,
+            paused=self._event_stream.connected.is_set
+        ) if STATE_POLL_ENABLED else None
+        self._resources = ResourceManager(
+            self._state_cache,
+            get_state=self.get_entity_state,
+            get_all_states=self.get_all_states,
+            domains=[domain.value for domain in self._services],
+            coalesce_interval=RESOURCE_COALESCE_SECONDS
+        )
+        self._tool_domains: Dict[str, str | None] = {}
+        self._tool_schemas: Dict[str, Dict[str, Any]] = {}
+        self._scopes = ToolScopes(
+            self.get_all_tools,
+            self._tool_domains,
+            TOOL_PROFILE,
+            resolve_area_entities=self._area_entities,
+            page_size=TOOLS_PAGE_SIZE,
+            area_ttl=TOOL_AREAS_TTL
+        )
+        self._rules = RuleService(
+            self._state_cache,
+            call_tool=self.handle_tool_call,
+            resolve_tool=self._resolve_tool,
+            scopes=self._scopes,
+            blocked_tools=[*PlanService.tools, SCOPE_TOOL],
+            tool_schemas=self._tool_schemas
+        )
+        # Server-level tools that are not bound to a single entity domain
+        self._tool_services = [
+            # Polls while waiting, which must not be answered from the read cache
+            StateService(self._state_cache, get_state=lambda entity_id: self.get_entity_state(entity_id, fresh=True)),
+            TemplateService(
+                self.render_template,
+                cache_ttl=TEMPLATE_CACHE_TTL,
+                cache_size=TEMPLATE_CACHE_SIZE
+            ),
+            self._rules,
+            PlanService(call_tool=self.handle_tool_call),
+            DiagnosticsService(
+                profiler,
+                PROFILE_DIR,
+                interval=PROFILE_INTERVAL,
+                slow_callback=SLOW_CALLBACK_SECONDS
+            ),
+        ]
+        self._tool_handlers = {
+            tool_info["name"]: getattr(service, tool_id)
+            for service in self._tool_services
+            for tool_id, tool_info in service.tools.items()
+        }
+        self._read_cache = StateReadCache(
+            READ_CACHE_TTLS,
+            default_ttl=READ_CACHE_TTL,
+            max_entries=READ_CACHE_SIZE
+        ) if READ_CACHE_ENABLED else None
+        self._prefetcher = Prefetcher(
+            self._fetch_state,
+            self.render_template,
+            budget=PREFETCH_BUDGET,
+            ttl=PREFETCH_TTL
+        ) if PREFETCH_ENABLED else None
+        self._tools = self._build_tools()
 
     def _initialize_services(self):
         """Initialize service handlers"""
@@ -71,16 +304,127 @@ class HomeAssistantMcpServer:
     # TODO: Define a workflow for receiving all the entities from HA
     # parse states from entities supported and add their services accordingly
 
-    async def get_entity_state(self, entity_id: str) -> dict:
-        """Generic method to get any entity state"""
-        url = f"{HOMEASSISTANT_BASE_URL}/api/states/{entity_id}"
-        print(f"Getting state for {url}")
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                url,
-                headers={"Authorization": f"Bearer {API_KEY}"}
-            )
-            return response.json()
+    async def _request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        """Send a request to the Home Assistant REST API"""
+        with tracer.span("ha.http", method=method, path=path) as span:
+            response = await self._client.request(method, f"{HOMEASSISTANT_BASE_URL}{path}", **kwargs)
+            span.set_attribute("status", response.status_code)
+            span.set_attribute("request_bytes", len(response.request.content))
+            span.set_attribute("response_bytes", len(response.content))
+            # Bytes on the wire, before decompression
+            span.set_attribute("wire_bytes", response.num_bytes_downloaded)
+            return response
+
+    async def get_entity_state(self, entity_id: str, fresh: bool = False) -> dict:
+        """Generic method to get any entity state
+
+        Unless the state cache is live, fresh reads skip the read cache, stored
+        and prefetched states and ask Home Assistant, e.g. when polling for a
+        change; what they read still refreshes the read cache.
+        """
+        with tracer.span("state.read", entity_id=entity_id) as span:
+            cached = self._state_cache.get(entity_id)
+            if cached is not None and self._state_cache.live:
+                span.set_attribute("cache", "live")
+                return cached
+            if self._read_cache is not None and not fresh:
+                recent = self._read_cache.get(entity_id)
+                if recent is not None:
+                    span.set_attribute("cache", "read")
+                    return recent
+            if cached is not None and time.monotonic() < self._warm_until and not fresh:
+                span.set_attribute("cache", "warm")
+                return self._last_known(cached, "Home Assistant state is resyncing after a restart")
+            if self._prefetcher is not None and not fresh:
+                prefetched = self._prefetcher.take(entity_id)
+                if prefetched is not None:
+                    span.set_attribute("cache", "prefetch")
+                    return prefetched
+            span.set_attribute("cache", "miss")
+
+            try:
+                if self._read_cache is None:
+                    return await self._fetch_state(entity_id)
+                return await self._read_cache.fetch(entity_id, self._fetch_state)
+            except httpx.HTTPError as e:
+                if cached is None:
+                    raise
+                logger.warning(f"Serving last known state of {entity_id}: {e}")
+                span.set_attribute("cache", "last_known")
+                return self._last_known(cached, f"Home Assistant is unreachable: {e}")
+
+    async def _fetch_state(self, entity_id: str) -> dict:
+        """Read an entity state from the REST API"""
+        logger.debug(f"Getting state for {entity_id}")
+        response = await self._request("GET", f"/api/states/{entity_id}")
+        if response.status_code >= 500:
+            response.raise_for_status()
+        return response.json()
+
+    @staticmethod
+    def _last_known(state: dict, reason: str) -> dict:
+        """Label a state that may be outdated"""
+        return {**state, "last_known": True, "last_known_reason": reason}
+
+    async def _call_service_ws(self, domain: EntityDomain, service: str, data: dict, entity_ids: list) -> list[dict]:
+        """Call a service over the WebSocket API, returning the states it changed like the REST API does
+
+        Home Assistant sends the state_changed events of a call before its result,
+        so the changed states are the ones that arrived in between for a targeted
+        entity or with the call's context. Failures raise httpx errors like the
+        REST call, within the same timeout; CommandNotSentError means the call
+        can be sent over REST instead.
+        """
+        arrived = []
+        remove_listener = self._state_cache.add_listener(
+            lambda entity_id, old, new: new is not None and arrived.append(new)
+        )
+        command = {
+            "type": "call_service",
+            "domain": domain.value,
+            "service": service,
+            "service_data": {key: value for key, value in data.items() if key != "entity_id"}
+        }
+        if entity_ids:
+            command["target"] = {"entity_id": entity_ids}
+        timeout = self._client.timeout.read
+        try:
+            with tracer.span("ha.ws", command="call_service", domain=domain.value, service=service):
+                async with asyncio.timeout(timeout):
+                    result = await self._event_stream.send_command(command)
+        except TimeoutError:
+            raise httpx.ReadTimeout(f"No result for {domain.value}.{service} within {timeout:g}s") from None
+        except CommandNotSentError:
+            raise
+        except ConnectionError as e:
+            # Sent, so it may have run: not retried over REST
+            raise httpx.ReadError(str(e)) from e
+        finally:
+            remove_listener()
+        self._service_calls_ws.inc()
+        context_id = ((result or {}).get("context") or {}).get("id")
+        targeted = set(entity_ids)
+        changed = {
+            record.entity_id: record
+            for record in arrived
+            if record.entity_id in targeted or (context_id is not None and record.context_id == context_id)
+        }
+        return [record.to_dict() for record in changed.values()]
+
+    async def get_all_states(self) -> list[dict]:
+        """Get the state of every entity"""
+        response = await self._request("GET", "/api/states")
+        return response.json()
+
+    async def render_template(self, template: str, variables: dict | None = None) -> str:
+        """Render a Jinja template in Home Assistant"""
+        payload = {"template": template}
+        if variables:
+            payload["variables"] = variables
+        response = await self._request("POST", "/api/template", json=payload, timeout=TEMPLATE_TIMEOUT)
+        if response.status_code >= 400:
+            raise ValueError(f"Template error: {response.text}")
+        return response.text
 
     async def call_service(
         self,
@@ -89,63 +433,392 @@ class HomeAssistantMcpServer:
         data: dict
     ) -> dict:
         """Generic method to call any Home Assistant service"""
-        url = f"{HOMEASSISTANT_BASE_URL}/api/services/{domain.value}/{service}"
-        async with httpx.AsyncClient() as client:
+        entity_ids = data.get("entity_id") or []
+        entity_ids = [entity_ids] if isinstance(entity_ids, str) else entity_ids
+        if self._prefetcher is not None:
+            for entity_id in entity_ids:
+                self._prefetcher.invalidate(entity_id)
+        if self._read_cache is not None:
+            self._read_cache.invalidate(entity_ids)
+        try:
+            changed = None
+            if WS_SERVICE_CALLS_ENABLED and self._event_stream.connected.is_set():
+                try:
+                    changed = await self._call_service_ws(domain, service, data, entity_ids)
+                except CommandNotSentError as e:
+                    logger.debug(f"Calling {domain.value}.{service} over REST: {e}")
+                    self._service_calls_fallback.inc()
+            if changed is None:
+                self._service_calls_rest.inc()
+                response = await self._request("POST", f"/api/services/{domain.value}/{service}", json=data)
+                changed = response.json()
+            if isinstance(changed, list) and self._state_cache.live and not self._event_stream.connected.is_set():
+                # The poller feeds the cache and would only see these on its next poll
+                for state in changed:
+                    if "entity_id" in state:
+                        self._state_cache.set(state["entity_id"], state)
+            if self._read_cache is not None:
+                # Reads that raced the call are stale too, as are entities it changed indirectly
+                self._read_cache.invalidate(entity_ids)
+                if isinstance(changed, list):
+                    self._read_cache.invalidate(state["entity_id"] for state in changed if "entity_id" in state)
+            return changed
+        except Exception as e:
+            logger.error(f"Error calling service {service} for domain {domain}: {e}")
+            raise e
+
+    async def start(self) -> None:
+        """Start background state feeds and warm-up, without waiting for either"""
+        if self._state_store is not None:
+            states = await asyncio.to_thread(self._state_store.load)
+            self._state_cache.replace_all(states)
+            self._state_store.attach(self._state_cache)
+            self._warm_until = time.monotonic() + STATE_DB_WARM_SECONDS if EVENT_STREAM_ENABLED else 0.0
+            logger.info(f"Loaded {len(states)} last known states from {STATE_DB_PATH}")
+        if EVENT_STREAM_ENABLED:
+            self._event_stream.start()
+        if self._poller is not None:
+            self._poller.start()
+        if PROFILE_ENABLED:
+            profiler.start(PROFILE_SAMPLE_RATE, PROFILE_INTERVAL, SLOW_CALLBACK_SECONDS)
+        self._warm_up_task = asyncio.create_task(self.warm_up())
+
+    async def warm_up(self) -> None:
+        """Do the work the first tool call would otherwise pay for, then report readiness
+
+        Warm-up is best effort: if Home Assistant is slow or unreachable the server
+        becomes ready after WARMUP_TIMEOUT and calls fall back as usual.
+        """
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(self._warm_up(), WARMUP_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"Warm-up incomplete: {e!r}")
+        if self._accepting:
+            self.ready.set()
+        logger.info(f"Ready after {(time.monotonic() - started) * 1000:.0f} ms warm-up")
+
+    async def _wait_for_warm_up(self) -> None:
+        """Hold a call that arrives during warm-up until it is done, rather than racing it"""
+        task = self._warm_up_task
+        if task is not None and not task.done():
+            # wait() rather than await, so a cancelled call leaves warm-up running
+            await asyncio.wait([task])
+
+    async def _stop_warm_up(self) -> None:
+        if self._warm_up_task is not None and not self._warm_up_task.done():
+            self._warm_up_task.cancel()
+            await asyncio.wait([self._warm_up_task])
+
+    async def _warm_up(self) -> None:
+        if self._http_transport is None:
+            url = httpx.URL(HOMEASSISTANT_BASE_URL)
+            await asyncio.get_running_loop().getaddrinfo(url.host, url.port or (443 if url.scheme == "https" else 80))
+        # Concurrent requests each open a connection, which then stays in the pool
+        await asyncio.gather(*(self._request("GET", "/api/config") for _ in range(WARMUP_CONNECTIONS)))
+        feeds = [self._event_stream.connected] if self._event_stream.running else []
+        if self._poller is not None and self._poller.running:
+            feeds.append(self._poller.synced)
+        if feeds:
+            waits = [asyncio.ensure_future(feed.wait()) for feed in feeds]
             try:
-                response = await client.post(
-                    url,
-                    headers={"Authorization": f"Bearer {API_KEY}"},
-                    json=data
-                )
-                return response.json()
+                await asyncio.wait(waits, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for wait in waits:
+                    wait.cancel()
+        else:
+            # Not live, but gives reads a last known state to fall back on
+            self._state_cache.replace_all(await self.get_all_states())
+        await self._scopes.warm()
+
+    def begin_shutdown(self) -> None:
+        """Refuse new tool calls; calls already running carry on"""
+        self._accepting = False
+        self.ready.clear()
+
+    async def drain(self, timeout: float) -> bool:
+        """Refuse new tool calls and wait up to timeout for running ones to finish"""
+        self.begin_shutdown()
+        if self._in_flight:
+            logger.info(f"Waiting up to {timeout:.0f}s for {self._in_flight} tool calls to finish")
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Stopping with {self._in_flight} tool calls still running")
+                return False
+        return True
+
+    async def stop(self) -> None:
+        """Drain running tool calls, stop background state feeds and flush persisted state"""
+        # Each step runs even if an earlier one failed, so the store and the recording are always closed
+        steps = [
+            ("stopping warm-up", self._stop_warm_up),
+            ("draining tool calls", lambda: self.drain(DRAIN_TIMEOUT)),
+            ("stopping the event stream", self._event_stream.stop),
+            ("stopping the poller", self._poller.stop if self._poller is not None else None),
+            ("stopping rules", self._rules.stop),
+            ("stopping the profiler", self._stop_profiler),
+            ("stopping prefetching", self._prefetcher.stop if self._prefetcher is not None else None),
+            ("closing the state store",
+             (lambda: asyncio.to_thread(self._state_store.close)) if self._state_store is not None else None),
+            ("closing the HTTP client", self._client.aclose),
+            ("closing the recording",
+             (lambda: asyncio.to_thread(self._recorder.close)) if self._recorder is not None else None),
+        ]
+        for description, step in steps:
+            if step is None:
+                continue
+            try:
+                await step()
             except Exception as e:
-                logger.error(f"Error calling service {service} for domain {domain}: {e}")
-                raise e
+                logger.error(f"Error {description} on shutdown: {e}")
 
-    def get_all_tools(self) -> list[Tool]:
-        """Collect all tools from registered services"""
+    async def _stop_profiler(self) -> None:
+        """Stop profiling, if running, and write its profiles"""
+        if not profiler.running:
+            return
+        await profiler.stop()
+        try:
+            await asyncio.to_thread(profiler.dump, PROFILE_DIR)
+        except OSError as e:
+            logger.warning(f"Could not write profiles to {PROFILE_DIR}: {e}")
+
+    def list_resources(self) -> list[Resource]:
+        """List entity state resources"""
+        return self._resources.list_resources()
+
+    async def read_resource(self, uri: str) -> str:
+        """Read an entity state resource"""
+        if self._poller is not None:
+            self._poller.touch()
+        return await self._resources.read_resource(uri)
+
+    def subscribe_resource(self, session, uri: str) -> None:
+        """Subscribe a client session to resource updates"""
+        self._resources.subscribe(session, uri)
+
+    def unsubscribe_resource(self, session, uri: str) -> None:
+        """Unsubscribe a client session from resource updates"""
+        self._resources.unsubscribe(session, uri)
+
+    def close_session(self, session) -> None:
+        """Release everything held for a client session that has ended"""
+        self._resources.remove_session(session)
+        self._scopes.remove_session(session)
+        if self._prefetcher is not None:
+            self._prefetcher.remove_session(session)
+
+    def open_session(self, session, profile_settings: dict | None = None) -> None:
+        """Set up a client session with the tool profile it asked for, if any"""
+        self._scopes.open_session(session, profile_settings)
+
+    async def list_tools(self, session, cursor: str | None = None, paginate: bool = True) -> tuple[list[Tool], str | None]:
+        """One page of the tools in a session's scope and the cursor of the next page"""
+        return await self._scopes.list_tools(session, cursor, paginate)
+
+    async def _area_entities(self, areas: tuple[str, ...]) -> list[str]:
+        """Entity IDs in any of the given areas"""
+        result = await self.render_template(
+            "{{ areas | map('area_entities') | sum(start=[]) | tojson }}",
+            {"areas": list(areas)}
+        )
+        return json.loads(result)
+
+    def _build_tools(self) -> list[Tool]:
+        """Build the tool catalog from registered services"""
         tools = []
-        for service in self._services.values():
+        for service in [*self._services.values(), *self._tool_services, ToolScopes]:
+            domain = getattr(service, "domain", None)
             for tool_id, tool_info in service.tools.items():
+                self._tool_domains[tool_info["name"]] = domain.value if domain else None
+                self._tool_schemas[tool_info["name"]] = tool_info["schema"]
                 tools.append(Tool(
                     name=tool_info["name"],
                     description=tool_info["description"],
                     inputSchema=tool_info["schema"]
                 ))
-            logger.info(tools)
-        logger.info(f"Service tools: {service.tools}")
+        sizes = self.tool_payload_sizes(tools)
+        for name, size in sizes.items():
+            logger.debug(f"Tool {name}: {size} bytes")
+        logger.info(f"Tool catalog: {len(tools)} tools, {sum(sizes.values())} bytes")
         return tools
 
-    async def handle_tool_call(self, name: str, arguments: dict) -> dict:
-        """Route tool calls to appropriate service handlers"""
+    def get_all_tools(self) -> list[Tool]:
+        """Collect all tools from registered services"""
+        logger.debug(f"Listing {len(self._tools)} tools")
+        return list(self._tools)
+
+    @staticmethod
+    def tool_payload_sizes(tools: list[Tool]) -> Dict[str, int]:
+        """Serialized size of each tool definition, as sent to the model"""
+        return {
+            tool.name: len(json.dumps(tool.model_dump(exclude_none=True), separators=(",", ":")))
+            for tool in tools
+        }
+
+    async def handle_tool_call(self, name: str, arguments: dict, session=None, timeout: float | None = None) -> dict:
+        """Route tool calls to appropriate service handlers
+
+        With a session, only tools in the session's scope can be called. Once
+        shutdown has begun, new calls are refused and running ones are counted
+        until they finish. A call still running after timeout seconds (or
+        TOOL_TIMEOUT, whichever is shorter) is cancelled along with the
+        requests it has open, and fails with TimeoutError.
+        """
+        if _in_tool_call.get():
+            # Nested calls (plan steps, rules fired by one) share the outer call's deadline
+            return await self._handle_tool_call(name, arguments, session)
+        if not self._accepting:
+            raise ValueError("Server is shutting down")
+        if self._poller is not None:
+            self._poller.touch()
+        timeout = min((t for t in (timeout, TOOL_TIMEOUT) if t), default=None)
+        self._in_flight += 1
+        self._idle.clear()
+        token = _in_tool_call.set(True)
         try:
-            domain, service = name.split("-", 1)
-            # logger.info(f"\n\n{domain}, {service}")
-            domain_enum = EntityDomain(domain)
-            # logger.info(f"{domain_enum}")
-            
-            if domain_enum not in self._services:
-                raise ValueError(f"Unsupported domain: {domain}")
-                
-            service_handler = self._services[domain_enum]
-            method = getattr(service_handler, service, None)
-            
-            if not method:
-                raise ValueError(f"Unsupported service {service} for domain {domain}")
-                
-            return await method(**arguments)
-        except Exception as e:
-            logger.error(f"Error handling tool call: {e}")
+            async with asyncio.timeout(timeout) as deadline:
+                await self._wait_for_warm_up()
+                return await self._handle_tool_call(name, arguments, session)
+        except TimeoutError:
+            if not deadline.expired():
+                raise
+            self._expired_calls.inc()
+            raise TimeoutError(f"Tool call {name} did not finish within {timeout:g}s") from None
+        except asyncio.CancelledError:
+            self._cancelled_calls.inc()
             raise
+        finally:
+            _in_tool_call.reset(token)
+            self._in_flight -= 1
+            if not self._in_flight:
+                self._idle.set()
+
+    async def _handle_tool_call(self, name: str, arguments: dict, session) -> dict:
+        with tracer.span("handle_tool_call", tool=name, entity_id=arguments.get("entity_id")):
+            try:
+                with tracer.span("tool.validate", tool=name):
+                    if session is not None and not await self._scopes.is_visible(session, name):
+                        raise ValueError(f"Tool {name} is not in this session's scope")
+                    if name in self._tool_schemas:
+                        validate(self._tool_schemas[name], arguments)
+                    if name == SCOPE_TOOL:
+                        return await self._set_tool_scope(session, arguments)
+                    method = self._resolve_tool(name)
+                    # Plan steps and rule actions are limited to the tools of the session; passed
+                    # apart from the arguments, which could otherwise replace it
+                    context = {"session": session} if name in SESSION_TOOLS else {}
+                if self._prefetcher is not None and not self._state_cache.live:
+                    entity_id = self._entity_of(name, arguments)
+                    if entity_id is not None:
+                        self._prefetcher.observe(entity_id, session)
+                return await profiler.measure(name, method(**arguments, **context))
+            except Exception as e:
+                logger.error(f"Error handling tool call: {e}")
+                raise
+
+    async def _set_tool_scope(self, session, settings: dict) -> dict:
+        """Replace a session's tool profile and tell the client if its tools changed"""
+        if session is None:
+            raise ValueError(f"{SCOPE_TOOL} requires a client session")
+        if await self._scopes.set_scope(session, settings):
+            await session.send_tool_list_changed()
+        tools = await self._scopes.visible_tools(session)
+        return {"scope": self._scopes.profile(session).to_dict(), "tools": [tool.name for tool in tools]}
+
+    def _entity_of(self, name: str, arguments: dict) -> str | None:
+        """Full ID of the entity a tool call targets, if any"""
+        entity_id = arguments.get("entity_id")
+        if not isinstance(entity_id, str):
+            return None
+        domain = self._tool_domains.get(name)
+        if domain is None:
+            return entity_id if "." in entity_id else None
+        return f"{domain}.{entity_id}"
+
+    def _resolve_tool(self, name: str):
+        """Find the handler method of a tool"""
+        if name in self._tool_handlers:
+            return self._tool_handlers[name]
+
+        domain, service = name.split("-", 1)
+        # logger.info(f"\n\n{domain}, {service}")
+        domain_enum = EntityDomain(domain)
+        # logger.info(f"{domain_enum}")
+
+        if domain_enum not in self._services:
+            raise ValueError(f"Unsupported domain: {domain}")
+
+        service_handler = self._services[domain_enum]
+        method = getattr(service_handler, service, None)
+
+        if not method:
+            raise ValueError(f"Unsupported service {service} for domain {domain}")
+        return method
 
 async def main() -> None:
-    server = Server("home-assistant-server")
+    log_listener = configure_logging(LOG_LEVEL, LOG_SAMPLING, LOG_RATE_LIMITS)
+    stdout = anyio.wrap_file(protect_stdout())
+    if TRACE_FILE:
+        tracer.configure(JsonLinesExporter(TRACE_FILE), TRACE_SAMPLE_RATE)
     ha_server = HomeAssistantMcpServer()
+    await ha_server.start()
+    try:
+        if TRANSPORT == "tcp":
+            await serve_tcp(ha_server)
+        else:
+            await serve_stdio(ha_server, stdout)
+    finally:
+        await ha_server.stop()
+        tracer.shutdown()
+        log_listener.stop()
+
+
+async def serve_tcp(ha_server: HomeAssistantMcpServer) -> None:
+    """Serve MCP over TCP until SIGTERM or cancellation, then drain in-flight requests"""
+    transport = TcpTransport(
+        ha_server,
+        host=TCP_HOST,
+        port=TCP_PORT,
+        max_in_flight=TCP_MAX_IN_FLIGHT,
+        idle_timeout=TCP_IDLE_TIMEOUT,
+        compression=TCP_COMPRESSION,
+        compress_min_bytes=TCP_COMPRESS_MIN_BYTES
+    )
+    loop = asyncio.get_running_loop()
+    terminated = asyncio.Event()
+    try:
+        loop.add_signal_handler(signal.SIGTERM, terminated.set)
+        handles_sigterm = True
+    except NotImplementedError:
+        # No signal handlers on Windows event loops
+        handles_sigterm = False
+    try:
+        await transport.start()
+        await terminated.wait()
+        logger.info("Received SIGTERM, shutting down")
+    finally:
+        ha_server.begin_shutdown()
+        await transport.close(drain_timeout=DRAIN_TIMEOUT)
+        if handles_sigterm:
+            loop.remove_signal_handler(signal.SIGTERM)
+
+
+async def serve_stdio(ha_server: HomeAssistantMcpServer, stdout) -> None:
+    """Serve MCP over stdio until the client disconnects"""
+    server = Server("home-assistant-server")
 
-    @server.list_tools()
-    async def list_tools() -> list[Tool]:
-        """List available home assistant tools."""
-        return ha_server.get_all_tools()
+    async def list_tools(request: types.ListToolsRequest) -> types.ServerResult:
+        """List the home assistant tools in the session's scope, one page at a time."""
+        # mcp 1.0 drops params.cursor while parsing, so a client could never fetch the
+        # second page; only paginate with an SDK whose request params carry the cursor
+        paginate = request.params is not None and "cursor" in type(request.params).model_fields
+        cursor = request.params.cursor if paginate else None
+        tools, next_cursor = await ha_server.list_tools(server.request_context.session, cursor, paginate)
+        return types.ServerResult(types.ListToolsResult(tools=tools, nextCursor=next_cursor))
+
+    # Registered directly: the list_tools decorator neither passes the cursor nor the session
+    server.request_handlers[types.ListToolsRequest] = list_tools
 
     @server.call_tool()
     async def call_tool(
@@ -153,19 +826,49 @@ async def main() -> None:
         arguments: dict
     ) -> Sequence[TextContent | ImageContent | EmbeddedResource]:
         """Handle tool calls for home assistant controls."""
-        try:
-            result = await ha_server.handle_tool_call(name, arguments)
-            return [TextContent(
-                type="text",
-                text=json.dumps(result, indent=2)
-            )]
-        except Exception as e:
-            raise ValueError(f"Error processing home-assistant query: {str(e)}")
+        with tracer.span("mcp.call_tool", tool=name) as span:
+            try:
+                # mcp 1.0 can't cancel a stdio request, but a request can still carry a deadline
+                meta = server.request_context.meta
+                timeout = (meta.model_extra or {}).get(TIMEOUT_META) if meta is not None else None
+                result = await ha_server.handle_tool_call(
+                    name, arguments, server.request_context.session, float(timeout) if timeout else None
+                )
+                text = json.dumps(result, indent=2)
+                span.set_attribute("response_bytes", len(text))
+                return [TextContent(
+                    type="text",
+                    text=text
+                )]
+            except Exception as e:
+                raise ValueError(f"Error processing home-assistant query: {str(e)}")
+
+    @server.list_resources()
+    async def list_resources() -> list[Resource]:
+        """List home assistant entity state resources."""
+        return ha_server.list_resources()
+
+    @server.read_resource()
+    async def read_resource(uri: AnyUrl) -> str:
+        """Read a home assistant entity state resource."""
+        return await ha_server.read_resource(str(uri))
+
+    @server.subscribe_resource()
+    async def subscribe_resource(uri: AnyUrl) -> None:
+        """Push update notifications for a resource to the calling session."""
+        ha_server.subscribe_resource(server.request_context.session, str(uri))
+
+    @server.unsubscribe_resource()
+    async def unsubscribe_resource(uri: AnyUrl) -> None:
+        """Stop update notifications for a resource."""
+        ha_server.unsubscribe_resource(server.request_context.session, str(uri))
 
-    options = server.create_initialization_options()
-    async with stdio_server() as (read_stream, write_stream):
+    options = server.create_initialization_options(NotificationOptions(tools_changed=True))
+    # The SDK always advertises subscribe=False; we do implement subscriptions
+    options.capabilities.resources.subscribe = True
+    async with stdio_server(stdout=stdout) as (read_stream, write_stream):
+        logger.info("Server running")
         await server.run(read_stream, write_stream, options)
-    logger.info("Server running")
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -1,9 +1,87 @@
-from typing import TypeVar, Generic, Dict, Any
+from functools import lru_cache
+import copy
+from typing import TypeVar, Generic, Dict, Any, ClassVar, List, Tuple
+from pydantic import BaseModel
 from ..models.entity import EntityDomain, EntityDescription, BaseEntityState
+from ..tracing import tracer
 
 StateT = TypeVar('StateT', bound=BaseEntityState)
 DescT = TypeVar('DescT', bound=EntityDescription)
 
+
+# Keywords whose value is a schema or a list of schemas, and those mapping names to schemas
+_SUBSCHEMAS = {"items", "prefixItems", "additionalProperties", "not", "anyOf", "allOf", "oneOf"}
+_SCHEMA_MAPS = {"properties", "patternProperties"}
+
+
+def _compact(node: Any, defs: Dict[str, Any]) -> Any:
+    """Strip a pydantic JSON Schema down to what a model needs to call a tool"""
+    if isinstance(node, list):
+        return [_compact(item, defs) for item in node]
+    if not isinstance(node, dict):
+        return node
+    node = dict(node)
+    ref = node.pop("$ref", None)
+    if ref is not None:
+        # Definitions are inlined; the class docstring of an enum is not a useful description
+        definition = {k: v for k, v in defs[ref.rsplit("/", 1)[1]].items() if k != "description"}
+        node = {**definition, **node}
+    any_of = node.pop("anyOf", None)
+    if any_of is not None:
+        # Optional[X] is expressed by leaving the property out of "required"
+        options = [option for option in any_of if option != {"type": "null"}]
+        if len(options) == 1:
+            node = {**options[0], **node}
+        else:
+            node["anyOf"] = options
+    node.pop("title", None)
+    if node.get("default", 0) is None:
+        del node["default"]
+    # Only descend into subschemas: a property named "title" is not an annotation to strip
+    for key, value in node.items():
+        if key in _SUBSCHEMAS:
+            node[key] = _compact(value, defs)
+        elif key in _SCHEMA_MAPS and isinstance(value, dict):
+            node[key] = {name: _compact(schema, defs) for name, schema in value.items()}
+    return node
+
+
+@lru_cache(maxsize=None)
+def _model_properties(model: type[BaseModel]) -> Dict[str, Dict[str, Any]]:
+    schema = model.model_json_schema()
+    defs = schema.get("$defs", {})
+    return {name: _compact(prop, defs) for name, prop in schema["properties"].items()}
+
+
+@lru_cache(maxsize=None)
+def _tool_schema(model: type[BaseModel], fields: Tuple[str, ...]) -> Dict[str, Any]:
+    properties = _model_properties(model)
+    schema = {"type": "object", "properties": {name: properties[name] for name in fields}}
+    required = [name for name in fields if model.model_fields[name].is_required()]
+    if required:
+        schema["required"] = required
+    return schema
+
+
+class ControlModel(BaseModel):
+    """Arguments accepted by a domain's tools
+
+    Tool input schemas are derived from the fields: `entity_id` plus the fields
+    of each requested feature. A schema is generated once per feature set;
+    each tool gets its own copy, so changing one tool's schema leaves the
+    others alone.
+    """
+    features: ClassVar[Dict[str, List[str]]] = {}
+
+    @classmethod
+    def get_llm_schema(cls, supported_features: List[str] = None) -> dict:
+        """JSON Schema for a tool taking an entity and the given features"""
+        fields = ["entity_id"]
+        for feature in supported_features or ():
+            fields.extend(cls.features[feature])
+        return copy.deepcopy(_tool_schema(cls, tuple(fields)))
+
+
 class BaseService(Generic[StateT, DescT]):
     domain: EntityDomain
     tools: Dict[str, Dict[str, Any]]
@@ -14,7 +92,8 @@ class BaseService(Generic[StateT, DescT]):
         
     async def call_domain_service(self, service: str, data: dict) -> dict:
         """Call a service within this domain"""
-        return await self._call_service(self.domain, service, data)
+        with tracer.span("call_domain_service", domain=self.domain.value, service=service, entity_id=data.get("entity_id")):
+            return await self._call_service(self.domain, service, data)
         
     async def get_entity_state(self, entity_id: str) -> dict:
         """Get state for an entity in this domain"""
@@ -1,61 +1,22 @@
-from typing import Dict, Any, List
-from pydantic import BaseModel
+from typing import Dict, Optional
+from pydantic import Field
 from ..models.alarm_control_panel import AlarmControlPanelState, AlarmControlPanelAttributes, AlarmControlPanelMode, AlarmControlPanelDescription
 from ..models.entity import EntityDomain
-from ._base import BaseService
+from ._base import BaseService, ControlModel
 
 import logging
 logger = logging.getLogger(__name__)
 
-class AlarmControlPanelControl(BaseModel):
-    entity_id: str
+class AlarmControlPanelControl(ControlModel):
+    entity_id: str = Field(description="Alarm panel ID, e.g. alarm_control_panel")
+    code: Optional[str] = Field(None, description="Alarm code, if one is required")
+    alarm_mode: AlarmControlPanelMode = Field(description="Mode to set")
+
+    features = {
+        "code": ["code"],
+        "alarm_mode": ["alarm_mode"],
+    }
 
-    @classmethod
-    def get_llm_schema(cls, supported_features: List[str] = None) -> dict:
-        """Generate schema based on supported features
-        
-        Args:
-            supported_features: List of feature names to include in schema
-        """
-        # Base schema always includes entity_id
-        schema = {
-            "type": "object",
-            "parameters": {
-                "entity_id": {
-                    "type": "string",
-                    "description": "The ID of the light to control"
-                }
-            },
-            "required": ["entity_id"]
-        }
-        
-        # Feature-specific schema additions
-        feature_schemas = {
-            "alarm_mode": {
-                "alarm_mode": {
-                    "type": "string",
-                    "description": "The mode of the alarm control panel",
-                    "enum": [mode.value for mode in AlarmControlPanelMode],
-                    "optional": False
-                }
-            },
-            "code": {
-                "code": {
-                    "type": "string",
-                    "description": "The code to arm the alarm control panel",
-                    "optional": True
-                }
-            }
-        }
-    
-        # Add properties based on supported features
-        if supported_features:
-            for feature in supported_features:
-                if feature in feature_schemas:
-                    schema["parameters"].update(feature_schemas[feature])
-        
-        return schema
-    
 class AlarmControlPanelService(BaseService[AlarmControlPanelState, AlarmControlPanelDescription]):
     """Service for controlling alarm control panel entities"""
     domain = EntityDomain.ALARM_CONTROL_PANEL
@@ -1,52 +1,19 @@
-from typing import Dict, Any, List
-from pydantic import BaseModel
+from typing import Dict
+from pydantic import Field
 from ..models.climate import ClimateState, ClimateAttributes, ClimateDescription
 from ..models.entity import EntityDomain
-from ._base import BaseService
+from ._base import BaseService, ControlModel
 
 import logging
 logger = logging.getLogger(__name__)
 
-class ClimateControl(BaseModel):
-    entity_id: str
+class ClimateControl(ControlModel):
+    entity_id: str = Field(description="Climate ID, e.g. climate")
+    temperature: int = Field(description="Target temperature in °F")
 
-    @classmethod
-    def get_llm_schema(cls, supported_features: List[str] = None) -> dict:
-        """Generate schema based on supported features
-        
-        Args:
-            supported_features: List of feature names to include in schema
-        """
-        # Base schema always includes entity_id
-        schema = {
-            "type": "object",
-            "parameters": {
-                "entity_id": {
-                    "type": "string",
-                    "description": "The ID of the climate entity to control"
-                }
-            },
-            "required": ["entity_id"]
-        }
-        
-        # Feature-specific schema additions
-        feature_schemas = {
-            "temperature": {
-                "temperature": {
-                    "type": "integer",
-                    "description": "The target temperature in degrees Fahrenheit",
-                    "optional": True
-                }
-            }
-        }
-        
-        # Add properties based on supported features
-        if supported_features:
-            for feature in supported_features:
-                if feature in feature_schemas:
-                    schema["parameters"].update(feature_schemas[feature])
-
-        return schema
+    features = {
+        "temperature": ["temperature"],
+    }
 
 class ClimateService(BaseService[ClimateState, ClimateDescription]):
   """Climate domain service handler"""
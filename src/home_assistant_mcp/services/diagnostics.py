@@ -0,0 +1,49 @@
+from typing import Any, Dict
+import asyncio
+
+from ..profiling import Profiler
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class DiagnosticsService:
+    """Control the server's own profiler"""
+
+    tools = {
+        "profile": {
+            "name": "profile",
+            "description": "Diagnose a slow server: start or stop sampling the event loop, show per-tool CPU "
+                           "and wall time and blocking callbacks (status), or write flame graph input to the "
+                           "server's profile directory (dump).",
+            "schema": {
+                "type": "object",
+                "properties": {
+                    "action": {"type": "string", "enum": ["start", "stop", "status", "dump"]},
+                    "sample_rate": {
+                        "type": "number",
+                        "description": "Fraction of tool calls to time when starting"
+                    }
+                },
+                "required": ["action"]
+            }
+        }
+    }
+
+    def __init__(self, profiler: Profiler, directory: str, interval: float = 0.01, slow_callback: float = 0.1):
+        self._profiler = profiler
+        self._directory = directory
+        self._interval = interval
+        self._slow_callback = slow_callback
+
+    async def profile(self, action: str, sample_rate: float = 1.0) -> Dict[str, Any]:
+        """Start, stop, summarize or dump the profile"""
+        if action == "start":
+            self._profiler.start(min(max(float(sample_rate), 0.0), 1.0), self._interval, self._slow_callback)
+        elif action == "stop":
+            await self._profiler.stop()
+        elif action == "dump":
+            return {**await asyncio.to_thread(self._profiler.dump, self._directory), "running": self._profiler.running}
+        elif action != "status":
+            raise ValueError(f"Unknown profile action {action}")
+        return self._profiler.summary()
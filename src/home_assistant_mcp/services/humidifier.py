@@ -1,52 +1,19 @@
-from typing import Dict, Any, List
-from pydantic import BaseModel
+from typing import Dict
+from pydantic import Field
 from ..models.humidifier import HumidifierState, HumidifierAttributes, HumidifierDescription
 from ..models.entity import EntityDomain
-from ._base import BaseService
+from ._base import BaseService, ControlModel
 
 import logging
 logger = logging.getLogger(__name__)
 
-class HumidifierControl(BaseModel):
-    entity_id: str
+class HumidifierControl(ControlModel):
+    entity_id: str = Field(description="Humidifier ID, e.g. humidifier")
+    humidity: int = Field(ge=0, le=100, description="Target humidity percent")
 
-    @classmethod
-    def get_llm_schema(cls, supported_features: List[str] = None) -> dict:
-        """Generate schema based on supported features
-        
-        Args:
-            supported_features: List of feature names to include in schema
-        """
-        # Base schema always includes entity_id
-        schema = {
-            "type": "object",
-            "parameters": {
-                "entity_id": {
-                    "type": "string",
-                    "description": "The ID of the humidifier entity to control"
-                }
-            },
-            "required": ["entity_id"]
-        }
-        
-        # Feature-specific schema additions
-        feature_schemas = {
-            "humidity": {
-                "humidity": {
-                    "type": "int",
-                    "description": "The target percentage humidity",
-                    "optional": True
-                }
-            }
-        }
-        
-        # Add properties based on supported features
-        if supported_features:
-            for feature in supported_features:
-                if feature in feature_schemas:
-                    schema["parameters"].update(feature_schemas[feature])
-
-        return schema
+    features = {
+        "humidity": ["humidity"],
+    }
 
 class HumidifierService(BaseService[HumidifierState, HumidifierDescription]):
   """Humidifier domain service handler"""
@@ -64,8 +31,8 @@ class HumidifierService(BaseService[HumidifierState, HumidifierDescription]):
           "schema": HumidifierControl.get_llm_schema()
       }, 
       "set_humidity": {
-          "name": "humidifier-set_temperature",
-          "description": "Set the temperature of a humidifier entity",
+          "name": "humidifier-set_humidity",
+          "description": "Set the target humidity of a humidifier entity",
           "schema": HumidifierControl.get_llm_schema(["humidity"])
       },
       # "set_mode": {
@@ -76,19 +43,19 @@ class HumidifierService(BaseService[HumidifierState, HumidifierDescription]):
   }
 
   async def turn_on(self, entity_id: str) -> dict:
-      """Turn on a humdifier"""
-      data = {"entity_id": f"humdifier.{entity_id}"}
+      """Turn on a humidifier"""
+      data = {"entity_id": f"humidifier.{entity_id}"}
       return await self.call_domain_service("turn_on", data)
 
   async def turn_off(self, entity_id: str) -> dict:
-      """Turn off a humdifier"""
-      data = {"entity_id": f"humdifier.{entity_id}"}
+      """Turn off a humidifier"""
+      data = {"entity_id": f"humidifier.{entity_id}"}
       return await self.call_domain_service("turn_off", data)
 
   async def set_humidity(self, entity_id: str, humidity: int) -> dict:
-      """Set the temperature of a humidifier entity"""
-      data = {"entity_id": f"humdifier.{entity_id}", "humidity": humidity}
-      logger.info(data)
+      """Set the target humidity of a humidifier entity"""
+      data = {"entity_id": f"humidifier.{entity_id}", "humidity": humidity}
+      logger.debug(f"Setting humidity of {entity_id} to {humidity}")
       return await self.call_domain_service("set_humidity", data)
 
   async def get_state(self, entity_id: str) -> dict:
@@ -1,77 +1,20 @@
-from typing import Dict, Any, List
-from pydantic import BaseModel
+from typing import Annotated, Dict, List, Optional
+from pydantic import Field
 from ..models.light import LightState, LightAttributes, LightDescription
 from ..models.entity import EntityDomain
-from ._base import BaseService
+from ._base import BaseService, ControlModel
 
-class LightControl(BaseModel):
-    entity_id: str
-    brightness_pct: int | None = None
-    rgb_color: tuple[int, int, int] | None = None
-    color_temp: int | None = None
+class LightControl(ControlModel):
+    entity_id: str = Field(description="Light ID, e.g. ceiling_lights")
+    brightness_pct: Optional[int] = Field(None, ge=0, le=100, description="Brightness percent")
+    rgb_color: Optional[List[Annotated[int, Field(ge=0, le=255)]]] = Field(None, min_length=3, max_length=3, description="[red, green, blue]")
+    color_temp: Optional[int] = Field(None, ge=2000, le=6500, description="Color temperature in Kelvin")
 
-    @classmethod
-    def get_llm_schema(cls, supported_features: List[str] = None) -> dict:
-        """Generate schema based on supported features
-        
-        Args:
-            supported_features: List of feature names to include in schema
-        """
-        # Base schema always includes entity_id
-        schema = {
-            "type": "object",
-            "parameters": {
-                "entity_id": {
-                    "type": "string",
-                    "description": "The ID of the light to control"
-                }
-            },
-            "required": ["entity_id"]
-        }
-        
-        # Feature-specific schema additions
-        feature_schemas = {
-            "brightness": {
-                "brightness_pct": {
-                    "type": "integer",
-                    "description": "Brightness level (0-100)",
-                    "minimum": 0,
-                    "maximum": 100,
-                    "optional": True
-                }
-            },
-            "color": {
-                "rgb_color": {
-                    "type": "array",
-                    "description": "RGB color values [red, green, blue]",
-                    "items": {
-                        "type": "integer",
-                        "minimum": 0,
-                        "maximum": 255
-                    },
-                    "minItems": 3,
-                    "maxItems": 3,
-                    "optional": True
-                }
-            },
-            "color_temp": {
-                "color_temp": {
-                    "type": "integer",
-                    "description": "Color temperature in Kelvin",
-                    "minimum": 2000,
-                    "maximum": 6500,
-                    "optional": True
-                }
-            }
-        }
-        
-        # Add properties based on supported features
-        if supported_features:
-            for feature in supported_features:
-                if feature in feature_schemas:
-                    schema["parameters"].update(feature_schemas[feature])
-        
-        return schema
+    features = {
+        "brightness": ["brightness_pct"],
+        "color": ["rgb_color"],
+        "color_temp": ["color_temp"],
+    }
 
 class LightService(BaseService[LightState, LightDescription]):
   """Light domain service handler"""
@@ -106,11 +49,21 @@ class LightService(BaseService[LightState, LightDescription]):
       # }
   }
 
-  async def turn_on(self, entity_id: str, brightness_pct: int = -1) -> dict:
-      """Turn on a light with optional brightness"""
+  async def turn_on(
+      self,
+      entity_id: str,
+      brightness_pct: int = -1,
+      rgb_color: List[int] | None = None,
+      color_temp: int | None = None
+  ) -> dict:
+      """Turn on a light with optional brightness and color"""
       data = {"entity_id": f"light.{entity_id}"}
       if 0 <= brightness_pct <= 100:
           data["brightness_pct"] = brightness_pct
+      if rgb_color is not None:
+          data["rgb_color"] = rgb_color
+      if color_temp is not None:
+          data["color_temp_kelvin"] = color_temp
       return await self.call_domain_service("turn_on", data)
 
   async def turn_off(self, entity_id: str) -> dict:
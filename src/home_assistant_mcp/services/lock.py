@@ -1,42 +1,11 @@
-from typing import Dict, Any, List
-from pydantic import BaseModel
+from typing import Dict
+from pydantic import Field
 from ..models.lock import LockState, LockAttributes, LockDescription
 from ..models.entity import EntityDomain
-from ._base import BaseService
+from ._base import BaseService, ControlModel
 
-class LockControl(BaseModel):
-    entity_id: str
-
-    @classmethod
-    def get_llm_schema(cls, supported_features: List[str] = None) -> dict:
-        """Generate schema based on supported features
-        
-        Args:
-            supported_features: List of feature names to include in schema
-        """
-        # Base schema always includes entity_id
-        schema = {
-            "type": "object",
-            "parameters": {
-                "entity_id": {
-                    "type": "string",
-                    "description": "The ID of the lock to control"
-                }
-            },
-            "required": ["entity_id"]
-        }
-        
-        # Feature-specific schema additions
-        feature_schemas = {
-        }
-        
-        # Add properties based on supported features
-        if supported_features:
-            for feature in supported_features:
-                if feature in feature_schemas:
-                    schema["parameters"].update(feature_schemas[feature])
-        
-        return schema
+class LockControl(ControlModel):
+    entity_id: str = Field(description="Lock ID, e.g. front_door")
 
 class LockService(BaseService[LockState, LockDescription]):
   """Lock domain service handler"""
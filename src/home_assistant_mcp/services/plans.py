@@ -0,0 +1,224 @@
+from typing import Any, Awaitable, Callable, Dict, List
+import asyncio
+import time
+
+from .rules import value_matches
+
+import logging
+logger = logging.getLogger(__name__)
+
+MAX_STEPS = 32
+MAX_PLAN_SECONDS = 300
+DEFAULT_STEP_TIMEOUT = 30
+
+
+def _states_of(result: Any) -> List[dict]:
+    """Entity states in a tool result: changed states of a service call, or a (waited for) state"""
+    if isinstance(result, list):
+        return [state for state in result if isinstance(state, dict) and "entity_id" in state]
+    if isinstance(result, dict):
+        if isinstance(result.get("state"), dict):
+            return [result["state"]]
+        if "entity_id" in result and "state" in result:
+            return [result]
+    return []
+
+
+class PlanService:
+    """Run a dependency graph of tool calls inside the server
+
+    Every step is a tool call made through the same dispatch path as a client
+    call. Steps start as soon as the steps they depend on have succeeded, so
+    independent steps run concurrently. A step can be conditional on the state
+    returned by an earlier step; when the condition does not hold, or an earlier
+    step failed, the step and everything depending on it is skipped. The result
+    is one summary with the status, duration and resulting states of each step.
+    """
+
+    tools = {
+        "execute_plan": {
+            "name": "execute_plan",
+            "description": "Run several tool calls in one go. Steps without dependencies run in parallel; "
+                           "a step can wait for others (after) and run only if an earlier step returned a "
+                           "matching state (when). Returns the outcome of every step.",
+            "schema": {
+                "type": "object",
+                "properties": {
+                    "steps": {
+                        "type": "array",
+                        "maxItems": MAX_STEPS,
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "id": {"type": "string", "description": "Step name, defaults to its position"},
+                                "tool": {"type": "string", "description": "Tool to call, e.g. lock-lock"},
+                                "arguments": {"type": "object"},
+                                "after": {
+                                    "type": "array",
+                                    "items": {"type": "string"},
+                                    "description": "Steps that must succeed first"
+                                },
+                                "when": {
+                                    "type": "object",
+                                    "description": "Run only if a state returned by an earlier step matches",
+                                    "properties": {
+                                        "step": {"type": "string"},
+                                        "entity_id": {"type": "string"},
+                                        "state": {
+                                            "anyOf": [
+                                                {"type": "string"},
+                                                {"type": "array", "items": {"type": "string"}}
+                                            ]
+                                        },
+                                        "attribute": {"type": "string"},
+                                        "above": {"type": "number"},
+                                        "below": {"type": "number"}
+                                    },
+                                    "required": ["step"]
+                                },
+                                "timeout": {
+                                    "type": "number",
+                                    "description": f"Seconds before the step fails (default {DEFAULT_STEP_TIMEOUT})"
+                                }
+                            },
+                            "required": ["tool"]
+                        }
+                    },
+                    "timeout": {
+                        "type": "number",
+                        "description": f"Seconds for the whole plan (max {MAX_PLAN_SECONDS})"
+                    }
+                },
+                "required": ["steps"]
+            }
+        }
+    }
+
+    def __init__(self, call_tool: Callable[[str, dict, Any], Awaitable[Any]]):
+        self._call_tool = call_tool
+
+    async def execute_plan(self, steps: List[dict], timeout: float | None = None, session=None) -> Dict[str, Any]:
+        """Validate the plan, run it and summarize the outcome of every step"""
+        plan = self._validate(steps)
+        timeout = min(float(timeout or MAX_PLAN_SECONDS), MAX_PLAN_SECONDS)
+        outcomes: Dict[str, Dict[str, Any]] = {}
+        results: Dict[str, Any] = {}
+        tasks: Dict[str, asyncio.Task] = {}
+        started = time.monotonic()
+
+        async def run(step: dict) -> bool:
+            step_id = step["id"]
+            dependencies = [tasks[d] for d in step["after"]]
+            if dependencies and not all(await asyncio.gather(*dependencies)):
+                outcomes[step_id] = {"status": "skipped", "reason": "an earlier step did not succeed"}
+                return False
+            when = step.get("when")
+            if when is not None and not self._condition_holds(when, results[when["step"]]):
+                outcomes[step_id] = {"status": "skipped", "reason": f"condition on {when['step']} not met"}
+                return False
+
+            step_started = time.monotonic()
+            try:
+                result = await asyncio.wait_for(
+                    self._call_tool(step["tool"], dict(step.get("arguments") or {}), session),
+                    float(step.get("timeout") or DEFAULT_STEP_TIMEOUT)
+                )
+            except asyncio.TimeoutError:
+                outcomes[step_id] = {"status": "timeout", "elapsed": round(time.monotonic() - step_started, 3)}
+                return False
+            except Exception as e:
+                outcomes[step_id] = {
+                    "status": "failed",
+                    "error": str(e),
+                    "elapsed": round(time.monotonic() - step_started, 3)
+                }
+                return False
+            results[step_id] = result
+            outcome = {"status": "ok", "elapsed": round(time.monotonic() - step_started, 3)}
+            states = _states_of(result)
+            if states:
+                outcome["states"] = {state["entity_id"]: state.get("state") for state in states}
+            else:
+                outcome["result"] = result
+            outcomes[step_id] = outcome
+            return True
+
+        # Steps are in dependency order, so every dependency's task already exists
+        for step in plan:
+            tasks[step["id"]] = asyncio.create_task(run(step))
+        try:
+            await asyncio.wait(tasks.values(), timeout=timeout)
+        finally:
+            pending = [task for task in tasks.values() if not task.done()]
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.wait(pending)
+        for step in plan:
+            outcomes.setdefault(step["id"], {"status": "cancelled", "reason": "plan timed out"})
+
+        return {
+            "ok": all(outcome["status"] in ("ok", "skipped") for outcome in outcomes.values()),
+            "elapsed": round(time.monotonic() - started, 3),
+            "steps": {step["id"]: outcomes[step["id"]] for step in plan}
+        }
+
+    def _validate(self, steps: List[dict]) -> List[dict]:
+        """Normalize the steps and order them so that dependencies come first"""
+        if not steps:
+            raise ValueError("A plan needs at least one step")
+        if len(steps) > MAX_STEPS:
+            raise ValueError(f"A plan can have at most {MAX_STEPS} steps")
+        by_id: Dict[str, dict] = {}
+        for index, step in enumerate(steps):
+            step = {**step, "id": str(step.get("id", index))}
+            if not step.get("tool"):
+                raise ValueError(f"Step {step['id']} has no tool")
+            if step["tool"] in self.tools:
+                raise ValueError(f"Plans cannot be nested (step {step['id']})")
+            after = list(step.get("after") or [])
+            when = step.get("when")
+            if when is not None and when["step"] not in after:
+                after.append(when["step"])
+            step["after"] = after
+            if step["id"] in by_id:
+                raise ValueError(f"Duplicate step id {step['id']}")
+            by_id[step["id"]] = step
+
+        ordered: List[dict] = []
+        visiting: Dict[str, bool] = {}
+
+        def visit(step_id: str, path: tuple) -> None:
+            if visiting.get(step_id) is False:
+                return
+            if step_id in visiting:
+                raise ValueError(f"Steps depend on each other: {' -> '.join((*path, step_id))}")
+            visiting[step_id] = True
+            for dependency in by_id[step_id]["after"]:
+                if dependency not in by_id:
+                    raise ValueError(f"Step {step_id} depends on unknown step {dependency}")
+                visit(dependency, (*path, step_id))
+            visiting[step_id] = False
+            ordered.append(by_id[step_id])
+
+        for step_id in by_id:
+            visit(step_id, ())
+        return ordered
+
+    @staticmethod
+    def _condition_holds(when: dict, result: Any) -> bool:
+        states = _states_of(result)
+        if "entity_id" in when:
+            states = [state for state in states if state["entity_id"] == when["entity_id"]]
+        if not states:
+            return False
+        state = states[0]
+        attribute = when.get("attribute")
+        value = state.get("state") if attribute is None else state.get("attributes", {}).get(attribute)
+        expected = when.get("state")
+        return value_matches(
+            value,
+            [expected] if isinstance(expected, str) else expected,
+            when.get("above"),
+            when.get("below")
+        )
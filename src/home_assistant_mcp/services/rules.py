@@ -0,0 +1,299 @@
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set
+import asyncio
+import itertools
+import time
+
+from ..metrics import metrics
+from ..profiles import ToolProfile, ToolScopes
+from ..state import StateCache, StateRecord
+from ..validation import validate
+
+import logging
+logger = logging.getLogger(__name__)
+
+MAX_RULES = 256
+# A rule fires at most once per interval, so two rules undoing each other cannot spin
+MIN_FIRE_INTERVAL_SECONDS = 1.0
+
+
+def value_matches(value: Any, states: Optional[List[str]], above: Optional[float], below: Optional[float]) -> bool:
+    """Whether a state or attribute value is one of states and within the numeric bounds"""
+    if states is not None and str(value) not in states:
+        return False
+    if above is not None or below is not None:
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            return False
+        if above is not None and not number > above:
+            return False
+        if below is not None and not number < below:
+            return False
+    return True
+
+
+class Rule:
+    """A condition on one entity and the tool call to make when it becomes true"""
+
+    __slots__ = (
+        "rule_id", "entity_id", "state", "attribute", "above", "below",
+        "tool", "arguments", "profile", "matched", "running", "fired", "last_fired", "last_error"
+    )
+
+    def __init__(
+        self,
+        rule_id: str,
+        entity_id: str,
+        tool: str,
+        arguments: Dict[str, Any],
+        state: Optional[List[str]] = None,
+        attribute: Optional[str] = None,
+        above: Optional[float] = None,
+        below: Optional[float] = None,
+        profile: Optional[ToolProfile] = None
+    ):
+        self.rule_id = rule_id
+        self.entity_id = entity_id
+        self.state = state
+        self.attribute = attribute
+        self.above = above
+        self.below = below
+        self.tool = tool
+        self.arguments = arguments
+        # Tool profile of the session that added the rule; its action must stay within it
+        self.profile = profile
+        self.matched = False
+        self.running = False
+        self.fired = 0
+        self.last_fired = 0.0
+        self.last_error: Optional[str] = None
+
+    def matches(self, record: Optional[StateRecord]) -> bool:
+        """Whether an entity state satisfies the condition"""
+        if record is None:
+            return False
+        value = record.state if self.attribute is None else record.attribute(self.attribute)
+        return value_matches(value, self.state, self.above, self.below)
+
+    def to_dict(self) -> Dict[str, Any]:
+        condition = {
+            key: getattr(self, key)
+            for key in ("state", "attribute", "above", "below")
+            if getattr(self, key) is not None
+        }
+        return {
+            "rule_id": self.rule_id,
+            "entity_id": self.entity_id,
+            "when": condition,
+            "then": {"tool": self.tool, "arguments": self.arguments},
+            "fired": self.fired,
+            "last_error": self.last_error
+        }
+
+
+class RuleService:
+    """Server-side reactions to state changes, evaluated without the model
+
+    Rules are indexed by the entity they watch, with one state cache listener
+    per watched entity, so a state change only evaluates the rules of that
+    entity. A rule fires when its condition goes from false to true and runs
+    its action through the same tool handlers a client would call. The action
+    must be in the tool scope of the session that added the rule, both when
+    it is added and each time it fires, and its arguments are checked against
+    the tool's input schema when it is added. Rules need a live state cache,
+    kept current by the event stream or by polling; without either the cache
+    never changes and nothing fires.
+    """
+
+    tools = {
+        "add_rule": {
+            "name": "add_rule",
+            "description": "React to a state change immediately, without asking the model: when the entity "
+                           "starts matching the condition, call the tool. E.g. when sensor.bathroom_humidity is "
+                           "above 65 call humidifier-turn_on, or when alarm_control_panel.home is armed_away "
+                           "call lock-lock for front_door.",
+            "schema": {
+                "type": "object",
+                "properties": {
+                    "entity_id": {
+                        "type": "string",
+                        "description": "Full entity ID to watch, e.g. sensor.bathroom_humidity"
+                    },
+                    "state": {
+                        "description": "State (or attribute value) to match, or a list of them",
+                        "anyOf": [
+                            {"type": "string"},
+                            {"type": "array", "items": {"type": "string"}}
+                        ]
+                    },
+                    "attribute": {
+                        "type": "string",
+                        "description": "Compare this attribute instead of the state"
+                    },
+                    "above": {
+                        "type": "number",
+                        "description": "Match numeric values greater than this"
+                    },
+                    "below": {
+                        "type": "number",
+                        "description": "Match numeric values less than this"
+                    },
+                    "tool": {
+                        "type": "string",
+                        "description": "Tool to call, e.g. lock-lock"
+                    },
+                    "arguments": {
+                        "type": "object",
+                        "description": "Arguments of the tool call"
+                    }
+                },
+                "required": ["entity_id", "tool"]
+            }
+        },
+        "list_rules": {
+            "name": "list_rules",
+            "description": "List the registered rules and how often each has fired",
+            "schema": {"type": "object", "properties": {}}
+        },
+        "remove_rule": {
+            "name": "remove_rule",
+            "description": "Remove a rule by its rule_id",
+            "schema": {
+                "type": "object",
+                "properties": {"rule_id": {"type": "string"}},
+                "required": ["rule_id"]
+            }
+        }
+    }
+
+    def __init__(
+        self,
+        state_cache: StateCache,
+        call_tool: Callable[[str, dict], Awaitable[Any]],
+        resolve_tool: Callable[[str], Any],
+        scopes: Optional[ToolScopes] = None,
+        blocked_tools: Iterable[str] = (),
+        tool_schemas: Optional[Dict[str, Dict[str, Any]]] = None
+    ):
+        self._state_cache = state_cache
+        self._call_tool = call_tool
+        self._resolve_tool = resolve_tool
+        self._scopes = scopes
+        # Tools that call other tools, and would run them outside the session's scope
+        self._blocked_tools = {*self.tools, *blocked_tools}
+        # Shared with the server, which fills it in as it builds the tool catalog
+        self._tool_schemas = tool_schemas if tool_schemas is not None else {}
+        self._rules: Dict[str, Rule] = {}
+        self._by_entity: Dict[str, List[Rule]] = {}
+        self._remove_listeners: Dict[str, Callable[[], None]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._ids = itertools.count(1)
+        self._fired = metrics.counter("rules.fired")
+        self._failed = metrics.counter("rules.failed")
+
+    async def add_rule(
+        self,
+        entity_id: str,
+        tool: str,
+        arguments: dict | None = None,
+        state: str | List[str] | None = None,
+        attribute: str | None = None,
+        above: float | None = None,
+        below: float | None = None,
+        session=None
+    ) -> Dict[str, Any]:
+        """Register a rule; it fires on the next change that makes its condition true"""
+        if "." not in entity_id:
+            raise ValueError(f"Expected a full entity ID like sensor.bathroom_humidity, got {entity_id}")
+        if state is None and above is None and below is None:
+            raise ValueError("One of state, above or below must be given")
+        if tool in self._blocked_tools:
+            raise ValueError(f"A rule cannot call {tool}")
+        self._resolve_tool(tool)
+        arguments = arguments or {}
+        if tool in self._tool_schemas:
+            # Bad arguments would otherwise only show up as last_error once the rule fires
+            validate(self._tool_schemas[tool], arguments)
+        profile = None
+        if self._scopes is not None:
+            profile = self._scopes.profile(session) if session is not None else None
+            if not await self._scopes.profile_allows(profile, tool):
+                raise ValueError(f"Tool {tool} is not in this session's scope")
+        if len(self._rules) >= MAX_RULES:
+            raise ValueError(f"At most {MAX_RULES} rules can be registered")
+
+        rule = Rule(
+            f"rule_{next(self._ids)}",
+            entity_id,
+            tool,
+            arguments,
+            state=[state] if isinstance(state, str) else state,
+            attribute=attribute,
+            above=above,
+            below=below,
+            profile=profile
+        )
+        # Only a change into the condition fires, not a state that already matches
+        rule.matched = rule.matches(self._state_cache.get_record(entity_id))
+        self._rules[rule.rule_id] = rule
+        rules = self._by_entity.setdefault(entity_id, [])
+        rules.append(rule)
+        if entity_id not in self._remove_listeners:
+            self._remove_listeners[entity_id] = self._state_cache.add_listener(self._on_state_changed, entity_id)
+        logger.info(f"Added {rule.rule_id}: {entity_id} -> {tool}")
+        return {**rule.to_dict(), "live": self._state_cache.live}
+
+    async def list_rules(self) -> Dict[str, Any]:
+        """Every registered rule"""
+        return {"rules": [rule.to_dict() for rule in self._rules.values()], "live": self._state_cache.live}
+
+    async def remove_rule(self, rule_id: str) -> Dict[str, Any]:
+        """Remove a rule and stop watching its entity if no other rule does"""
+        rule = self._rules.pop(rule_id, None)
+        if rule is None:
+            raise ValueError(f"Unknown rule {rule_id}")
+        rules = self._by_entity[rule.entity_id]
+        rules.remove(rule)
+        if not rules:
+            del self._by_entity[rule.entity_id]
+            self._remove_listeners.pop(rule.entity_id)()
+        return {"removed": rule_id}
+
+    async def stop(self) -> None:
+        """Wait for running actions to finish"""
+        if self._tasks:
+            await asyncio.wait(set(self._tasks))
+
+    def _on_state_changed(self, entity_id: str, old_state: Optional[StateRecord], new_state: Optional[StateRecord]) -> None:
+        for rule in self._by_entity.get(entity_id, ()):
+            matched = rule.matches(new_state)
+            if matched and not rule.matched:
+                self._fire(rule)
+            rule.matched = matched
+
+    def _fire(self, rule: Rule) -> None:
+        now = time.monotonic()
+        if rule.running or now - rule.last_fired < MIN_FIRE_INTERVAL_SECONDS:
+            logger.debug(f"Not firing {rule.rule_id}: fired {now - rule.last_fired:.2f}s ago")
+            return
+        rule.running = True
+        rule.last_fired = now
+        task = asyncio.get_running_loop().create_task(self._run(rule))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, rule: Rule) -> None:
+        try:
+            if self._scopes is not None and not await self._scopes.profile_allows(rule.profile, rule.tool):
+                raise ValueError(f"Tool {rule.tool} is not in the scope the rule was added with")
+            await self._call_tool(rule.tool, dict(rule.arguments))
+            rule.fired += 1
+            rule.last_error = None
+            self._fired.inc()
+            logger.info(f"{rule.rule_id} fired: {rule.entity_id} -> {rule.tool}")
+        except Exception as e:
+            rule.last_error = str(e)
+            self._failed.inc()
+            logger.error(f"{rule.rule_id} failed to call {rule.tool}: {e}")
+        finally:
+            rule.running = False
@@ -0,0 +1,130 @@
+from typing import Any, Awaitable, Callable, Dict, List
+import asyncio
+
+from ..state import StateCache, StateRecord
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Upper bound for a single wait so a tool call cannot hang a session forever
+MAX_WAIT_SECONDS = 300
+# How often to re-read the state over REST when no event stream is live
+POLL_INTERVAL_SECONDS = 1.0
+
+
+def _state_predicate(state: str | List[str] | None, attribute: str | None, value: Any) -> Callable[[dict], bool]:
+    """Build a predicate matching a state dict against the requested condition"""
+    states = [state] if isinstance(state, str) else state
+
+    def matches(entity_state: dict) -> bool:
+        if states is not None and entity_state.get("state") not in states:
+            return False
+        if attribute is not None:
+            current = entity_state.get("attributes", {}).get(attribute)
+            if current != value and str(current) != str(value):
+                return False
+        return True
+    return matches
+
+
+class StateService:
+    """Server-level tools operating on entity state across domains"""
+
+    tools = {
+        "wait_for_state": {
+            "name": "wait_for_state",
+            "description": "Wait until an entity reaches a state (and optionally an attribute value), "
+                           "e.g. after lock-lock wait for 'locked'. Returns the final state and elapsed seconds.",
+            "schema": {
+                "type": "object",
+                "properties": {
+                    "entity_id": {
+                        "type": "string",
+                        "description": "Full entity ID, e.g. lock.front_door"
+                    },
+                    "state": {
+                        "description": "Target state, or a list of acceptable states",
+                        "anyOf": [
+                            {"type": "string"},
+                            {"type": "array", "items": {"type": "string"}}
+                        ]
+                    },
+                    "attribute": {
+                        "type": "string",
+                        "description": "Attribute that must equal value"
+                    },
+                    "value": {
+                        "description": "Expected attribute value"
+                    },
+                    "timeout": {
+                        "type": "number",
+                        "description": f"Seconds to wait (max {MAX_WAIT_SECONDS})",
+                        "default": 30
+                    }
+                },
+                "required": ["entity_id"]
+            }
+        }
+    }
+
+    def __init__(self, state_cache: StateCache, get_state: Callable[[str], Awaitable[dict]]):
+        self._state_cache = state_cache
+        self._get_state = get_state
+
+    async def wait_for_state(
+        self,
+        entity_id: str,
+        state: str | List[str] | None = None,
+        attribute: str | None = None,
+        value: Any = None,
+        timeout: float = 30
+    ) -> Dict[str, Any]:
+        """Suspend on state changes until the entity matches or the timeout expires"""
+        if "." not in entity_id:
+            raise ValueError(f"Expected a full entity ID like lock.front_door, got {entity_id}")
+        if state is None and attribute is None:
+            raise ValueError("Either state or attribute must be given")
+        matches = _state_predicate(state, attribute, value)
+        timeout = min(max(float(timeout), 0.0), MAX_WAIT_SECONDS)
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        matched = loop.create_future()
+
+        def on_change(changed_id: str, old_state: StateRecord | None, new_state: StateRecord | None) -> None:
+            if new_state is not None and not matched.done():
+                state = new_state.to_dict()
+                if matches(state):
+                    matched.set_result(state)
+
+        remove_listener = self._state_cache.add_listener(on_change, entity_id)
+        try:
+            current = await self._current_state(entity_id)
+            while not matches(current):
+                remaining = timeout - (loop.time() - started)
+                if remaining <= 0:
+                    return self._result(entity_id, False, current, loop.time() - started)
+                try:
+                    current = await asyncio.wait_for(
+                        asyncio.shield(matched),
+                        remaining if self._state_cache.live else min(remaining, POLL_INTERVAL_SECONDS)
+                    )
+                except asyncio.TimeoutError:
+                    current = await self._current_state(entity_id)
+            return self._result(entity_id, True, current, loop.time() - started)
+        finally:
+            remove_listener()
+
+    async def _current_state(self, entity_id: str) -> dict:
+        if self._state_cache.live and entity_id in self._state_cache:
+            return self._state_cache.get(entity_id)
+        return await self._get_state(entity_id)
+
+    @staticmethod
+    def _result(entity_id: str, matched: bool, state: dict, elapsed: float) -> Dict[str, Any]:
+        return {
+            "entity_id": entity_id,
+            "matched": matched,
+            "state": state,
+            "elapsed": round(elapsed, 3)
+        }
@@ -0,0 +1,70 @@
+from typing import Any, Awaitable, Callable, Dict
+import json
+import re
+
+from ..cache import TTLCache
+
+import logging
+logger = logging.getLogger(__name__)
+
+MAX_TEMPLATE_LENGTH = 10_000
+# Larger results are returned but not kept in memory
+MAX_CACHED_RESULT_BYTES = 64 * 1024
+
+# Templates using any of these render differently on every call and are never cached
+_VOLATILE_TEMPLATE = re.compile(
+    r"\b(now|utcnow|today_at|relative_time|time_since|time_until|random)\b"
+    r"|as_timestamp\(\s*\)"
+)
+
+
+def is_cacheable_template(template: str) -> bool:
+    """Whether a template is pure, i.e. depends only on entity states"""
+    return _VOLATILE_TEMPLATE.search(template) is None
+
+
+class TemplateService:
+    """Render Jinja templates server-side in Home Assistant"""
+
+    tools = {
+        "render_template": {
+            "name": "render_template",
+            "description": "Render a Home Assistant Jinja template to answer aggregate questions in one call, "
+                           "e.g. {{ states.lock | selectattr('state', 'eq', 'unlocked') | map(attribute='entity_id') | list }}",
+            "schema": {
+                "type": "object",
+                "properties": {
+                    "template": {
+                        "type": "string",
+                        "description": "Jinja template using Home Assistant template functions"
+                    },
+                    "variables": {
+                        "type": "object",
+                        "description": "Variables available to the template"
+                    }
+                },
+                "required": ["template"]
+            }
+        }
+    }
+
+    def __init__(self, render: Callable[[str, dict | None], Awaitable[str]], cache_ttl: float = 5.0, cache_size: int = 256):
+        self._render = render
+        self._cache: TTLCache[str, str] = TTLCache(max_entries=cache_size, ttl=cache_ttl)
+
+    async def render_template(self, template: str, variables: dict | None = None) -> Dict[str, Any]:
+        """Render a template, serving pure templates from a short-lived cache"""
+        if len(template) > MAX_TEMPLATE_LENGTH:
+            raise ValueError(f"Template exceeds {MAX_TEMPLATE_LENGTH} characters")
+
+        cacheable = is_cacheable_template(template)
+        key = json.dumps([template, variables], sort_keys=True, default=str)
+        if cacheable:
+            result = self._cache.get(key)
+            if result is not None:
+                return {"result": result, "cached": True}
+
+        result = await self._render(template, variables)
+        if cacheable and len(result.encode()) <= MAX_CACHED_RESULT_BYTES:
+            self._cache.set(key, result)
+        return {"result": result, "cached": False}
@@ -0,0 +1,810 @@
+"""Local Home Assistant simulator for tests and benchmarks
+
+Implements the parts of the REST and WebSocket APIs the server uses, over
+synthetic entities with realistic state transitions (locks pass through
+locking, alarms through arming), plus injectable latency, errors, outages and
+WebSocket disconnects. Use it in-process through `http_transport()`, or on a
+real socket (required for the WebSocket API) with `start()`:
+
+    python -m home_assistant_mcp.simulator --entities 5000 --port 8123
+"""
+from collections import Counter as Tally, deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, unquote
+import argparse
+import asyncio
+import gzip
+import json
+import random
+import time
+
+import httpx
+from websockets.frames import Frame, Opcode
+from websockets.protocol import State
+from websockets.server import ServerProtocol
+
+import logging
+logger = logging.getLogger(__name__)
+
+HA_VERSION = "2024.12.0"
+
+# Share of each domain among synthetic entities
+DOMAIN_WEIGHTS = {
+    "sensor": 40,
+    "binary_sensor": 20,
+    "light": 20,
+    "switch": 10,
+    "lock": 3,
+    "climate": 3,
+    "humidifier": 2,
+    "alarm_control_panel": 2,
+}
+SENSOR_CLASSES = [("temperature", "°F", 70.0), ("humidity", "%", 45.0), ("power", "W", 120.0), ("illuminance", "lx", 300.0)]
+TOGGLE_SERVICES = {"turn_on", "turn_off", "toggle"}
+ALARM_ARM_SERVICES = {
+    "alarm_arm_home": "armed_home",
+    "alarm_arm_away": "armed_away",
+    "alarm_arm_night": "armed_night",
+    "alarm_arm_vacation": "armed_vacation",
+    "alarm_arm_custom_bypass": "armed_custom_bypass",
+}
+
+SERVICES = {
+    "light": TOGGLE_SERVICES,
+    "switch": TOGGLE_SERVICES,
+    "lock": {"lock", "unlock"},
+    "climate": {"set_temperature", "set_hvac_mode", "turn_on", "turn_off"},
+    "humidifier": TOGGLE_SERVICES | {"set_humidity"},
+    "alarm_control_panel": {*ALARM_ARM_SERVICES, "alarm_disarm", "alarm_trigger"},
+}
+
+
+def _timestamp(seconds: float) -> str:
+    return datetime.fromtimestamp(seconds, timezone.utc).isoformat()
+
+
+class SimulatorError(Exception):
+    """An API error, reported as an HTTP status or a WebSocket error code"""
+
+    def __init__(self, status: int, message: str, code: str = "home_assistant_error"):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.code = code
+
+
+class _WebSocketSession:
+    """One client of the WebSocket API, framed by the websockets sans-I/O protocol"""
+
+    def __init__(self, protocol: ServerProtocol, writer: asyncio.StreamWriter):
+        self.protocol = protocol
+        self.writer = writer
+        self.authenticated = False
+        self.coalesce = False
+        self.subscriptions: Dict[int, Optional[str]] = {}
+        self._outbox: List[dict] = []
+
+    def send(self, message: dict) -> None:
+        if not self.coalesce:
+            self._write(json.dumps(message))
+            return
+        if not self._outbox:
+            asyncio.get_running_loop().call_soon(self._flush_outbox)
+        self._outbox.append(message)
+
+    def publish(self, event: dict) -> None:
+        for subscription, event_type in self.subscriptions.items():
+            if event_type in (None, event["event_type"]):
+                self.send({"id": subscription, "type": "event", "event": event})
+
+    def flush(self) -> None:
+        for data in self.protocol.data_to_send():
+            if self.writer.is_closing():
+                return
+            if data:
+                self.writer.write(data)
+            else:
+                # End of the close handshake: the server closes the TCP connection
+                self.writer.close()
+
+    def abort(self) -> None:
+        self.writer.transport.abort()
+
+    def _flush_outbox(self) -> None:
+        outbox, self._outbox = self._outbox, []
+        self._write(json.dumps(outbox[0] if len(outbox) == 1 else outbox))
+
+    def _write(self, text: str) -> None:
+        if self.writer.is_closing() or self.protocol.state is not State.OPEN:
+            return
+        self.protocol.send_text(text.encode())
+        self.flush()
+
+
+class _TemplateStates:
+    """The `states` object of Home Assistant templates"""
+
+    def __init__(self, simulator: "HomeAssistantSimulator", domain: Optional[str] = None):
+        self._simulator = simulator
+        self._domain = domain
+
+    def __call__(self, entity_id: str) -> str:
+        state = self._simulator.get_state(entity_id)
+        return state["state"] if state else "unknown"
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if self._domain is None:
+            return _TemplateStates(self._simulator, name)
+        return self._simulator.get_state(f"{self._domain}.{name}")
+
+    def __iter__(self):
+        states = self._simulator.all_states()
+        if self._domain is not None:
+            states = [s for s in states if s["entity_id"].startswith(f"{self._domain}.")]
+        return iter(sorted(states, key=lambda s: s["entity_id"]))
+
+
+class HomeAssistantSimulator:
+    """In-memory Home Assistant with the REST and WebSocket APIs
+
+    Starts with the entities the bundled services know (`light.ceiling_lights`,
+    `lock.front_door`, ...) plus `entities` synthetic ones spread over areas.
+    Everything random is drawn from one seeded generator, so a run is
+    reproducible. Fault knobs can be changed at any time: `latency` (mean
+    seconds per request, exponentially distributed), `error_rate`,
+    `available`, `fail_next()` and `disconnect_websockets()`. JSON responses
+    are gzipped for clients that accept it, as Home Assistant does, unless
+    `compression` is off.
+    """
+
+    def __init__(
+        self,
+        entities: int = 0,
+        seed: int = 0,
+        token: Optional[str] = None,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        transition_time: float = 0.2,
+        history_size: int = 100,
+        compression: bool = True
+    ):
+        self.token = token
+        self.compression = compression
+        self.latency = latency
+        self.error_rate = error_rate
+        self.available = True
+        self.transition_time = transition_time
+        self.alarm_code: Optional[str] = None
+        self.requests: Tally = Tally()
+        self._random = random.Random(seed)
+        self._history_size = history_size
+        self._states: Dict[str, dict] = {}
+        self._history: Dict[str, Deque[Tuple[float, dict]]] = {}
+        self._entity_areas: Dict[str, str] = {}
+        self._areas: Dict[str, str] = {}
+        self._failures: List[int] = []
+        self._transitions: Dict[str, asyncio.TimerHandle] = {}
+        # Context of the service call running, given to the states it changes
+        self._context: Optional[Dict[str, Any]] = None
+        self._sessions: Set[_WebSocketSession] = set()
+        self._writers: Set[asyncio.StreamWriter] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._activity: Optional[asyncio.Task] = None
+        self._server: Optional[asyncio.Server] = None
+        self.host = "127.0.0.1"
+        self.port = 0
+        self._add_default_entities()
+        self.generate(entities)
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def add_area(self, area_id: str, name: Optional[str] = None) -> None:
+        self._areas[area_id] = name or area_id.replace("_", " ").title()
+
+    def generate(self, count: int) -> None:
+        """Add synthetic entities, about 20 per area"""
+        if count <= 0:
+            return
+        domains = list(DOMAIN_WEIGHTS)
+        weights = list(DOMAIN_WEIGHTS.values())
+        areas = max(1, count // 20)
+        for index in range(areas):
+            self.add_area(f"area_{index:03d}")
+        for index in range(count):
+            domain = self._random.choices(domains, weights)[0]
+            state, attributes = self._initial_state(domain, index)
+            attributes["friendly_name"] = f"Simulated {domain.replace('_', ' ')} {index}"
+            self.set_state(f"{domain}.sim_{index:05d}", state, attributes, area=f"area_{index % areas:03d}")
+
+    def get_state(self, entity_id: str) -> Optional[dict]:
+        return self._states.get(entity_id)
+
+    def all_states(self) -> List[dict]:
+        return list(self._states.values())
+
+    def area_of(self, entity_id: str) -> Optional[str]:
+        return self._entity_areas.get(entity_id)
+
+    def area_entities(self, area: str) -> List[str]:
+        """Entities of an area, given its ID or name"""
+        area_id = next((a for a, name in self._areas.items() if area in (a, name)), None)
+        return [entity_id for entity_id, a in self._entity_areas.items() if a == area_id]
+
+    def set_state(
+        self,
+        entity_id: str,
+        state: str,
+        attributes: Optional[Dict[str, Any]] = None,
+        area: Optional[str] = None
+    ) -> dict:
+        """Set an entity state and fire state_changed if anything changed"""
+        now = time.time()
+        old = self._states.get(entity_id)
+        if attributes is None:
+            attributes = dict(old["attributes"]) if old else {}
+        if area is not None:
+            if area not in self._areas:
+                self.add_area(area)
+            self._entity_areas[entity_id] = area
+        if old is not None and old["state"] == state and old["attributes"] == attributes:
+            old["last_reported"] = _timestamp(now)
+            return old
+
+        changed = old is None or old["state"] != state
+        new = {
+            "entity_id": entity_id,
+            "state": state,
+            "attributes": attributes,
+            "last_changed": _timestamp(now) if changed else old["last_changed"],
+            "last_reported": _timestamp(now),
+            "last_updated": _timestamp(now),
+            "context": self._context or self._new_context()
+        }
+        self._states[entity_id] = new
+        history = self._history.get(entity_id)
+        if history is None:
+            history = self._history[entity_id] = deque(maxlen=self._history_size)
+        history.append((now, new))
+        self._fire("state_changed", {"entity_id": entity_id, "old_state": old, "new_state": new}, new["context"])
+        return new
+
+    def _new_context(self) -> Dict[str, Any]:
+        return {"id": f"{self._random.getrandbits(128):032x}", "parent_id": None, "user_id": None}
+
+    def remove_state(self, entity_id: str) -> None:
+        old = self._states.pop(entity_id, None)
+        if old is not None:
+            self._entity_areas.pop(entity_id, None)
+            self._fire("state_changed", {"entity_id": entity_id, "old_state": old, "new_state": None}, old["context"])
+
+    def _add_default_entities(self) -> None:
+        for area in ("living_room", "hallway", "basement"):
+            self.add_area(area)
+        self.set_state("light.ceiling_lights", "off", {
+            "friendly_name": "Ceiling Lights", "brightness": None, "supported_color_modes": ["color_temp", "rgb"]
+        }, area="living_room")
+        self.set_state("climate.climate", "heat", {
+            "friendly_name": "hvac", "temperature": 70, "current_temperature": 68, "hvac_modes": ["off", "heat", "cool", "auto"]
+        }, area="living_room")
+        self.set_state("lock.front_door", "locked", {"friendly_name": "Front door lock"}, area="hallway")
+        self.set_state("humidifier.humidifier", "on", {"friendly_name": "dehumidifier", "humidity": 45}, area="basement")
+        self.set_state("alarm_control_panel.alarm_control_panel", "disarmed", {
+            "friendly_name": "security", "code_format": None
+        }, area="hallway")
+
+    def _initial_state(self, domain: str, index: int) -> Tuple[str, Dict[str, Any]]:
+        if domain == "sensor":
+            device_class, unit, typical = SENSOR_CLASSES[index % len(SENSOR_CLASSES)]
+            value = round(typical * self._random.uniform(0.8, 1.2), 1)
+            return str(value), {"device_class": device_class, "unit_of_measurement": unit}
+        if domain == "binary_sensor":
+            return self._random.choice(["on", "off"]), {"device_class": "motion"}
+        if domain == "light":
+            on = self._random.random() < 0.3
+            return ("on" if on else "off"), {"brightness": self._random.randint(1, 255) if on else None}
+        if domain == "switch":
+            return self._random.choice(["on", "off"]), {}
+        if domain == "lock":
+            return "locked", {}
+        if domain == "climate":
+            return "heat", {"temperature": 70, "current_temperature": 68, "hvac_modes": ["off", "heat", "cool", "auto"]}
+        if domain == "humidifier":
+            return "on", {"humidity": 45}
+        return "disarmed", {"code_format": None}
+
+    def call_service(
+        self,
+        domain: str,
+        service: str,
+        data: Dict[str, Any],
+        context: Optional[Dict[str, Any]] = None
+    ) -> List[dict]:
+        """Run a service; returns the states it changed right away, which carry the call's context"""
+        if service not in SERVICES.get(domain, ()):
+            raise SimulatorError(400, "Service not found.", "not_found")
+        handler = getattr(self, f"_service_{domain}")
+        data = dict(data)
+        entity_ids = data.pop("entity_id", [])
+        entity_ids = [entity_ids] if isinstance(entity_ids, str) else list(entity_ids)
+        changed = []
+        self._context = context or self._new_context()
+        try:
+            for entity_id in entity_ids:
+                before = self._states.get(entity_id)
+                if before is None or not entity_id.startswith(f"{domain}."):
+                    continue
+                handler(entity_id, service, data)
+                if self._states[entity_id] is not before:
+                    changed.append(self._states[entity_id])
+        finally:
+            self._context = None
+        return changed
+
+    def _update(self, entity_id: str, state: Optional[str] = None, **attributes: Any) -> None:
+        current = self._states[entity_id]
+        self._cancel_transition(entity_id)
+        self.set_state(entity_id, state or current["state"], {**current["attributes"], **attributes})
+
+    def _transition(self, entity_id: str, intermediate: str, final: str) -> None:
+        """Pass through an intermediate state, as locks and alarms do"""
+        self._update(entity_id, intermediate)
+        if self.transition_time <= 0:
+            self._update(entity_id, final)
+            return
+        self._transitions[entity_id] = asyncio.get_running_loop().call_later(
+            self.transition_time, self._update, entity_id, final
+        )
+
+    def _cancel_transition(self, entity_id: str) -> None:
+        handle = self._transitions.pop(entity_id, None)
+        if handle is not None:
+            handle.cancel()
+
+    def _toggle(self, entity_id: str, service: str, on: Dict[str, Any], off: Dict[str, Any]) -> None:
+        if service == "toggle":
+            service = "turn_off" if self._states[entity_id]["state"] == "on" else "turn_on"
+        if service == "turn_on":
+            self._update(entity_id, "on", **on)
+        else:
+            self._update(entity_id, "off", **off)
+
+    def _service_light(self, entity_id: str, service: str, data: Dict[str, Any]) -> None:
+        on: Dict[str, Any] = {}
+        if "brightness_pct" in data:
+            on["brightness"] = round(255 * int(data["brightness_pct"]) / 100)
+        elif not self._states[entity_id]["attributes"].get("brightness"):
+            on["brightness"] = 255
+        if "rgb_color" in data:
+            on.update(rgb_color=list(data["rgb_color"]), color_mode="rgb")
+        if "color_temp_kelvin" in data:
+            on.update(color_temp_kelvin=int(data["color_temp_kelvin"]), color_mode="color_temp")
+        self._toggle(entity_id, service, on, {"brightness": None})
+
+    def _service_switch(self, entity_id: str, service: str, data: Dict[str, Any]) -> None:
+        self._toggle(entity_id, service, {}, {})
+
+    def _service_lock(self, entity_id: str, service: str, data: Dict[str, Any]) -> None:
+        if service == "lock":
+            self._transition(entity_id, "locking", "locked")
+        else:
+            self._transition(entity_id, "unlocking", "unlocked")
+
+    def _service_climate(self, entity_id: str, service: str, data: Dict[str, Any]) -> None:
+        if service == "set_temperature":
+            self._update(entity_id, temperature=data.get("temperature"))
+        elif service == "set_hvac_mode":
+            self._update(entity_id, data.get("hvac_mode"))
+        else:
+            self._update(entity_id, "heat" if service == "turn_on" else "off")
+
+    def _service_humidifier(self, entity_id: str, service: str, data: Dict[str, Any]) -> None:
+        if service == "set_humidity":
+            self._update(entity_id, humidity=data.get("humidity"))
+        else:
+            self._toggle(entity_id, service, {}, {})
+
+    def _service_alarm_control_panel(self, entity_id: str, service: str, data: Dict[str, Any]) -> None:
+        if self.alarm_code is not None and data.get("code") != self.alarm_code:
+            raise SimulatorError(400, "Invalid alarm code provided", "invalid_code")
+        if service == "alarm_disarm":
+            self._update(entity_id, "disarmed")
+        elif service == "alarm_trigger":
+            self._update(entity_id, "triggered")
+        else:
+            self._transition(entity_id, "arming", ALARM_ARM_SERVICES[service])
+
+    def start_activity(self, events_per_second: float) -> None:
+        """Change random entities in the background, like a busy house"""
+        if self._activity is None:
+            self._activity = asyncio.get_running_loop().create_task(self._run_activity(events_per_second))
+
+    async def stop_activity(self) -> None:
+        if self._activity is not None:
+            self._activity.cancel()
+            await asyncio.gather(self._activity, return_exceptions=True)
+            self._activity = None
+
+    async def _run_activity(self, events_per_second: float) -> None:
+        entity_ids = [e for e in self._states if e.split(".", 1)[0] in ("sensor", "binary_sensor", "light", "switch", "climate")]
+        while entity_ids:
+            await asyncio.sleep(self._random.expovariate(events_per_second))
+            self._tick(self._random.choice(entity_ids))
+
+    def _tick(self, entity_id: str) -> None:
+        state = self._states.get(entity_id)
+        if state is None:
+            return
+        domain = entity_id.split(".", 1)[0]
+        if domain == "sensor":
+            value = float(state["state"])
+            self._update(entity_id, str(round(value + self._random.gauss(0, max(abs(value) * 0.01, 0.1)), 1)))
+        elif domain == "binary_sensor":
+            self._update(entity_id, "off" if state["state"] == "on" else "on")
+        elif domain in ("light", "switch"):
+            getattr(self, f"_service_{domain}")(entity_id, "toggle", {})
+        elif domain == "climate":
+            attributes = state["attributes"]
+            current, target = attributes.get("current_temperature", 68), attributes.get("temperature") or 68
+            step = 0.5 if target > current else -0.5 if target < current else 0
+            self._update(entity_id, current_temperature=current + step)
+
+    def fail_next(self, count: int = 1, status: int = 500) -> None:
+        """Answer the next requests and commands with an error"""
+        self._failures.extend([status] * count)
+
+    def disconnect_websockets(self) -> None:
+        """Drop every WebSocket connection without a close handshake"""
+        for session in list(self._sessions):
+            session.abort()
+
+    async def _delay(self) -> None:
+        if self.latency > 0:
+            await asyncio.sleep(self._random.expovariate(1 / self.latency))
+
+    def _injected_failure(self) -> Optional[int]:
+        if self._failures:
+            return self._failures.pop(0)
+        if self.error_rate and self._random.random() < self.error_rate:
+            return 500
+        return None
+
+    def http_transport(self) -> httpx.MockTransport:
+        """An httpx transport answering from the simulator without a socket"""
+        async def handler(request: httpx.Request) -> httpx.Response:
+            if not self.available:
+                raise httpx.ConnectError("Simulated Home Assistant is unavailable", request=request)
+            status, content_type, body = await self.handle_http(
+                request.method, request.url.raw_path.decode(), request.headers, request.content
+            )
+            encoding, body = self.encode_body(request.headers, content_type, body)
+            headers = {"content-type": content_type}
+            if encoding is not None:
+                headers["content-encoding"] = encoding
+            return httpx.Response(status, headers=headers, content=body)
+        return httpx.MockTransport(handler)
+
+    async def handle_http(self, method: str, target: str, headers, body: bytes) -> Tuple[int, str, bytes]:
+        """Answer a REST request; returns status, content type and body"""
+        path, _, query = target.partition("?")
+        path = unquote(path)
+        self.requests[f"{method} {path}"] += 1
+        await self._delay()
+        if not self._authorized((headers.get("authorization") or "").removeprefix("Bearer ")):
+            return 401, "text/plain", b"401: Unauthorized"
+        failure = self._injected_failure()
+        if failure is not None:
+            return failure, "application/json", json.dumps({"message": "Simulated error"}).encode()
+        try:
+            status, payload = self._route(method, path, parse_qs(query), body)
+        except SimulatorError as e:
+            status, payload = e.status, {"message": e.message}
+        if isinstance(payload, str):
+            return status, "text/plain; charset=utf-8", payload.encode()
+        return status, "application/json", json.dumps(payload).encode()
+
+    def encode_body(self, headers, content_type: str, body: bytes) -> Tuple[Optional[str], bytes]:
+        """Compress a JSON response if the request accepts gzip"""
+        accepted = (headers.get("accept-encoding") or "").replace(" ", "").split(",")
+        if self.compression and content_type == "application/json" and "gzip" in accepted:
+            return "gzip", gzip.compress(body, compresslevel=5)
+        return None, body
+
+    def _authorized(self, token: str) -> bool:
+        return bool(token) and (self.token is None or token == self.token)
+
+    def _route(self, method: str, path: str, query: Dict[str, List[str]], body: bytes) -> Tuple[int, Any]:
+        if path in ("/api", "/api/"):
+            return 200, {"message": "API running."}
+        if path == "/api/config" and method == "GET":
+            return 200, self._config()
+        if path == "/api/states" and method == "GET":
+            return 200, self.all_states()
+        if path.startswith("/api/states/"):
+            entity_id = path[len("/api/states/"):]
+            if method == "GET":
+                state = self.get_state(entity_id)
+                if state is None:
+                    raise SimulatorError(404, "Entity not found.")
+                return 200, state
+            if method == "POST":
+                data = json.loads(body or b"{}")
+                if "state" not in data:
+                    raise SimulatorError(400, "No state specified.")
+                existed = entity_id in self._states
+                return (200 if existed else 201), self.set_state(entity_id, str(data["state"]), data.get("attributes") or {})
+        if path.startswith("/api/services/") and method == "POST":
+            domain, _, service = path[len("/api/services/"):].partition("/")
+            return 200, self.call_service(domain, service, json.loads(body or b"{}"))
+        if path.startswith("/api/history/period") and method == "GET":
+            return 200, self._history_period(path[len("/api/history/period"):].lstrip("/"), query)
+        if path == "/api/template" and method == "POST":
+            data = json.loads(body or b"{}")
+            return 200, self.render_template(data.get("template", ""), data.get("variables"))
+        raise SimulatorError(404, "Not found")
+
+    def _config(self) -> Dict[str, Any]:
+        domains = sorted({entity_id.split(".", 1)[0] for entity_id in self._states})
+        return {"version": HA_VERSION, "location_name": "Simulator", "components": domains, "state": "RUNNING"}
+
+    def _history_period(self, start: str, query: Dict[str, List[str]]) -> List[List[dict]]:
+        entity_ids = [e for value in query.get("filter_entity_id", []) for e in value.split(",") if e]
+        if not entity_ids:
+            raise SimulatorError(400, "filter_entity_id is missing")
+        now = time.time()
+        start_time = datetime.fromisoformat(start).timestamp() if start else now - 86400
+        end_time = datetime.fromisoformat(query["end_time"][0]).timestamp() if "end_time" in query else now
+        minimal = "minimal_response" in query
+        no_attributes = "no_attributes" in query
+        result = []
+        for entity_id in entity_ids:
+            history = self._history.get(entity_id, ())
+            # The state current at the start of the period comes first, as in Home Assistant
+            earlier = [state for changed, state in history if changed < start_time]
+            states = earlier[-1:] + [state for changed, state in history if start_time <= changed <= end_time]
+            if no_attributes:
+                states = [{k: v for k, v in state.items() if k != "attributes"} for state in states]
+            if minimal and len(states) > 2:
+                states = [states[0]] + [
+                    {"state": state["state"], "last_changed": state["last_changed"]} for state in states[1:-1]
+                ] + [states[-1]]
+            if states:
+                result.append(states)
+        return result
+
+    def render_template(self, template: str, variables: Optional[Dict[str, Any]] = None) -> str:
+        """Render a template with the Home Assistant helpers the server relies on"""
+        try:
+            from jinja2.sandbox import ImmutableSandboxedEnvironment
+        except ImportError:
+            raise SimulatorError(400, "Template rendering in the simulator requires jinja2")
+        environment = ImmutableSandboxedEnvironment()
+        helpers = {
+            "states": _TemplateStates(self),
+            "is_state": lambda entity_id, state: self._states.get(entity_id, {}).get("state") == state,
+            "state_attr": lambda entity_id, name: self._states.get(entity_id, {}).get("attributes", {}).get(name),
+            "area_entities": self.area_entities,
+            "area_id": self.area_of,
+            "area_name": lambda entity_id: self._areas.get(self.area_of(entity_id) or ""),
+            "now": lambda: datetime.now(timezone.utc),
+        }
+        environment.globals.update(helpers)
+        environment.filters.update({
+            "area_entities": self.area_entities,
+            "area_id": self.area_of,
+            "tojson": json.dumps,
+        })
+        try:
+            return environment.from_string(template).render(**(variables or {}))
+        except Exception as e:
+            raise SimulatorError(400, f"Error rendering template: {e}")
+
+    def _fire(self, event_type: str, data: Dict[str, Any], context: Dict[str, Any]) -> None:
+        if not self._sessions:
+            return
+        event = {
+            "event_type": event_type,
+            "data": data,
+            "origin": "LOCAL",
+            "time_fired": _timestamp(time.time()),
+            "context": context
+        }
+        for session in list(self._sessions):
+            if session.authenticated:
+                session.publish(event)
+
+    async def _ws_message(self, session: _WebSocketSession, message: Dict[str, Any]) -> None:
+        if not session.authenticated:
+            if message.get("type") == "auth" and self._authorized(message.get("access_token") or ""):
+                session.authenticated = True
+                session.send({"type": "auth_ok", "ha_version": HA_VERSION})
+            else:
+                session.send({"type": "auth_invalid", "message": "Invalid access token or password"})
+                session.protocol.send_close()
+                session.flush()
+            return
+
+        message_id = message.get("id")
+        kind = message.get("type")
+        self.requests[f"ws {kind}"] += 1
+        await self._delay()
+        if kind == "ping":
+            session.send({"id": message_id, "type": "pong"})
+            return
+        try:
+            if self._injected_failure() is not None:
+                raise SimulatorError(500, "Simulated error")
+            result = self._ws_command(session, kind, message)
+        except SimulatorError as e:
+            session.send({"id": message_id, "type": "result", "success": False, "error": {"code": e.code, "message": e.message}})
+            return
+        session.send({"id": message_id, "type": "result", "success": True, "result": result})
+
+    def _ws_command(self, session: _WebSocketSession, kind: str, message: Dict[str, Any]) -> Any:
+        if kind == "supported_features":
+            session.coalesce = bool(message.get("features", {}).get("coalesce_messages"))
+            return None
+        if kind == "subscribe_events":
+            session.subscriptions[message["id"]] = message.get("event_type")
+            return None
+        if kind == "unsubscribe_events":
+            if session.subscriptions.pop(message.get("subscription"), False) is False:
+                raise SimulatorError(404, "Subscription not found.", "not_found")
+            return None
+        if kind == "get_states":
+            return self.all_states()
+        if kind == "get_config":
+            return self._config()
+        if kind == "call_service":
+            data = {**(message.get("service_data") or {}), **(message.get("target") or {})}
+            context = self._new_context()
+            self.call_service(message["domain"], message["service"], data, context)
+            return {"context": context, "response": None}
+        if kind == "config/area_registry/list":
+            return [{"area_id": area_id, "name": name} for area_id, name in self._areas.items()]
+        if kind == "config/entity_registry/list":
+            return [{"entity_id": entity_id, "area_id": self._entity_areas.get(entity_id)} for entity_id in self._states]
+        raise SimulatorError(400, "Unknown command.", "unknown_command")
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> None:
+        """Serve the REST and WebSocket APIs on a socket"""
+        self._server = await asyncio.start_server(self._on_connect, host, port)
+        self.host = host
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Simulated Home Assistant with {len(self._states)} entities on {self.url}")
+
+    async def close(self) -> None:
+        """Stop serving and cancel background activity"""
+        await self.stop_activity()
+        for handle in self._transitions.values():
+            handle.cancel()
+        self._transitions.clear()
+        if self._server is not None:
+            self._server.close()
+        for writer in list(self._writers):
+            writer.transport.abort()
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._server is not None:
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _on_connect(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        self._writers.add(writer)
+        try:
+            if self.available:
+                await self._serve_connection(reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            self._tasks.discard(task)
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        while self.available:
+            try:
+                head = await reader.readuntil(b"\r\n\r\n")
+            except asyncio.IncompleteReadError:
+                return
+            request_line, *lines = head.decode("latin-1").split("\r\n")
+            method, target, _ = request_line.split(" ", 2)
+            headers = {}
+            for line in lines:
+                if ":" in line:
+                    name, value = line.split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+            if headers.get("upgrade", "").lower() == "websocket":
+                await self._serve_websocket(head, reader, writer)
+                return
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+            status, content_type, payload = await self.handle_http(method, target, headers, body)
+            if not self.available:
+                return
+            encoding, payload = self.encode_body(headers, content_type, payload)
+            content_encoding = f"Content-Encoding: {encoding}\r\n" if encoding else ""
+            writer.write(
+                f"HTTP/1.1 {status} {'OK' if status < 400 else 'Error'}\r\n"
+                f"Content-Type: {content_type}\r\nContent-Length: {len(payload)}\r\n{content_encoding}\r\n".encode()
+                + payload
+            )
+            await writer.drain()
+            if headers.get("connection", "").lower() == "close":
+                return
+
+    async def _serve_websocket(self, head: bytes, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        protocol = ServerProtocol(max_size=None)
+        protocol.receive_data(head)
+        request = protocol.events_received()[0]
+        if request.path != "/api/websocket":
+            protocol.send_response(protocol.reject(404, "Not found"))
+            writer.write(b"".join(protocol.data_to_send()))
+            return
+        protocol.send_response(protocol.accept(request))
+        session = _WebSocketSession(protocol, writer)
+        session.flush()
+        self._sessions.add(session)
+        session.send({"type": "auth_required", "ha_version": HA_VERSION})
+        fragments: List[bytes] = []
+        try:
+            while protocol.state is not State.CLOSED:
+                data = await reader.read(65536)
+                if not data:
+                    protocol.receive_eof()
+                    break
+                protocol.receive_data(data)
+                for frame in protocol.events_received():
+                    if not isinstance(frame, Frame) or frame.opcode not in (Opcode.TEXT, Opcode.CONT):
+                        continue
+                    fragments.append(frame.data)
+                    if frame.fin:
+                        message = json.loads(b"".join(fragments))
+                        fragments.clear()
+                        task = asyncio.create_task(self._ws_message(session, message))
+                        self._tasks.add(task)
+                        task.add_done_callback(self._tasks.discard)
+                session.flush()
+                await writer.drain()
+        finally:
+            self._sessions.discard(session)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8123)
+    parser.add_argument("--entities", type=int, default=1000, help="number of synthetic entities")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--token", help="accept only this access token (default: any)")
+    parser.add_argument("--latency", type=float, default=0.0, help="mean response latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 500")
+    parser.add_argument("--events-per-second", type=float, default=0.0, help="background state changes")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    simulator = HomeAssistantSimulator(
+        entities=args.entities,
+        seed=args.seed,
+        token=args.token,
+        latency=args.latency,
+        error_rate=args.error_rate
+    )
+    await simulator.start(args.host, args.port)
+    if args.events_per_second:
+        simulator.start_activity(args.events_per_second)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await simulator.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
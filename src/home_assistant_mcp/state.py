@@ -0,0 +1,259 @@
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import sys
+
+import logging
+logger = logging.getLogger(__name__)
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_TIMESTAMPS = ("last_changed", "last_reported", "last_updated")
+_KNOWN_KEYS = frozenset(("entity_id", "state", "attributes", "context", *_TIMESTAMPS))
+# Strings up to this length are interned: states, units, device classes and other
+# values that repeat across entities
+_INTERN_MAX_LENGTH = 32
+# Attribute key tuples shared between records with the same attribute names
+_MAX_SHAPES = 4096
+_shapes: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+
+
+def _intern(value: Any) -> Any:
+    if type(value) is str and len(value) <= _INTERN_MAX_LENGTH:
+        return sys.intern(value)
+    return value
+
+
+def _shape(keys: Tuple[str, ...]) -> Tuple[str, ...]:
+    shape = _shapes.get(keys)
+    if shape is None:
+        shape = tuple(sys.intern(key) for key in keys)
+        if len(_shapes) < _MAX_SHAPES:
+            _shapes[shape] = shape
+    return shape
+
+
+def _parse_timestamp(value: str) -> Optional[int]:
+    """Microseconds since the epoch, or None unless the value is a UTC ISO string that formats back identically"""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None or parsed.utcoffset():
+        return None
+    micros = (parsed - _EPOCH) // timedelta(microseconds=1)
+    return micros if _format_timestamp(micros) == value else None
+
+
+def _format_timestamp(micros: int) -> str:
+    return (_EPOCH + timedelta(microseconds=micros)).isoformat()
+
+
+class StateRecord:
+    """Compact copy of one entity state
+
+    Home Assistant sends every state as a JSON object that repeats the same
+    attribute names, three ISO timestamps and a context object. A record keeps
+    the attribute names in a tuple shared by every record with the same names,
+    interns the domain and short string values, stores timestamps as integer
+    microseconds since the epoch (one object when they are equal) and builds
+    the attributes dict only when asked. Values it cannot store losslessly are
+    kept verbatim, so to_dict() returns what was passed in. Records are never
+    modified after creation.
+    """
+
+    __slots__ = (
+        "entity_id", "domain", "state", "last_changed", "last_reported", "last_updated",
+        "_keys", "_values", "_context", "_extra"
+    )
+
+    def __init__(self, state: dict):
+        self.entity_id = sys.intern(state["entity_id"])
+        self.domain = sys.intern(self.entity_id.partition(".")[0])
+        self.state = _intern(state.get("state"))
+        extra = None
+
+        parsed: Dict[str, Optional[int]] = {}
+        for name in _TIMESTAMPS:
+            value = state.get(name)
+            micros = None
+            if type(value) is str:
+                if value not in parsed:
+                    parsed[value] = _parse_timestamp(value)
+                micros = parsed[value]
+            if micros is None and name in state:
+                extra = extra or {}
+                extra[name] = value
+            setattr(self, name, micros)
+
+        attributes = state.get("attributes")
+        if isinstance(attributes, dict):
+            self._keys = _shape(tuple(attributes))
+            self._values = tuple(_intern(value) for value in attributes.values())
+        else:
+            self._keys = self._values = None
+            if "attributes" in state:
+                extra = extra or {}
+                extra["attributes"] = attributes
+
+        context = state.get("context")
+        if isinstance(context, dict) and context.keys() == {"id", "parent_id", "user_id"}:
+            if context["parent_id"] is None and context["user_id"] is None:
+                self._context = context["id"]
+            else:
+                self._context = (context["id"], context["parent_id"], context["user_id"])
+        else:
+            self._context = None
+            if "context" in state:
+                extra = extra or {}
+                extra["context"] = context
+
+        for key in state.keys() - _KNOWN_KEYS:
+            extra = extra or {}
+            extra[key] = state[key]
+        self._extra = extra
+
+    def __repr__(self) -> str:
+        return f"StateRecord({self.entity_id}={self.state!r})"
+
+    @property
+    def attributes(self) -> Dict[str, Any]:
+        """A new dict of the entity's attributes"""
+        if self._keys is None:
+            return {}
+        return dict(zip(self._keys, self._values))
+
+    def attribute(self, name: str, default: Any = None) -> Any:
+        """Get one attribute without building the attributes dict"""
+        if self._keys is not None and name in self._keys:
+            return self._values[self._keys.index(name)]
+        return default
+
+    @property
+    def context_id(self) -> Optional[str]:
+        """Id of the context (e.g. a service call) that caused this state"""
+        if type(self._context) is str:
+            return self._context
+        if self._context is not None:
+            return self._context[0]
+        context = self._extra.get("context") if self._extra else None
+        return context.get("id") if isinstance(context, dict) else None
+
+    def timestamp(self, name: str) -> Optional[str]:
+        """Get last_changed, last_reported or last_updated as sent by Home Assistant"""
+        micros = getattr(self, name)
+        if micros is not None:
+            return _format_timestamp(micros)
+        return self._extra.get(name) if self._extra else None
+
+    def to_dict(self) -> dict:
+        """Materialize the state as Home Assistant's JSON object"""
+        state = {"entity_id": self.entity_id, "state": self.state}
+        if self._keys is not None:
+            state["attributes"] = dict(zip(self._keys, self._values))
+        for name in _TIMESTAMPS:
+            micros = getattr(self, name)
+            if micros is not None:
+                state[name] = _format_timestamp(micros)
+        if type(self._context) is str:
+            state["context"] = {"id": self._context, "parent_id": None, "user_id": None}
+        elif self._context is not None:
+            state["context"] = dict(zip(("id", "parent_id", "user_id"), self._context))
+        if self._extra:
+            state.update(self._extra)
+        return state
+
+
+# Called with (entity_id, old_state, new_state); either state may be None
+StateListener = Callable[[str, Optional[StateRecord], Optional[StateRecord]], None]
+
+
+class StateCache:
+    """In-memory mirror of Home Assistant entity states
+
+    The cache is fed by a state feed (e.g. the WebSocket event stream) and fans
+    every change out to registered listeners. Listeners are plain callables so a
+    change costs one function call per interested listener; anything slow must
+    be scheduled by the listener itself. States are held as StateRecords;
+    get(), get_domain() and all() return plain dicts for responses.
+    """
+
+    def __init__(self):
+        self._states: Dict[str, StateRecord] = {}
+        self._listeners: List[StateListener] = []
+        self._entity_listeners: Dict[str, List[StateListener]] = {}
+        self.live = False
+
+    def __contains__(self, entity_id: str) -> bool:
+        return entity_id in self._states
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def get(self, entity_id: str) -> Optional[dict]:
+        """Get the cached state of an entity"""
+        record = self._states.get(entity_id)
+        return record.to_dict() if record is not None else None
+
+    def get_record(self, entity_id: str) -> Optional[StateRecord]:
+        """Get the cached state of an entity without converting it to a dict"""
+        return self._states.get(entity_id)
+
+    def get_domain(self, domain: str) -> List[dict]:
+        """Get the cached states of every entity in a domain"""
+        return [record.to_dict() for record in self._states.values() if record.domain == domain]
+
+    def all(self) -> List[dict]:
+        """Get every cached state"""
+        return [record.to_dict() for record in self._states.values()]
+
+    def records(self) -> List[StateRecord]:
+        """Get every cached state without converting them to dicts"""
+        return list(self._states.values())
+
+    def set(self, entity_id: str, new_state: dict | StateRecord | None) -> None:
+        """Store a new state (None removes the entity) and notify listeners"""
+        old_state = self._states.get(entity_id)
+        if new_state is None:
+            if old_state is None:
+                return
+            del self._states[entity_id]
+        else:
+            if not isinstance(new_state, StateRecord):
+                new_state = StateRecord(new_state)
+            self._states[entity_id] = new_state
+        self._notify(entity_id, old_state, new_state)
+
+    def replace_all(self, states: List[dict]) -> None:
+        """Replace the cache with a full snapshot, notifying only real changes"""
+        incoming = {state["entity_id"]: state for state in states}
+        for entity_id in list(self._states):
+            if entity_id not in incoming:
+                self.set(entity_id, None)
+        for entity_id, state in incoming.items():
+            old_state = self._states.get(entity_id)
+            if old_state is None or old_state.timestamp("last_updated") != state.get("last_updated"):
+                self.set(entity_id, state)
+
+    def add_listener(self, listener: StateListener, entity_id: str | None = None) -> Callable[[], None]:
+        """Register a change listener, optionally for a single entity
+
+        Returns a callable that removes the listener again.
+        """
+        if entity_id is None:
+            listeners = self._listeners
+        else:
+            listeners = self._entity_listeners.setdefault(entity_id, [])
+        listeners.append(listener)
+
+        def remove():
+            if listener in listeners:
+                listeners.remove(listener)
+            if entity_id is not None and not listeners:
+                self._entity_listeners.pop(entity_id, None)
+        return remove
+
+    def _notify(self, entity_id: str, old_state: Optional[StateRecord], new_state: Optional[StateRecord]) -> None:
+        for listener in (*self._listeners, *self._entity_listeners.get(entity_id, ())):
+            try:
+                listener(entity_id, old_state, new_state)
+            except Exception as e:
+                logger.error(f"State listener failed for {entity_id}: {e}")
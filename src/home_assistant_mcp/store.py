@@ -0,0 +1,113 @@
+from typing import Dict, List, Optional
+import json
+import sqlite3
+import threading
+import time
+
+from .state import StateCache, StateRecord
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class PersistentStateStore:
+    """On-disk copy of the last known state of every entity
+
+    Backed by SQLite. Changes are collected in memory and written by a
+    background thread in one transaction per flush interval, so the event loop
+    never waits on disk I/O; repeated changes of one entity between flushes
+    cost a single row write.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 1.0):
+        self._path = path
+        self._flush_interval = flush_interval
+        self._pending: Dict[str, Optional[StateRecord]] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        self._remove_listener = None
+        db = self._connect()
+        try:
+            with db:
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS states ("
+                    "entity_id TEXT PRIMARY KEY, state TEXT NOT NULL, stored_at REAL NOT NULL)"
+                )
+        finally:
+            db.close()
+
+    def load(self) -> List[dict]:
+        """Read every stored state (blocking; run it off the event loop)"""
+        db = self._connect()
+        try:
+            rows = db.execute("SELECT state FROM states").fetchall()
+        finally:
+            db.close()
+        return [json.loads(row[0]) for row in rows]
+
+    def attach(self, state_cache: StateCache) -> None:
+        """Persist every change of the given cache and start the writer thread"""
+        self._remove_listener = state_cache.add_listener(
+            lambda entity_id, old_state, new_state: self.put(entity_id, new_state)
+        )
+        self._thread = threading.Thread(target=self._run, name="state-store-writer", daemon=True)
+        self._thread.start()
+
+    def put(self, entity_id: str, state: Optional[StateRecord]) -> None:
+        """Queue a state (None deletes it) for the next batch"""
+        with self._lock:
+            self._pending[entity_id] = state
+
+    def close(self) -> None:
+        """Stop the writer thread after a final flush (blocking)"""
+        if self._remove_listener is not None:
+            self._remove_listener()
+            self._remove_listener = None
+        self._closed = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        else:
+            db = self._connect()
+            try:
+                self._flush(db)
+            finally:
+                db.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self._path)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def _run(self) -> None:
+        db = self._connect()
+        try:
+            while not self._closed:
+                self._wakeup.wait(self._flush_interval)
+                self._flush(db)
+            self._flush(db)
+        finally:
+            db.close()
+
+    def _flush(self, db: sqlite3.Connection) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        stored_at = time.time()
+        try:
+            with db:
+                db.executemany(
+                    "INSERT OR REPLACE INTO states (entity_id, state, stored_at) VALUES (?, ?, ?)",
+                    [(entity_id, json.dumps(state.to_dict()), stored_at) for entity_id, state in pending.items() if state is not None]
+                )
+                db.executemany(
+                    "DELETE FROM states WHERE entity_id = ?",
+                    [(entity_id,) for entity_id, state in pending.items() if state is None]
+                )
+        except sqlite3.Error as e:
+            logger.error(f"Failed to persist {len(pending)} states: {e}")
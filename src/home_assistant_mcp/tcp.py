@@ -0,0 +1,426 @@
+from typing import Any, Dict, List, Optional, Set
+import asyncio
+import json
+
+import mcp.types as types
+from pydantic import AnyUrl
+
+from .compression import COMPRESSION_CAPABILITY, COMPRESSED_METHOD, envelope, negotiate, open_envelope
+from .metrics import metrics
+from .profiles import PROFILE_CAPABILITY
+from .tracing import tracer
+
+import logging
+logger = logging.getLogger(__name__)
+
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+# Implementation-defined server error
+SHUTTING_DOWN = -32000
+# Seconds a tools/call may run, sent by the client in the request's params._meta
+TIMEOUT_META = "homeassistant/timeout"
+# Messages at least this large are compressed in a worker thread
+THREADED_COMPRESSION_BYTES = 256 * 1024
+
+
+class MethodNotFound(Exception):
+    pass
+
+
+class InvalidParams(Exception):
+    pass
+
+
+class _Connection:
+    """A single client connection speaking newline-delimited JSON-RPC
+
+    Requests are handled concurrently up to max_in_flight; once that many are
+    pending the connection stops reading, which pushes back on the client.
+    A request the client cancels (notifications/cancelled) is abandoned without
+    a response, and all pending requests are abandoned when the connection ends.
+    Writes wait for the socket buffer to drain below its high-water mark, so a
+    slow reader cannot make the server buffer unbounded output. If the client
+    negotiated compression when initializing, large outgoing messages are sent
+    inside a compressed envelope.
+    """
+
+    def __init__(self, transport: "TcpTransport", reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._transport = transport
+        self._reader = reader
+        self._writer = writer
+        self._slots = asyncio.Semaphore(transport.max_in_flight)
+        self._tasks: Set[asyncio.Task] = set()
+        self._requests: Dict[Any, asyncio.Task] = {}
+        self.peer = writer.get_extra_info("peername")
+        self.task = asyncio.current_task()
+        # Set by initialize when the client accepts compressed messages
+        self.encoding: Optional[str] = None
+
+    @property
+    def in_flight(self) -> Set[asyncio.Task]:
+        return self._tasks
+
+    async def run(self) -> None:
+        try:
+            while True:
+                try:
+                    line = await self._read_line()
+                except asyncio.LimitOverrunError:
+                    await self._send(self._error(None, INVALID_REQUEST, "Message too large"))
+                    break
+                if line is None:
+                    break
+                if line.strip():
+                    await self._receive(line)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            # Nobody is left to read the results; free upstream connections and slots now
+            for task in self._tasks:
+                task.cancel()
+            self._transport.remove_connection(self)
+            self._writer.close()
+
+    def close(self) -> None:
+        self._writer.close()
+
+    async def _read_line(self) -> Optional[bytes]:
+        read = self._reader.readuntil(b"\n")
+        try:
+            if self._transport.idle_timeout:
+                return await asyncio.wait_for(read, self._transport.idle_timeout)
+            return await read
+        except asyncio.IncompleteReadError:
+            return None
+        except asyncio.TimeoutError:
+            logger.debug(f"Closing idle connection {self.peer}")
+            return None
+
+    async def _receive(self, line: bytes, compressed: bool = False) -> None:
+        try:
+            payload = json.loads(line)
+        except json.JSONDecodeError:
+            await self._send(self._error(None, PARSE_ERROR, "Invalid JSON"))
+            return
+        if not isinstance(payload, list):
+            response = await self._accept(payload, batch=False, compressed=compressed)
+            if isinstance(response, dict):
+                await self._send(response)
+            return
+        if not payload:
+            await self._send(self._error(None, INVALID_REQUEST, "Empty batch"))
+            return
+        # A batch is answered with a single array once all of its requests are done
+        responses = [await self._accept(message, batch=True, compressed=compressed) for message in payload]
+        if any(isinstance(response, asyncio.Task) for response in responses):
+            task = asyncio.create_task(self._respond_batch(responses))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        elif any(response is not None for response in responses):
+            await self._send([response for response in responses if response is not None])
+
+    async def _accept(self, message: Any, batch: bool, compressed: bool = False) -> Optional[Dict[str, Any] | asyncio.Task]:
+        """Start handling a message; returns an immediate response, the task of a request or None"""
+        if not isinstance(message, dict) or "method" not in message:
+            return self._error(None, INVALID_REQUEST, "Invalid request")
+        if message["method"] == COMPRESSED_METHOD:
+            if compressed:
+                return self._error(None, INVALID_REQUEST, "Compressed messages cannot be nested")
+            try:
+                inner = open_envelope(message.get("params") or {}, self._transport.max_message_bytes)
+            except Exception:
+                return self._error(None, INVALID_REQUEST, "Invalid compressed message")
+            if not batch:
+                await self._receive(inner, compressed=True)
+                return None
+            # Inside a batch the message is answered in the batch's array
+            try:
+                message = json.loads(inner)
+            except json.JSONDecodeError:
+                return self._error(None, PARSE_ERROR, "Invalid JSON")
+            if isinstance(message, list):
+                return self._error(None, INVALID_REQUEST, "Batches cannot be nested")
+            return await self._accept(message, batch=True, compressed=True)
+        if "id" not in message:
+            # Notifications need no response
+            if message["method"] == "notifications/cancelled":
+                self._cancel((message.get("params") or {}).get("requestId"))
+            return None
+        if not isinstance(message["id"], (str, int)):
+            return self._error(None, INVALID_REQUEST, "Request id must be a string or number")
+        if self._transport.draining:
+            return self._error(message["id"], SHUTTING_DOWN, "Server is shutting down")
+        if message["id"] in self._requests:
+            return self._error(message["id"], INVALID_REQUEST, f"Request {message['id']} is already in flight")
+        await self._slots.acquire()
+        task = asyncio.create_task(self._handle(message) if batch else self._respond(message))
+        self._tasks.add(task)
+        self._requests[message["id"]] = task
+        # Not in _handle: a task cancelled before it starts never runs it
+        task.add_done_callback(lambda _: self._slots.release())
+        task.add_done_callback(self._tasks.discard)
+        task.add_done_callback(lambda done, message_id=message["id"]: self._forget(message_id, done))
+        return task
+
+    def _cancel(self, message_id: Any) -> None:
+        task = self._requests.get(message_id)
+        if task is not None:
+            logger.debug(f"Request {message_id} cancelled by {self.peer}")
+            task.cancel()
+
+    def _forget(self, message_id: Any, task: asyncio.Task) -> None:
+        if self._requests.get(message_id) is task:
+            del self._requests[message_id]
+
+    async def _respond(self, message: Dict[str, Any]) -> None:
+        try:
+            await self._send(await self._handle(message))
+        except ConnectionError:
+            pass
+
+    async def _respond_batch(self, responses: List[Dict[str, Any] | asyncio.Task | None]) -> None:
+        pending = [response for response in responses if isinstance(response, asyncio.Task)]
+        await asyncio.wait(pending)
+        results = []
+        for response in responses:
+            if isinstance(response, asyncio.Task):
+                # Requests the client cancelled get no response
+                response = None if response.cancelled() else response.result()
+            if response is not None:
+                results.append(response)
+        if results:
+            try:
+                await self._send(results)
+            except ConnectionError:
+                pass
+
+    async def _handle(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            result = await self._transport.dispatch(self, message["method"], message.get("params") or {})
+            return {"jsonrpc": "2.0", "id": message["id"], "result": result}
+        except MethodNotFound as e:
+            return self._error(message["id"], METHOD_NOT_FOUND, str(e))
+        except InvalidParams as e:
+            return self._error(message["id"], INVALID_PARAMS, str(e))
+        except Exception as e:
+            return self._error(message["id"], INTERNAL_ERROR, str(e))
+
+    async def _send(self, message: Dict[str, Any] | List[Dict[str, Any]]) -> None:
+        data = json.dumps(message).encode()
+        if self.encoding is not None and len(data) >= self._transport.compress_min_bytes:
+            if len(data) >= THREADED_COMPRESSION_BYTES:
+                wrapped = await asyncio.to_thread(envelope, data, self.encoding, self._transport.compress_min_bytes)
+            else:
+                wrapped = envelope(data, self.encoding, self._transport.compress_min_bytes)
+            if wrapped is not None:
+                self._transport.compressed.inc()
+                self._transport.bytes_saved.inc(len(data) - len(wrapped))
+                data = wrapped
+        self._writer.write(data + b"\n")
+        await self._writer.drain()
+
+    @staticmethod
+    def _error(message_id: Any, code: int, text: str) -> Dict[str, Any]:
+        return {"jsonrpc": "2.0", "id": message_id, "error": {"code": code, "message": text}}
+
+    async def send_resource_updated(self, uri: AnyUrl) -> None:
+        """Push a resource update notification (called by resource subscriptions)"""
+        await self._send({
+            "jsonrpc": "2.0",
+            "method": "notifications/resources/updated",
+            "params": {"uri": str(uri)}
+        })
+
+    async def send_tool_list_changed(self) -> None:
+        """Tell the client its tool list changed (called when the session's scope changes)"""
+        await self._send({"jsonrpc": "2.0", "method": "notifications/tools/list_changed"})
+
+
+class TcpTransport:
+    """Serve a HomeAssistantMcpServer over TCP with newline-delimited JSON-RPC
+
+    Speaks the MCP methods the stdio server exposes (initialize, tools and
+    resources). Unlike the stdio session, which handles one request at a time,
+    requests on a connection are pipelined and handled concurrently.
+    """
+
+    def __init__(
+        self,
+        ha_server,
+        host: str = "127.0.0.1",
+        port: int = 8888,
+        max_in_flight: int = 32,
+        max_message_bytes: int = 1024 * 1024,
+        write_buffer_bytes: int = 256 * 1024,
+        idle_timeout: float | None = None,
+        compression: bool = True,
+        compress_min_bytes: int = 2048
+    ):
+        self._ha_server = ha_server
+        self.host = host
+        self.port = port
+        self.max_in_flight = max_in_flight
+        self.max_message_bytes = max_message_bytes
+        self.write_buffer_bytes = write_buffer_bytes
+        self.idle_timeout = idle_timeout
+        self.compression = compression
+        self.compress_min_bytes = compress_min_bytes
+        self.compressed = metrics.counter("tcp.compressed_messages")
+        self.bytes_saved = metrics.counter("tcp.compression_saved_bytes")
+        self._server: Optional[asyncio.Server] = None
+        self._connections: Set[_Connection] = set()
+        self.draining = False
+        self._methods = {
+            "initialize": self._initialize,
+            "ping": self._ping,
+            "tools/list": self._list_tools,
+            "tools/call": self._call_tool,
+            "resources/list": self._list_resources,
+            "resources/read": self._read_resource,
+            "resources/subscribe": self._subscribe_resource,
+            "resources/unsubscribe": self._unsubscribe_resource,
+        }
+
+    @property
+    def connection_count(self) -> int:
+        return len(self._connections)
+
+    async def start(self) -> None:
+        """Start listening"""
+        self._server = await asyncio.start_server(
+            self._on_connect,
+            self.host,
+            self.port,
+            limit=self.max_message_bytes,
+            backlog=1024
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Serving MCP over TCP on {self.host}:{self.port}")
+
+    async def serve_forever(self) -> None:
+        """Start listening and serve until cancelled"""
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self, drain_timeout: float = 0) -> None:
+        """Stop accepting connections, answer requests already received and close connections
+
+        Requests still running after drain_timeout are abandoned with their connection.
+        """
+        if self._server is not None:
+            self._server.close()
+        self.draining = True
+        pending = [task for connection in self._connections for task in connection.in_flight]
+        if pending and drain_timeout > 0:
+            logger.info(f"Draining {len(pending)} requests")
+            _, pending = await asyncio.wait(pending, timeout=drain_timeout)
+            if pending:
+                logger.warning(f"Closing connections with {len(pending)} requests unanswered")
+        connections = list(self._connections)
+        for connection in connections:
+            connection.close()
+        if connections:
+            await asyncio.wait([connection.task for connection in connections], timeout=5)
+
+    def remove_connection(self, connection: _Connection) -> None:
+        self._connections.discard(connection)
+        self._ha_server.close_session(connection)
+
+    async def _on_connect(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        writer.transport.set_write_buffer_limits(high=self.write_buffer_bytes)
+        connection = _Connection(self, reader, writer)
+        self._connections.add(connection)
+        await connection.run()
+
+    async def dispatch(self, connection: _Connection, method: str, params: Dict[str, Any]) -> Any:
+        """Run an MCP method"""
+        handler = self._methods.get(method)
+        if handler is None:
+            raise MethodNotFound(f"Method not found: {method}")
+        return await handler(connection, params)
+
+    async def _initialize(self, connection: _Connection, params: Dict[str, Any]) -> Dict[str, Any]:
+        experimental = (params.get("capabilities") or {}).get("experimental") or {}
+        try:
+            self._ha_server.open_session(connection, experimental.get(PROFILE_CAPABILITY))
+        except ValueError as e:
+            raise InvalidParams(str(e))
+        capabilities: Dict[str, Any] = {
+            "tools": {"listChanged": True},
+            "resources": {"subscribe": True, "listChanged": False}
+        }
+        offered = experimental.get(COMPRESSION_CAPABILITY)
+        if self.compression and isinstance(offered, dict):
+            connection.encoding = negotiate(offered.get("encodings") or ())
+            if connection.encoding is not None:
+                capabilities["experimental"] = {
+                    COMPRESSION_CAPABILITY: {"encoding": connection.encoding, "min_bytes": self.compress_min_bytes}
+                }
+        return {
+            "protocolVersion": types.LATEST_PROTOCOL_VERSION,
+            "capabilities": capabilities,
+            "serverInfo": {"name": "home-assistant-server", "version": "0.1.0"}
+        }
+
+    async def _ping(self, connection: _Connection, params: Dict[str, Any]) -> Dict[str, Any]:
+        return {}
+
+    async def _list_tools(self, connection: _Connection, params: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            tools, next_cursor = await self._ha_server.list_tools(connection, params.get("cursor"))
+        except ValueError as e:
+            raise InvalidParams(str(e))
+        result = {"tools": [tool.model_dump(exclude_none=True) for tool in tools]}
+        if next_cursor is not None:
+            result["nextCursor"] = next_cursor
+        return result
+
+    async def _call_tool(self, connection: _Connection, params: Dict[str, Any]) -> Dict[str, Any]:
+        name = params.get("name")
+        if not isinstance(name, str):
+            raise InvalidParams("Tool name must be a string")
+        with tracer.span("mcp.call_tool", tool=name, transport="tcp") as span:
+            try:
+                timeout = (params.get("_meta") or {}).get(TIMEOUT_META)
+                result = await self._ha_server.handle_tool_call(
+                    name, params.get("arguments") or {}, connection, float(timeout) if timeout else None
+                )
+            except Exception as e:
+                return {
+                    "content": [{"type": "text", "text": f"Error processing home-assistant query: {e}"}],
+                    "isError": True
+                }
+            text = json.dumps(result, indent=2)
+            span.set_attribute("response_bytes", len(text))
+            return {"content": [{"type": "text", "text": text}], "isError": False}
+
+    async def _list_resources(self, connection: _Connection, params: Dict[str, Any]) -> Dict[str, Any]:
+        resources = self._ha_server.list_resources()
+        return {"resources": [resource.model_dump(mode="json", exclude_none=True) for resource in resources]}
+
+    async def _read_resource(self, connection: _Connection, params: Dict[str, Any]) -> Dict[str, Any]:
+        uri = self._uri(params)
+        text = await self._ha_server.read_resource(uri)
+        return {"contents": [{"uri": uri, "mimeType": "application/json", "text": text}]}
+
+    async def _subscribe_resource(self, connection: _Connection, params: Dict[str, Any]) -> Dict[str, Any]:
+        uri = self._uri(params)
+        self._ha_server.subscribe_resource(connection, uri)
+        return {}
+
+    async def _unsubscribe_resource(self, connection: _Connection, params: Dict[str, Any]) -> Dict[str, Any]:
+        uri = self._uri(params)
+        self._ha_server.unsubscribe_resource(connection, uri)
+        return {}
+
+    @staticmethod
+    def _uri(params: Dict[str, Any]) -> str:
+        uri = params.get("uri")
+        if not isinstance(uri, str):
+            raise InvalidParams("Resource uri must be a string")
+        return uri
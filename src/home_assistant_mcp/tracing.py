@@ -0,0 +1,154 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Protocol
+import json
+import os
+import queue
+import random
+import threading
+import time
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class Span:
+    """A timed operation within a trace"""
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start", "end", "attributes", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.start = time.time()
+        self.end: Optional[float] = None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": round(((self.end or time.time()) - self.start) * 1000, 3),
+            "attributes": self.attributes,
+            "error": self.error
+        }
+
+
+class _NoopSpan:
+    """Stand-in for spans of traces that were not sampled"""
+    __slots__ = ()
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+# Marks a context whose trace was sampled out, so nested spans skip the sampling decision
+_UNSAMPLED = object()
+_current_span: ContextVar[Any] = ContextVar("current_span", default=None)
+
+
+class SpanExporter(Protocol):
+    """Receives finished spans"""
+
+    def export(self, span: Span) -> None:
+        ...
+
+    def shutdown(self) -> None:
+        ...
+
+
+class JsonLinesExporter:
+    """Append finished spans as JSON lines to a local file from a background thread"""
+
+    def __init__(self, path: str):
+        self._path = path
+        self._queue: "queue.SimpleQueue[Optional[Dict[str, Any]]]" = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, span: Span) -> None:
+        self._queue.put(span.to_dict())
+
+    def shutdown(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self) -> None:
+        with open(self._path, "a", encoding="utf-8") as file:
+            while True:
+                batch: List[Optional[Dict[str, Any]]] = [self._queue.get()]
+                while not self._queue.empty():
+                    batch.append(self._queue.get())
+                for item in batch:
+                    if item is None:
+                        return
+                    file.write(json.dumps(item, default=str) + "\n")
+                file.flush()
+
+
+class Tracer:
+    """Head-sampled span tracer
+
+    The sampling decision is made once per trace at its root span. Spans of
+    unsampled traces cost a context variable lookup and nothing else.
+    """
+
+    def __init__(self, exporter: Optional[SpanExporter] = None, sample_rate: float = 0.0):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+
+    def configure(self, exporter: Optional[SpanExporter], sample_rate: float) -> None:
+        """Replace the exporter and sampling rate"""
+        if self.exporter is not None and self.exporter is not exporter:
+            self.exporter.shutdown()
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+
+    def shutdown(self) -> None:
+        """Flush and detach the exporter"""
+        self.configure(None, 0.0)
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span | _NoopSpan]:
+        """Record the enclosed block as a span of the current trace"""
+        parent = _current_span.get()
+        if parent is _UNSAMPLED or self.exporter is None:
+            yield _NOOP_SPAN
+            return
+        if parent is None and random.random() >= self.sample_rate:
+            token = _current_span.set(_UNSAMPLED)
+            try:
+                yield _NOOP_SPAN
+            finally:
+                _current_span.reset(token)
+            return
+
+        if parent is None:
+            span = Span(name, os.urandom(16).hex(), None, attributes)
+        else:
+            span = Span(name, parent.trace_id, parent.span_id, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end = time.time()
+            exporter = self.exporter
+            if exporter is not None:
+                exporter.export(span)
+
+
+# Process-wide tracer, configured by the server at startup
+tracer = Tracer()
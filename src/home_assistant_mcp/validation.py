@@ -0,0 +1,71 @@
+from typing import Any, Dict
+
+import logging
+logger = logging.getLogger(__name__)
+
+_TYPES = {
+    "string": lambda value: isinstance(value, str),
+    "integer": lambda value: isinstance(value, int) and not isinstance(value, bool)
+    or isinstance(value, float) and value.is_integer(),
+    "number": lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    "boolean": lambda value: isinstance(value, bool),
+    "array": lambda value: isinstance(value, list),
+    "object": lambda value: isinstance(value, dict),
+    "null": lambda value: value is None,
+}
+
+
+def validate(schema: Dict[str, Any], value: Any, path: str = "arguments") -> None:
+    """Check a value against a tool input schema, raising ValueError on the first mismatch
+
+    Covers the JSON Schema keywords the tool schemas use. An object schema
+    that lists properties accepts no others; one without properties accepts
+    anything, like the free-form arguments of a plan step.
+    """
+    options = schema.get("anyOf")
+    if options is not None:
+        errors = []
+        for option in options:
+            try:
+                validate(option, value, path)
+                break
+            except ValueError as e:
+                errors.append(str(e))
+        else:
+            raise ValueError(f"{path} matches none of the allowed forms: {'; '.join(errors)}")
+
+    expected = schema.get("type")
+    if expected is not None:
+        types = expected if isinstance(expected, list) else [expected]
+        if not any(_TYPES[name](value) for name in types):
+            raise ValueError(f"{path} must be of type {' or '.join(types)}")
+
+    if "enum" in schema and value not in schema["enum"]:
+        raise ValueError(f"{path} must be one of {', '.join(map(str, schema['enum']))}")
+
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        if "minimum" in schema and value < schema["minimum"]:
+            raise ValueError(f"{path} must be at least {schema['minimum']}")
+        if "maximum" in schema and value > schema["maximum"]:
+            raise ValueError(f"{path} must be at most {schema['maximum']}")
+
+    if isinstance(value, list):
+        if "minItems" in schema and len(value) < schema["minItems"]:
+            raise ValueError(f"{path} must have at least {schema['minItems']} items")
+        if "maxItems" in schema and len(value) > schema["maxItems"]:
+            raise ValueError(f"{path} must have at most {schema['maxItems']} items")
+        items = schema.get("items")
+        if items is not None:
+            for index, item in enumerate(value):
+                validate(items, item, f"{path}[{index}]")
+
+    if isinstance(value, dict):
+        for name in schema.get("required", ()):
+            if name not in value:
+                raise ValueError(f"{path}.{name} is required")
+        properties = schema.get("properties")
+        if properties is not None:
+            for name, item in value.items():
+                if name not in properties:
+                    raise ValueError(f"{path}.{name} is not a known argument")
+                validate(properties[name], item, f"{path}.{name}")
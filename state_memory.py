@@ -0,0 +1,84 @@
+"""Memory benchmark for the entity state cache
+
+Generates entities with the Home Assistant simulator, decodes them from JSON as
+they would arrive over the wire, and compares the memory held by plain dicts
+with the memory held by StateRecords. Also reports how long it takes to build
+the records and to convert them back to dicts.
+
+    python state_memory.py --entities 10000
+"""
+import argparse
+import gc
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+sys.path.append(str(Path(__file__).parent / "src"))
+
+from home_assistant_mcp.simulator import HomeAssistantSimulator
+from home_assistant_mcp.state import StateRecord
+
+
+def wire_states(entities: int, seed: int = 0) -> bytes:
+    """The JSON body of /api/states for a simulated installation"""
+    simulator = HomeAssistantSimulator(entities=entities, seed=seed)
+    return json.dumps(simulator.all_states()).encode()
+
+
+def retained_bytes(build: Callable[[], Any]) -> int:
+    """Bytes still allocated after build() returns, i.e. held by its result"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = build()
+        gc.collect()
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return size
+
+
+def measure(entities: int, seed: int = 0) -> Dict[str, float]:
+    body = wire_states(entities, seed)
+    count = len(json.loads(body))
+    dict_bytes = retained_bytes(lambda: json.loads(body))
+    record_bytes = retained_bytes(lambda: [StateRecord(state) for state in json.loads(body)])
+
+    states = json.loads(body)
+    started = time.perf_counter()
+    records: List[StateRecord] = [StateRecord(state) for state in states]
+    build_time = time.perf_counter() - started
+    started = time.perf_counter()
+    for record in records:
+        record.to_dict()
+    to_dict_time = time.perf_counter() - started
+    return {
+        "entities": count,
+        "dict_bytes_per_entity": dict_bytes / count,
+        "record_bytes_per_entity": record_bytes / count,
+        "build_us_per_entity": build_time / count * 1e6,
+        "to_dict_us_per_entity": to_dict_time / count * 1e6,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entities", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    result = measure(args.entities, args.seed)
+    ratio = result["record_bytes_per_entity"] / result["dict_bytes_per_entity"]
+    print(f"entities:        {result['entities']}")
+    print(f"dicts:           {result['dict_bytes_per_entity']:.0f} B/entity")
+    print(f"records:         {result['record_bytes_per_entity']:.0f} B/entity ({ratio:.0%} of dicts)")
+    print(f"build record:    {result['build_us_per_entity']:.1f} us/entity")
+    print(f"record to dict:  {result['to_dict_us_per_entity']:.1f} us/entity")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+import os
+
+# The package imports server.py, which requires these to be configured
+os.environ.setdefault("HOMEASSISTANT_TOKEN", "test-token")
+os.environ.setdefault("HOMEASSISTANT_BASE_URL", "http://homeassistant.test:8123")
+os.environ.setdefault("HOMEASSISTANT_EVENT_STREAM", "false")
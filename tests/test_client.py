@@ -0,0 +1,109 @@
+import asyncio
+import json
+import httpx
+import pytest
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+import mcp.types as types
+from anthropic import AsyncAnthropic
+from client import MCPClient
+
+
+class FakeSession:
+    def __init__(self, notifications=()):
+        self.list_calls = 0
+        self.tool_calls = []
+        self._notifications = list(notifications)
+
+    async def list_tools(self):
+        self.list_calls += 1
+        return types.ListToolsResult(tools=[
+            types.Tool(name="lock-lock", description="Lock a lock", inputSchema={"type": "object"})
+        ])
+
+    async def call_tool(self, name, arguments):
+        self.tool_calls.append((name, arguments))
+        return types.CallToolResult(content=[types.TextContent(type="text", text="[]")])
+
+    @property
+    async def incoming_messages(self):
+        for notification in self._notifications:
+            yield notification
+
+
+def message(*content, stop_reason="end_turn"):
+    return {
+        "id": "msg_1", "type": "message", "role": "assistant", "model": "stub",
+        "content": list(content), "stop_reason": stop_reason, "stop_sequence": None,
+        "usage": {"input_tokens": 1, "output_tokens": 1}
+    }
+
+
+def stub_anthropic(responses, requests):
+    def handler(request):
+        requests.append(json.loads(request.content))
+        return httpx.Response(200, json=responses.pop(0))
+    return AsyncAnthropic(api_key="test", http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+
+@pytest.mark.asyncio
+async def test_tool_catalog_is_cached_across_queries():
+    requests = []
+    responses = [message({"type": "text", "text": "Hello"}), message({"type": "text", "text": "Again"})]
+    client = MCPClient(anthropic=stub_anthropic(responses, requests), prompt_caching=True)
+    client.session = FakeSession()
+
+    assert await client.process_query("hi") == "Hello"
+    assert await client.process_query("hi again") == "Again"
+    assert client.session.list_calls == 1
+    assert requests[0]["tools"][-1]["cache_control"] == {"type": "ephemeral"}
+
+
+@pytest.mark.asyncio
+async def test_list_changed_notification_invalidates_catalog():
+    changed = types.ServerNotification(types.ToolListChangedNotification(method="notifications/tools/list_changed"))
+    client = MCPClient(anthropic=AsyncAnthropic(api_key="test"))
+    client.session = FakeSession([changed])
+
+    await client.get_tools()
+    await client._watch_notifications()
+    await client.get_tools()
+    assert client.session.list_calls == 2
+
+
+class SlowSession(FakeSession):
+    def __init__(self):
+        super().__init__()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def call_tool(self, name, arguments):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.2 if arguments["entity_id"] == "stuck" else 0.01)
+        self.in_flight -= 1
+        return await super().call_tool(name, arguments)
+
+
+@pytest.mark.asyncio
+async def test_tool_uses_of_one_turn_run_concurrently():
+    requests = []
+    tool_uses = [
+        {"type": "tool_use", "id": f"toolu_{entity}", "name": "lock-lock", "input": {"entity_id": entity}}
+        for entity in ("front_door", "back_door", "stuck")
+    ]
+    responses = [message(*tool_uses, stop_reason="tool_use"), message({"type": "text", "text": "Done"})]
+    client = MCPClient(anthropic=stub_anthropic(responses, requests), tool_timeout=0.1)
+    client.session = SlowSession()
+
+    result = await client.process_query("lock every door")
+    assert result.endswith("Done")
+    assert client.session.max_in_flight == 3
+
+    # Every result goes back to the model in a single user turn
+    results = requests[1]["messages"][-1]["content"]
+    assert [r["tool_use_id"] for r in results] == ["toolu_front_door", "toolu_back_door", "toolu_stuck"]
+    assert results[2]["is_error"] is True
+    assert "timed out" in results[2]["content"]
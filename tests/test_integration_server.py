@@ -0,0 +1,130 @@
+import asyncio
+import httpx
+import pytest
+import pytest_asyncio
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent / 'src'))
+
+import home_assistant_mcp.server as server_module
+from home_assistant_mcp.simulator import HomeAssistantSimulator
+
+
+@pytest_asyncio.fixture
+async def simulator(monkeypatch):
+    simulator = HomeAssistantSimulator(entities=500, token="test-token", transition_time=0.05)
+    await simulator.start()
+    monkeypatch.setattr(server_module, "HOMEASSISTANT_BASE_URL", simulator.url)
+    monkeypatch.setattr(server_module, "API_KEY", "test-token")
+    monkeypatch.setattr(server_module, "EVENT_STREAM_ENABLED", True)
+    yield simulator
+    await simulator.close()
+
+
+@pytest.mark.asyncio
+async def test_command_and_wait_over_live_event_stream(simulator):
+    ha_server = server_module.HomeAssistantMcpServer()
+    await ha_server.start()
+    await asyncio.wait_for(ha_server._event_stream.connected.wait(), 5)
+
+    await ha_server.handle_tool_call("lock-unlock", {"entity_id": "front_door"})
+    result = await ha_server.handle_tool_call(
+        "wait_for_state", {"entity_id": "lock.front_door", "state": "unlocked", "timeout": 5}
+    )
+    assert result["matched"] and result["state"]["state"] == "unlocked"
+    # The final state came from the event stream, not from polling
+    assert simulator.requests["GET /api/states/lock.front_door"] == 0
+    await ha_server.stop()
+
+
+@pytest.mark.asyncio
+async def test_resync_after_disconnect(simulator):
+    ha_server = server_module.HomeAssistantMcpServer()
+    ha_server._event_stream._reconnect_delay = 0.01
+    await ha_server.start()
+    stream = ha_server._event_stream
+    await asyncio.wait_for(stream.connected.wait(), 5)
+
+    simulator.disconnect_websockets()
+    await asyncio.sleep(0.01)
+    # Changes made while disconnected arrive with the snapshot after reconnecting
+    simulator.set_state("sensor.sim_00000", "99.9")
+    await asyncio.wait_for(stream.connected.wait(), 5)
+    assert (await ha_server.get_entity_state("sensor.sim_00000"))["state"] == "99.9"
+    assert simulator.requests["ws get_states"] == 2
+    await ha_server.stop()
+
+
+@pytest.mark.asyncio
+async def test_last_known_state_while_unavailable(simulator, monkeypatch):
+    monkeypatch.setattr(server_module, "EVENT_STREAM_ENABLED", False)
+    ha_server = server_module.HomeAssistantMcpServer()
+    ha_server._state_cache.set("lock.front_door", simulator.get_state("lock.front_door"))
+
+    simulator.available = False
+    state = await ha_server.get_entity_state("lock.front_door")
+    assert state["last_known"] and state["state"] == "locked"
+
+
+@pytest.mark.asyncio
+async def test_service_calls_over_websocket_with_rest_fallback(simulator):
+    ha_server = server_module.HomeAssistantMcpServer()
+    await ha_server.start()
+    await asyncio.wait_for(ha_server._event_stream.connected.wait(), 5)
+
+    lights = [f"sim_{i:05d}" for i in range(10) if simulator.get_state(f"light.sim_{i:05d}")]
+    results = await asyncio.gather(*(
+        ha_server.handle_tool_call("light-turn_on", {"entity_id": light, "brightness_pct": 100}) for light in lights
+    ))
+    assert lights and simulator.requests["ws call_service"] == len(lights)
+    assert simulator.requests["POST /api/services/light/turn_on"] == 0
+    # Same shape as the REST API's response: the states the call changed
+    assert [result[0]["entity_id"] for result in results] == [f"light.{light}" for light in lights]
+    assert all(result[0]["attributes"]["brightness"] == 255 for result in results)
+
+    await ha_server._event_stream.stop()
+    result = await ha_server.handle_tool_call("light-turn_off", {"entity_id": lights[0]})
+    assert result[0]["state"] == "off"
+    assert simulator.requests["POST /api/services/light/turn_off"] == 1
+    await ha_server.stop()
+
+
+@pytest.mark.asyncio
+async def test_websocket_service_call_returns_states_with_its_context(simulator):
+    ha_server = server_module.HomeAssistantMcpServer()
+    await ha_server.start()
+    await asyncio.wait_for(ha_server._event_stream.connected.wait(), 5)
+    service_lock = simulator._service_lock
+
+    def unlock_and_light_the_hall(entity_id, service, data):
+        # Like an automation: a change the call caused, and one that just happened meanwhile
+        service_lock(entity_id, service, data)
+        simulator.set_state("light.ceiling_lights", "on")
+        context, simulator._context = simulator._context, None
+        simulator.set_state("switch.sim_00002", "on")
+        simulator._context = context
+    simulator._service_lock = unlock_and_light_the_hall
+
+    result = await ha_server.handle_tool_call("lock-unlock", {"entity_id": "front_door"})
+    assert simulator.requests["ws call_service"] == 1
+    assert {state["entity_id"] for state in result} == {"lock.front_door", "light.ceiling_lights"}
+    await ha_server.stop()
+
+
+@pytest.mark.asyncio
+async def test_websocket_service_call_errors_are_httpx_errors(simulator):
+    ha_server = server_module.HomeAssistantMcpServer()
+    await ha_server.start()
+    await asyncio.wait_for(ha_server.ready.wait(), 5)
+
+    simulator.fail_next()
+    with pytest.raises(httpx.HTTPError, match="Simulated error"):
+        await ha_server.handle_tool_call("lock-unlock", {"entity_id": "front_door"})
+
+    ha_server._client.timeout = httpx.Timeout(0.05)
+    simulator.latency = 1.0
+    with pytest.raises(httpx.ReadTimeout):
+        await ha_server.handle_tool_call("lock-unlock", {"entity_id": "front_door"})
+    assert simulator.requests["POST /api/services/lock/unlock"] == 0
+    simulator.latency = 0
+    await ha_server.stop()
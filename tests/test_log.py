@@ -0,0 +1,43 @@
+import io
+import logging
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent / 'src'))
+
+from home_assistant_mcp.log import RateLimitFilter, SamplingFilter, StdoutGuard, protect_stdout
+
+
+def make_record(name, level=logging.INFO):
+    return logging.LogRecord(name, level, __file__, 1, "message", None, None)
+
+
+def test_sampling_uses_most_specific_prefix_and_keeps_warnings():
+    sampling = SamplingFilter({"mcp": 1.0, "mcp.server": 0.0})
+    assert sampling.filter(make_record("mcp.client"))
+    assert not sampling.filter(make_record("mcp.server.session"))
+    assert sampling.filter(make_record("mcp.server", logging.WARNING))
+    assert sampling.filter(make_record("home_assistant_mcp"))
+
+
+def test_rate_limit_drops_bursts():
+    limiter = RateLimitFilter({"home_assistant_mcp.events": 2})
+    kept = [limiter.filter(make_record("home_assistant_mcp.events")) for _ in range(10)]
+    assert kept.count(True) == 2
+    # Child loggers share the budget of the configured prefix
+    assert not limiter.filter(make_record("home_assistant_mcp.events.stream"))
+    assert limiter.filter(make_record("home_assistant_mcp.events", logging.ERROR))
+
+
+def test_protect_stdout_reroutes_prints(monkeypatch, caplog):
+    buffer = io.BytesIO()
+    monkeypatch.setattr(sys, "stdout", io.TextIOWrapper(buffer, encoding="utf-8"))
+
+    stdout = protect_stdout()
+    assert isinstance(sys.stdout, StdoutGuard)
+    with caplog.at_level(logging.WARNING, logger="stdout"):
+        print("debugging output")
+    stdout.write('{"jsonrpc": "2.0"}\n')
+    stdout.flush()
+
+    assert buffer.getvalue() == b'{"jsonrpc": "2.0"}\n'
+    assert "debugging output" in caplog.text
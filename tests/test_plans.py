@@ -0,0 +1,91 @@
+import asyncio
+import pytest
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent / 'src'))
+
+from home_assistant_mcp.server import HomeAssistantMcpServer
+from home_assistant_mcp.services.plans import PlanService
+from home_assistant_mcp.simulator import HomeAssistantSimulator
+
+
+class FakeTools:
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.running = 0
+        self.max_running = 0
+        self.calls = []
+
+    async def call_tool(self, name, arguments, session=None):
+        self.calls.append(name)
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await asyncio.sleep(arguments.get("sleep", self.delay))
+            if name == "fail":
+                raise ValueError("boom")
+            return [{"entity_id": arguments.get("entity_id", "lock.front_door"), "state": arguments.get("state", "locked")}]
+        finally:
+            self.running -= 1
+
+
+@pytest.mark.asyncio
+async def test_independent_steps_run_in_parallel():
+    tools = FakeTools()
+    plans = PlanService(tools.call_tool)
+    result = await plans.execute_plan([
+        {"id": "a", "tool": "lock-lock"},
+        {"id": "b", "tool": "light-turn_off"},
+        {"id": "c", "tool": "climate-set_temperature", "after": ["a", "b"]},
+    ])
+    assert result["ok"]
+    assert tools.max_running == 2
+    assert tools.calls[-1] == "climate-set_temperature"
+    assert result["steps"]["a"]["states"] == {"lock.front_door": "locked"}
+
+
+@pytest.mark.asyncio
+async def test_conditions_failures_and_timeouts():
+    tools = FakeTools(delay=0)
+    plans = PlanService(tools.call_tool)
+    result = await plans.execute_plan([
+        {"id": "check", "tool": "lock-lock", "arguments": {"state": "jammed"}},
+        {"id": "if_locked", "tool": "alarm_control_panel-arm", "when": {"step": "check", "state": "locked"}},
+        {"id": "if_jammed", "tool": "light-turn_on", "when": {"step": "check", "state": ["jammed", "unknown"]}},
+        {"id": "fail", "tool": "fail"},
+        {"id": "after_fail", "tool": "lock-unlock", "after": ["fail"]},
+        {"id": "slow", "tool": "lock-lock", "arguments": {"sleep": 1}, "timeout": 0.01},
+    ])
+    statuses = {step_id: outcome["status"] for step_id, outcome in result["steps"].items()}
+    assert statuses == {
+        "check": "ok", "if_locked": "skipped", "if_jammed": "ok",
+        "fail": "failed", "after_fail": "skipped", "slow": "timeout"
+    }
+    assert not result["ok"]
+    assert "alarm_control_panel-arm" not in tools.calls and "lock-unlock" not in tools.calls
+
+
+@pytest.mark.asyncio
+async def test_invalid_plans_are_rejected():
+    plans = PlanService(FakeTools().call_tool)
+    with pytest.raises(ValueError, match="depend on each other"):
+        await plans.execute_plan([{"id": "a", "tool": "x", "after": ["b"]}, {"id": "b", "tool": "x", "after": ["a"]}])
+    with pytest.raises(ValueError, match="unknown step"):
+        await plans.execute_plan([{"tool": "x", "after": ["missing"]}])
+    with pytest.raises(ValueError, match="nested"):
+        await plans.execute_plan([{"tool": "execute_plan"}])
+
+
+@pytest.mark.asyncio
+async def test_plan_through_server():
+    simulator = HomeAssistantSimulator(transition_time=0)
+    server = HomeAssistantMcpServer(http_transport=simulator.http_transport())
+    result = await server.handle_tool_call("execute_plan", {"steps": [
+        {"id": "lights", "tool": "light-turn_off", "arguments": {"entity_id": "ceiling_lights"}},
+        {"id": "lock", "tool": "lock-lock", "arguments": {"entity_id": "front_door"}},
+        {"id": "arm", "tool": "alarm_control_panel-arm", "arguments": {"entity_id": "alarm_control_panel", "alarm_mode": "arm_away"},
+         "after": ["lights"], "when": {"step": "lock", "entity_id": "lock.front_door", "state": ["locking", "locked"]}},
+    ]})
+    assert result["ok"], result
+    assert result["steps"]["arm"]["status"] == "ok"
+    assert simulator.get_state("alarm_control_panel.alarm_control_panel")["state"] in ("arming", "armed_away")
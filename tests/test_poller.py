@@ -0,0 +1,106 @@
+import asyncio
+import httpx
+import pytest
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent / 'src'))
+
+import home_assistant_mcp.server as server_module
+from home_assistant_mcp.poller import StatePoller
+from home_assistant_mcp.simulator import HomeAssistantSimulator
+from home_assistant_mcp.state import StateCache
+
+
+def fetcher(simulator):
+    client = httpx.AsyncClient(transport=simulator.http_transport(), base_url="http://simulator",
+                               headers={"Authorization": "Bearer token"})
+
+    async def fetch_states():
+        return (await client.get("/api/states")).json()
+    return fetch_states
+
+
+@pytest.mark.asyncio
+async def test_only_changes_reach_listeners():
+    simulator = HomeAssistantSimulator(entities=200, transition_time=0)
+    cache = StateCache()
+    changes = []
+    cache.add_listener(lambda entity_id, old, new: changes.append((entity_id, new and new.state)))
+    poller = StatePoller(fetcher(simulator), cache)
+
+    await poller.poll()
+    assert len(cache) == 205 and cache.live and poller.synced.is_set()
+    changes.clear()
+
+    await poller.poll()
+    assert changes == []
+    simulator.set_state("lock.front_door", "unlocked")
+    simulator.remove_state("light.ceiling_lights")
+    await poller.poll()
+    assert sorted(changes, key=str) == [("light.ceiling_lights", None), ("lock.front_door", "unlocked")]
+
+
+@pytest.mark.asyncio
+async def test_interval_adapts_to_activity():
+    simulator = HomeAssistantSimulator()
+    cache = StateCache()
+    poller = StatePoller(fetcher(simulator), cache, min_interval=0.01, max_interval=0.08, active_window=0.05)
+    poller.touch()
+    poller.start()
+    await asyncio.sleep(0.03)
+    assert poller.interval == 0.01
+
+    await asyncio.sleep(0.3)
+    assert poller.interval == 0.08
+    polls = simulator.requests["GET /api/states"]
+    # The first call after idling marks the cache stale and polls right away
+    poller.touch()
+    assert not cache.live
+    await asyncio.sleep(0.005)
+    assert cache.live and simulator.requests["GET /api/states"] == polls + 1
+    await poller.stop()
+
+
+@pytest.mark.asyncio
+async def test_paused_while_event_stream_is_connected():
+    simulator = HomeAssistantSimulator()
+    connected = asyncio.Event()
+    connected.set()
+    poller = StatePoller(fetcher(simulator), StateCache(), min_interval=0.01, paused=connected.is_set)
+    poller.start()
+    await asyncio.sleep(0.05)
+    assert simulator.requests["GET /api/states"] == 0
+
+    connected.clear()
+    await asyncio.wait_for(poller.synced.wait(), 1)
+    await poller.stop()
+
+
+@pytest.mark.asyncio
+async def test_server_reads_polled_states(monkeypatch):
+    monkeypatch.setattr(server_module, "STATE_POLL_ENABLED", True)
+    simulator = HomeAssistantSimulator(transition_time=0)
+    ha_server = server_module.HomeAssistantMcpServer(http_transport=simulator.http_transport())
+    await ha_server.start()
+
+    await ha_server.handle_tool_call("lock-unlock", {"entity_id": "front_door"})
+    for _ in range(3):
+        await ha_server.get_entity_state("light.ceiling_lights")
+    assert simulator.requests["GET /api/states/light.ceiling_lights"] == 0
+    await ha_server.stop()
+
+
+@pytest.mark.asyncio
+async def test_reads_right_after_a_command_see_its_changes(monkeypatch):
+    monkeypatch.setattr(server_module, "STATE_POLL_ENABLED", True)
+    monkeypatch.setattr(server_module, "STATE_POLL_MIN_SECONDS", 30.0)
+    simulator = HomeAssistantSimulator(transition_time=0)
+    ha_server = server_module.HomeAssistantMcpServer(http_transport=simulator.http_transport())
+    await ha_server.start()
+    await asyncio.wait_for(ha_server.ready.wait(), 5)
+
+    await ha_server.handle_tool_call("lock-unlock", {"entity_id": "front_door"})
+    assert ha_server._state_cache.live
+    assert (await ha_server.handle_tool_call("lock-get_state", {"entity_id": "front_door"}))["state"] == "unlocked"
+    assert simulator.requests["GET /api/states/lock.front_door"] == 0
+    await ha_server.stop()
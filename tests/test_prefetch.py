@@ -0,0 +1,142 @@
+import asyncio
+import gc
+import json
+import httpx
+import pytest
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent / 'src'))
+
+import home_assistant_mcp.server as server_module
+from home_assistant_mcp.metrics import metrics
+import home_assistant_mcp.prefetch as prefetch_module
+from home_assistant_mcp.prefetch import Prefetcher
+
+AREAS = {"living_room": ["light.ceiling_lights", "light.lamp", "sensor.temperature"]}
+
+
+class FakeHomeAssistant:
+    def __init__(self):
+        self.fetches = []
+        self.renders = 0
+
+    async def fetch_state(self, entity_id):
+        self.fetches.append(entity_id)
+        await asyncio.sleep(0)
+        return {"entity_id": entity_id, "state": "on"}
+
+    async def render_template(self, template, variables):
+        self.renders += 1
+        members = [m for members in AREAS.values() if variables["entity_id"] in members for m in members]
+        return json.dumps(members)
+
+
+async def settle(prefetcher):
+    while prefetcher._tasks:
+        await asyncio.wait(set(prefetcher._tasks))
+
+
+@pytest.mark.asyncio
+async def test_area_neighbors_are_prefetched_same_domain_first():
+    ha = FakeHomeAssistant()
+    prefetcher = Prefetcher(ha.fetch_state, ha.render_template, max_related=1)
+    prefetcher.observe("light.ceiling_lights")
+    await settle(prefetcher)
+
+    assert ha.fetches == ["light.lamp"]
+    misses = metrics.counter("prefetch.misses").value
+    assert prefetcher.take("light.lamp")["state"] == "on"
+    # Prefetched states answer one read only, and reads nothing predicted are not misses
+    assert prefetcher.take("light.lamp") is None
+    assert prefetcher.take("sensor.temperature") is None
+    assert metrics.counter("prefetch.misses").value == misses
+
+    prefetcher.observe("light.lamp")
+    await settle(prefetcher)
+    assert ha.renders == 1
+
+
+@pytest.mark.asyncio
+async def test_learned_successors_and_budget():
+    ha = FakeHomeAssistant()
+    prefetcher = Prefetcher(ha.fetch_state, ha.render_template, budget=4)
+    for _ in range(2):
+        prefetcher.observe("humidifier.humidifier")
+        prefetcher.observe("climate.climate")
+    assert prefetcher.related("humidifier.humidifier") == ["climate.climate"]
+    await settle(prefetcher)
+
+    skipped = metrics.counter("prefetch.skipped_budget").value
+    for entity_id in ("lock.a", "lock.b", "lock.c"):
+        prefetcher.observe(entity_id)
+    await settle(prefetcher)
+    assert metrics.counter("prefetch.skipped_budget").value > skipped
+    assert ha.renders + len(ha.fetches) <= 4
+
+
+@pytest.mark.asyncio
+async def test_command_during_prefetch_discards_result():
+    ha = FakeHomeAssistant()
+    started, release = asyncio.Event(), asyncio.Event()
+
+    async def slow_fetch(entity_id):
+        started.set()
+        await release.wait()
+        return await ha.fetch_state(entity_id)
+
+    prefetcher = Prefetcher(slow_fetch, ha.render_template, max_related=1)
+    prefetcher.observe("light.ceiling_lights")
+    await started.wait()
+    prefetcher.invalidate("light.lamp")
+    release.set()
+    await settle(prefetcher)
+    assert ha.fetches == ["light.lamp"]
+    assert prefetcher.take("light.lamp") is None
+
+
+@pytest.mark.asyncio
+async def test_server_serves_prefetched_state(monkeypatch):
+    monkeypatch.setattr(server_module, "PREFETCH_ENABLED", True)
+    requests = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request.url.path)
+        if request.url.path == "/api/template":
+            return httpx.Response(200, text=json.dumps(AREAS["living_room"]))
+        if request.url.path.startswith("/api/states/"):
+            return httpx.Response(200, json={"entity_id": request.url.path.rsplit("/", 1)[1], "state": "off"})
+        return httpx.Response(200, json=[])
+
+    ha_server = server_module.HomeAssistantMcpServer(http_transport=httpx.MockTransport(handler))
+    await ha_server.handle_tool_call("light-turn_on", {"entity_id": "ceiling_lights"})
+    await settle(ha_server._prefetcher)
+    fetched = requests.count("/api/states/light.lamp")
+    assert fetched == 1
+
+    assert (await ha_server.get_entity_state("light.lamp"))["state"] == "off"
+    assert requests.count("/api/states/light.lamp") == fetched
+    snapshot = json.loads(await ha_server.read_resource("ha://metrics"))
+    assert snapshot["prefetch.hits"] >= 1
+    await ha_server.stop()
+
+
+def test_gauges_do_not_keep_their_owner_alive():
+    ha = FakeHomeAssistant()
+    prefetcher = Prefetcher(ha.fetch_state, ha.render_template)
+    assert "prefetch.hit_rate" in metrics.snapshot()
+    del prefetcher
+    gc.collect()
+    assert "prefetch.hit_rate" not in metrics.snapshot()
+
+
+@pytest.mark.asyncio
+async def test_bookkeeping_stays_bounded(monkeypatch):
+    monkeypatch.setattr(prefetch_module, "MAX_TRACKED_ENTITIES", 50)
+    ha = FakeHomeAssistant()
+    prefetcher = Prefetcher(ha.fetch_state, ha.render_template, budget=10_000)
+    for i in range(200):
+        prefetcher.observe(f"sensor.s{i}")
+        prefetcher.invalidate(f"sensor.s{i}")
+        await settle(prefetcher)
+    assert len(prefetcher._areas) <= 50 and len(prefetcher._successors) <= 50
+    assert not prefetcher._inflight
@@ -0,0 +1,185 @@
+import asyncio
+import json
+import httpx
+import pytest
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent / 'src'))
+
+import home_assistant_mcp.server as server_module
+from home_assistant_mcp.profiles import SCOPE_TOOL, ToolProfile, ToolScopes
+from home_assistant_mcp.server import HomeAssistantMcpServer
+from home_assistant_mcp.tcp import TcpTransport
+
+
+class FakeSession:
+    def __init__(self):
+        self.list_changed = 0
+
+    async def send_tool_list_changed(self):
+        self.list_changed += 1
+
+
+def home_assistant(area_entities):
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/api/template":
+            areas = json.loads(request.content)["variables"]["areas"]
+            return httpx.Response(200, text=json.dumps([e for area in areas for e in area_entities.get(area, [])]))
+        return httpx.Response(404)
+    return httpx.MockTransport(handler)
+
+
+def names(tools):
+    return [tool.name for tool in tools]
+
+
+@pytest.mark.asyncio
+async def test_profile_filters_domains_areas_and_tools():
+    server = HomeAssistantMcpServer(http_transport=home_assistant({"hall": ["lock.front_door", "light.hall"]}))
+
+    session = FakeSession()
+    server.open_session(session, {"domains": ["lock", "climate"]})
+    tools, _ = await server.list_tools(session)
+    assert {t.split("-")[0] for t in names(tools) if "-" in t} == {"lock", "climate"}
+    assert "wait_for_state" in names(tools)
+
+    session = FakeSession()
+    server.open_session(session, {"areas": ["hall"]})
+    tools, _ = await server.list_tools(session)
+    assert {t.split("-")[0] for t in names(tools) if "-" in t} == {"lock", "light"}
+
+    session = FakeSession()
+    server.open_session(session, {"tools": ["lock-*", "wait_for_state"]})
+    tools, _ = await server.list_tools(session)
+    assert names(tools) == ["lock-lock", "lock-unlock", "wait_for_state", SCOPE_TOOL]
+
+
+@pytest.mark.asyncio
+async def test_scope_tool_changes_catalog_and_notifies():
+    server = HomeAssistantMcpServer()
+    session = FakeSession()
+    server.open_session(session, {"domains": ["lock"]})
+
+    with pytest.raises(ValueError):
+        await server.handle_tool_call("light-turn_on", {"entity_id": "ceiling_lights"}, session)
+
+    result = await server.handle_tool_call(SCOPE_TOOL, {"domains": ["light"]}, session)
+    assert "light-turn_on" in result["tools"] and "lock-lock" not in result["tools"]
+    assert session.list_changed == 1
+
+    await server.handle_tool_call(SCOPE_TOOL, {"domains": ["light"]}, session)
+    assert session.list_changed == 1
+
+
+@pytest.mark.asyncio
+async def test_session_profiles_cannot_widen_the_default(monkeypatch):
+    monkeypatch.setattr(server_module, "TOOL_PROFILE", ToolProfile(domains=["light"]))
+    server = HomeAssistantMcpServer()
+    session = FakeSession()
+    server.open_session(session, {"domains": ["light", "lock"]})
+    assert {t.split("-")[0] for t in names((await server.list_tools(session))[0]) if "-" in t} == {"light"}
+
+    result = await server.handle_tool_call(SCOPE_TOOL, {}, session)
+    assert "lock-unlock" not in result["tools"] and "light-turn_on" in result["tools"]
+    with pytest.raises(ValueError):
+        await server.handle_tool_call("lock-unlock", {"entity_id": "front_door"}, session)
+
+
+@pytest.mark.asyncio
+async def test_failed_area_lookup_falls_back_to_domains():
+    lookups = []
+
+    async def resolve(areas):
+        lookups.append(areas)
+        raise RuntimeError("template error")
+
+    catalog = HomeAssistantMcpServer().get_all_tools()
+    tool_domains = {tool.name: tool.name.split("-")[0] if "-" in tool.name else None for tool in catalog}
+    scopes = ToolScopes(lambda: catalog, tool_domains, ToolProfile(domains=["lock", "light"]), resolve)
+    session = FakeSession()
+    scopes.open_session(session, {"areas": ["hall"], "domains": ["lock"]})
+    assert await scopes.is_visible(session, "lock-lock")
+    assert not await scopes.is_visible(session, "light-turn_on")
+    assert len(lookups) == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_area_lookup_keeps_the_default_profile_closed():
+    entities = ["lock.front_door"]
+
+    async def resolve(areas):
+        if entities is None:
+            raise RuntimeError("template error")
+        return entities
+
+    catalog = HomeAssistantMcpServer().get_all_tools()
+    tool_domains = {tool.name: tool.name.split("-")[0] if "-" in tool.name else None for tool in catalog}
+    scopes = ToolScopes(lambda: catalog, tool_domains, ToolProfile(areas=["hall"]), resolve)
+
+    # Never resolved: no domain tools at all
+    entities = None
+    session = FakeSession()
+    assert not await scopes.is_visible(session, "lock-lock")
+    assert await scopes.is_visible(session, "wait_for_state")
+    assert not await scopes.profile_allows(None, "light-turn_on")
+
+    # Resolved once: the last known domains are kept while the lookup fails
+    entities = ["lock.front_door"]
+    scopes.invalidate_areas()
+    assert await scopes.is_visible(session, "lock-lock")
+    entities = None
+    scopes.invalidate_areas()
+    assert await scopes.is_visible(session, "lock-lock")
+    assert not await scopes.is_visible(session, "light-turn_on")
+    assert not await scopes.profile_allows(None, "light-turn_on")
+
+
+@pytest.mark.asyncio
+async def test_pagination():
+    catalog = HomeAssistantMcpServer().get_all_tools()
+    scopes = ToolScopes(lambda: catalog, {}, ToolProfile(), resolve_area_entities=None, page_size=5)
+    session = FakeSession()
+
+    pages, cursor = [], None
+    while True:
+        tools, cursor = await scopes.list_tools(session, cursor)
+        pages.append(tools)
+        if cursor is None:
+            break
+    assert [tool for page in pages for tool in page] == catalog
+    assert all(len(page) == 5 for page in pages[:-1])
+
+    tools, cursor = await scopes.list_tools(session, None, paginate=False)
+    assert tools == catalog and cursor is None
+    with pytest.raises(ValueError):
+        await scopes.list_tools(session, "bogus")
+
+
+@pytest.mark.asyncio
+async def test_tcp_profile_from_initialize():
+    transport = TcpTransport(HomeAssistantMcpServer(), port=0)
+    await transport.start()
+    reader, writer = await asyncio.open_connection(transport.host, transport.port)
+
+    async def call(message_id, method, params):
+        writer.write(json.dumps({"jsonrpc": "2.0", "id": message_id, "method": method, "params": params}).encode() + b"\n")
+        await writer.drain()
+        return json.loads(await reader.readline())
+
+    await call(1, "initialize", {"capabilities": {"experimental": {"homeassistant/toolProfile": {"tools": ["lock-*"]}}}})
+    response = await call(2, "tools/list", {})
+    assert [tool["name"] for tool in response["result"]["tools"]] == ["lock-lock", "lock-unlock", SCOPE_TOOL]
+
+    writer.write(json.dumps({
+        "jsonrpc": "2.0", "id": 3, "method": "tools/call",
+        "params": {"name": SCOPE_TOOL, "arguments": {"tools": ["light-*"]}}
+    }).encode() + b"\n")
+    await writer.drain()
+    assert json.loads(await reader.readline())["method"] == "notifications/tools/list_changed"
+    assert json.loads(await reader.readline())["id"] == 3
+
+    response = await call(4, "tools/list", {"cursor": "x"})
+    assert response["error"]["code"] == -32602
+
+    writer.close()
+    await transport.close()
@@ -0,0 +1,81 @@
+import asyncio
+import json
+import pytest
+import sys
+import time
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent / 'src'))
+
+from home_assistant_mcp.profiling import Profiler
+from home_assistant_mcp.services.diagnostics import DiagnosticsService
+
+
+async def waiting_tool():
+    await asyncio.sleep(0.1)
+    return "done"
+
+
+async def blocking_tool():
+    await asyncio.sleep(0)
+    deadline = time.monotonic() + 0.2
+    while time.monotonic() < deadline:
+        pass
+
+
+@pytest.mark.asyncio
+async def test_tool_timings_and_slow_callbacks(tmp_path):
+    profiler = Profiler()
+    profiler.start(interval=0.005, slow_callback=0.05)
+    try:
+        assert await profiler.measure("wait", waiting_tool()) == "done"
+        await profiler.measure("block", blocking_tool())
+    finally:
+        await profiler.stop()
+
+    summary = profiler.summary()
+    wait, block = summary["tools"]["wait"], summary["tools"]["block"]
+    assert wait["wall_ms_total"] >= 100 and wait["cpu_ms_total"] < 50
+    assert block["cpu_ms_total"] >= 150
+    slow = summary["slow_callbacks"][0]
+    assert slow["tool"] == "block" and slow["duration_ms"] >= 50
+    assert "blocking_tool (test_profiling.py" in slow["stack"]
+
+    paths = profiler.dump(str(tmp_path))
+    lines = Path(paths["stacks"]).read_text().splitlines()
+    stack, count = lines[0].rsplit(" ", 1)
+    assert stack.startswith("tool:block;") and int(count) > 0
+    assert json.loads(Path(paths["summary"]).read_text())["tools"]["block"]["calls"] == 1
+
+
+@pytest.mark.asyncio
+async def test_measure_passes_through_results_and_errors():
+    profiler = Profiler()
+
+    async def failing():
+        await asyncio.sleep(0)
+        raise ValueError("boom")
+
+    assert await profiler.measure("idle", waiting_tool()) == "done"
+    profiler.start(sample_rate=1.0)
+    try:
+        with pytest.raises(ValueError):
+            await profiler.measure("fail", failing())
+        task = asyncio.ensure_future(profiler.measure("wait", waiting_tool()))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+    finally:
+        await profiler.stop()
+    assert set(profiler.summary()["tools"]) == {"fail", "wait"}
+
+
+@pytest.mark.asyncio
+async def test_profile_tool(tmp_path):
+    service = DiagnosticsService(Profiler(), str(tmp_path))
+    assert (await service.profile("start"))["running"]
+    assert not (await service.profile("stop"))["running"]
+    result = await service.profile("dump")
+    assert Path(result["stacks"]).exists()
+    with pytest.raises(ValueError):
+        await service.profile("explode")
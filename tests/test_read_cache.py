@@ -0,0 +1,51 @@
+import pytest
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent / 'src'))
+
+from home_assistant_mcp.read_cache import StateReadCache
+from home_assistant_mcp.server import HomeAssistantMcpServer
+from home_assistant_mcp.simulator import HomeAssistantSimulator
+
+
+@pytest.mark.asyncio
+async def test_repeated_reads_are_served_until_a_service_call():
+    simulator = HomeAssistantSimulator(transition_time=0)
+    server = HomeAssistantMcpServer(http_transport=simulator.http_transport())
+
+    for _ in range(3):
+        state = await server.handle_tool_call("lock-get_state", {"entity_id": "front_door"})
+    assert state["state"] == "locked"
+    assert simulator.requests["GET /api/states/lock.front_door"] == 1
+
+    await server.handle_tool_call("lock-unlock", {"entity_id": "front_door"})
+    state = await server.handle_tool_call("lock-get_state", {"entity_id": "front_door"})
+    assert state["state"] == "unlocked"
+    assert simulator.requests["GET /api/states/lock.front_door"] == 2
+
+
+@pytest.mark.asyncio
+async def test_domain_ttls_and_racing_reads():
+    cache = StateReadCache({"sensor": 1.0, "camera": 0}, default_ttl=5.0, max_entries=2)
+    assert cache.ttl("sensor.temperature") == 1.0 and cache.ttl("lock.front_door") == 5.0
+
+    async def fetch(entity_id):
+        return {"entity_id": entity_id, "state": "on"}
+
+    await cache.fetch("camera.porch", fetch)
+    assert cache.get("camera.porch") is None
+
+    # A read that was in flight while a service call changed the entity is not kept
+    async def racing_fetch(entity_id):
+        cache.invalidate([entity_id])
+        return await fetch(entity_id)
+    await cache.fetch("lock.front_door", racing_fetch)
+    assert cache.get("lock.front_door") is None
+
+    for entity_id in ("light.a", "light.b", "light.c"):
+        await cache.fetch(entity_id, fetch)
+    assert cache.get("light.a") is None and cache.get("light.c") is not None
+
+    # Nothing is kept for entities without a read in flight
+    cache.invalidate(f"sensor.s{i}" for i in range(100))
+    assert cache.get("light.c") is not None and not cache._reads
@@ -0,0 +1,111 @@
+import asyncio
+import gzip
+import httpx
+import json
+import pytest
+import sys
+import time
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent / 'src'))
+
+import home_assistant_mcp.server as server_module
+from home_assistant_mcp.recording import TrafficRecorder, TrafficReplay
+from home_assistant_mcp.simulator import HomeAssistantSimulator
+
+
+async def session(ha_server):
+    """A short agent session; returns what the tools answered"""
+    await ha_server.start()
+    await asyncio.wait_for(ha_server._event_stream.connected.wait(), 5)
+    results = [
+        await ha_server.handle_tool_call("lock-unlock", {"entity_id": "front_door"}),
+        await ha_server.handle_tool_call("light-turn_on", {"entity_id": "ceiling_lights", "brightness_pct": 50}),
+        await ha_server.handle_tool_call("wait_for_state", {"entity_id": "lock.front_door", "state": "unlocked", "timeout": 5}),
+        await ha_server.handle_tool_call("alarm_control_panel-disarm", {"entity_id": "alarm", "code": "1234"}),
+    ]
+    await ha_server.stop()
+    return [{key: value for key, value in json.loads(json.dumps(result)).items() if key != "elapsed"}
+            if isinstance(result, dict) else [state["state"] for state in result] for result in results]
+
+
+@pytest.mark.asyncio
+async def test_recorded_session_replays_without_home_assistant(tmp_path, monkeypatch):
+    path = str(tmp_path / "traffic.jsonl.gz")
+    simulator = HomeAssistantSimulator(token="secret-token", transition_time=0.05)
+    simulator.alarm_code = "1234"
+    await simulator.start()
+    monkeypatch.setattr(server_module, "HOMEASSISTANT_BASE_URL", simulator.url)
+    monkeypatch.setattr(server_module, "API_KEY", "secret-token")
+    monkeypatch.setattr(server_module, "EVENT_STREAM_ENABLED", True)
+    monkeypatch.setattr(server_module, "RECORD_FILE", path)
+    recorded = await session(server_module.HomeAssistantMcpServer())
+    await simulator.close()
+
+    text = gzip.open(path, "rt").read()
+    # The code as a value: context IDs and timestamps may contain its digits
+    assert "secret-token" not in text and "\"1234\"" not in text
+    kinds = {json.loads(line)["kind"] for line in text.splitlines()}
+    assert {"header", "http", "ws_open", "ws"} <= kinds
+
+    monkeypatch.setattr(server_module, "RECORD_FILE", None)
+    monkeypatch.setattr(server_module, "REPLAY_FILE", path)
+    monkeypatch.setattr(server_module, "REPLAY_SPEED", "fast")
+    assert await session(server_module.HomeAssistantMcpServer()) == recorded
+
+
+@pytest.mark.asyncio
+async def test_replay_speed(tmp_path):
+    path = str(tmp_path / "traffic.jsonl.gz")
+    simulator = HomeAssistantSimulator(latency=0.1)
+    recorder = TrafficRecorder(path)
+    async with httpx.AsyncClient(transport=recorder.transport(simulator.http_transport()), headers={"Authorization": "Bearer x"}) as client:
+        await client.get("http://ha/api/states/lock.front_door")
+    recorder.close()
+
+    for speed, fast in (("recorded", False), ("fast", True)):
+        replay = TrafficReplay(path, speed)
+        async with httpx.AsyncClient(transport=replay.http_transport()) as client:
+            started = time.monotonic()
+            response = await client.get("http://ha/api/states/lock.front_door")
+            elapsed = time.monotonic() - started
+            assert response.json()["state"] == "locked"
+            assert (elapsed < 0.05) == fast
+            # Repeats get the last recorded response; unrecorded requests a 404
+            assert (await client.get("http://ha/api/states/lock.front_door")).status_code == 200
+            assert (await client.get("http://ha/api/states/lock.back_door")).status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_tokens_in_urls_are_redacted(tmp_path, monkeypatch):
+    path = str(tmp_path / "traffic.jsonl.gz")
+    simulator = HomeAssistantSimulator(token="secret-token")
+    picture = "/api/camera_proxy/camera.porch?token=camera-secret&width=640"
+    simulator.set_state("camera.porch", "idle", {"entity_picture": picture, "access_token": "camera-secret"})
+    await simulator.start()
+    monkeypatch.setattr(server_module, "HOMEASSISTANT_BASE_URL", simulator.url)
+    monkeypatch.setattr(server_module, "API_KEY", "secret-token")
+    monkeypatch.setattr(server_module, "EVENT_STREAM_ENABLED", True)
+    monkeypatch.setattr(server_module, "RECORD_FILE", path)
+    ha_server = server_module.HomeAssistantMcpServer()
+    await ha_server.start()
+    await asyncio.wait_for(ha_server.ready.wait(), 5)
+    await ha_server._request("GET", "/api/states/camera.porch")
+    await ha_server._request("GET", picture)
+    await ha_server.stop()
+    await simulator.close()
+
+    text = gzip.open(path, "rt").read()
+    assert "camera-secret" not in text
+    entries = [json.loads(line) for line in text.splitlines()]
+    ws_camera = next(state for entry in entries if entry["kind"] == "ws" and entry["dir"] == "in"
+                     and isinstance(entry["message"].get("result"), list)
+                     for state in entry["message"]["result"] if state["entity_id"] == "camera.porch")
+    assert ws_camera["attributes"]["entity_picture"] == "/api/camera_proxy/camera.porch?token=REDACTED&width=640"
+    http_camera = next(json.loads(entry["body"]) for entry in entries
+                       if entry["kind"] == "http" and entry["path"] == "/api/states/camera.porch")
+    assert http_camera["attributes"] == ws_camera["attributes"]
+
+    # Requests with a token in the URL still find their recorded response
+    async with httpx.AsyncClient(transport=TrafficReplay(path, "fast").http_transport()) as client:
+        response = await client.get("http://ha/api/camera_proxy/camera.porch?token=other-token&width=640")
+        assert response.json() != {"message": "Not in the recording"}
@@ -0,0 +1,73 @@
+import asyncio
+import json
+import pytest
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent / 'src'))
+
+from home_assistant_mcp.state import StateCache
+from home_assistant_mcp.resources import ResourceManager
+
+
+class FakeSession:
+    def __init__(self):
+        self.updates = []
+
+    async def send_resource_updated(self, uri):
+        self.updates.append(str(uri))
+
+
+def make_state(entity_id, state, last_updated="2024-01-01T00:00:00"):
+    return {"entity_id": entity_id, "state": state, "attributes": {}, "last_updated": last_updated}
+
+
+async def no_fetch(*args):
+    raise AssertionError("unexpected REST fetch")
+
+
+def make_manager(cache, interval=0.05):
+    return ResourceManager(cache, get_state=no_fetch, get_all_states=no_fetch, domains=["lock"], coalesce_interval=interval)
+
+
+@pytest.mark.asyncio
+async def test_read_state_and_domain_from_cache():
+    cache = StateCache()
+    cache.live = True
+    cache.replace_all([make_state("lock.front_door", "locked"), make_state("light.kitchen", "on")])
+    manager = make_manager(cache)
+
+    state = json.loads(await manager.read_resource("ha://state/lock.front_door"))
+    assert state["state"] == "locked"
+    domain = json.loads(await manager.read_resource("ha://domain/lock"))
+    assert [s["entity_id"] for s in domain] == ["lock.front_door"]
+
+
+@pytest.mark.asyncio
+async def test_subscription_updates_are_coalesced():
+    cache = StateCache()
+    manager = make_manager(cache)
+    session = FakeSession()
+    manager.subscribe(session, "ha://state/sensor.humidity")
+
+    cache.set("sensor.humidity", make_state("sensor.humidity", "50"))
+    await asyncio.sleep(0)
+    for value in range(51, 60):
+        cache.set("sensor.humidity", make_state("sensor.humidity", str(value)))
+    cache.set("sensor.other", make_state("sensor.other", "1"))
+    await asyncio.sleep(0.1)
+
+    # One immediate notification plus one for the whole burst
+    assert session.updates == ["ha://state/sensor.humidity", "ha://state/sensor.humidity"]
+
+
+@pytest.mark.asyncio
+async def test_unsubscribe_stops_updates():
+    cache = StateCache()
+    manager = make_manager(cache, interval=0)
+    session = FakeSession()
+    manager.subscribe(session, "ha://domain/lock")
+    manager.unsubscribe(session, "ha://domain/lock")
+
+    cache.set("lock.front_door", make_state("lock.front_door", "unlocked"))
+    await asyncio.sleep(0.01)
+    assert session.updates == []
@@ -0,0 +1,139 @@
+import asyncio
+import pytest
+import pytest_asyncio
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent / 'src'))
+
+import home_assistant_mcp.server as server_module
+from home_assistant_mcp.services import rules as rules_module
+from home_assistant_mcp.services.rules import RuleService
+from home_assistant_mcp.simulator import HomeAssistantSimulator
+from home_assistant_mcp.state import StateCache
+
+
+def make_state(entity_id, state, **attributes):
+    return {"entity_id": entity_id, "state": state, "attributes": attributes}
+
+
+class FakeTools:
+    def __init__(self):
+        self.calls = []
+
+    async def call_tool(self, name, arguments):
+        self.calls.append((name, arguments))
+
+    def resolve_tool(self, name):
+        if "-" not in name:
+            raise ValueError(f"Unknown tool {name}")
+
+
+async def settle(service):
+    await asyncio.sleep(0)
+    await service.stop()
+
+
+@pytest.mark.asyncio
+async def test_rule_fires_when_condition_becomes_true(monkeypatch):
+    monkeypatch.setattr(rules_module, "MIN_FIRE_INTERVAL_SECONDS", 0)
+    cache, tools = StateCache(), FakeTools()
+    service = RuleService(cache, tools.call_tool, tools.resolve_tool)
+    cache.set("sensor.humidity", make_state("sensor.humidity", "70"))
+    rule = await service.add_rule("sensor.humidity", "humidifier-turn_on", {"entity_id": "bath"}, above=65)
+
+    # Already above the threshold when added, so only the next rise fires
+    cache.set("sensor.humidity", make_state("sensor.humidity", "72"))
+    cache.set("sensor.humidity", make_state("sensor.humidity", "60"))
+    cache.set("sensor.humidity", make_state("sensor.humidity", "66"))
+    cache.set("sensor.humidity", make_state("sensor.humidity", "unavailable"))
+    await settle(service)
+    assert tools.calls == [("humidifier-turn_on", {"entity_id": "bath"})]
+
+    await service.remove_rule(rule["rule_id"])
+    cache.set("sensor.humidity", make_state("sensor.humidity", "90"))
+    assert (await service.list_rules())["rules"] == []
+    assert not cache._entity_listeners
+
+
+@pytest.mark.asyncio
+async def test_rules_are_indexed_by_entity():
+    cache, tools = StateCache(), FakeTools()
+    service = RuleService(cache, tools.call_tool, tools.resolve_tool)
+    await service.add_rule("alarm_control_panel.home", "lock-lock", {"entity_id": "front_door"}, state=["armed_away", "armed_home"])
+    await service.add_rule("light.porch", "light-turn_off", attribute="brightness", below=10)
+
+    cache.set("light.kitchen", make_state("light.kitchen", "on"))
+    cache.set("alarm_control_panel.home", make_state("alarm_control_panel.home", "armed_home"))
+    await settle(service)
+    assert tools.calls == [("lock-lock", {"entity_id": "front_door"})]
+    assert list(cache._entity_listeners) == ["alarm_control_panel.home", "light.porch"]
+
+    with pytest.raises(ValueError):
+        await service.add_rule("light.porch", "add_rule", state="on")
+    with pytest.raises(ValueError):
+        await service.add_rule("light.porch", "unknown", state="on")
+
+
+@pytest_asyncio.fixture
+async def simulator(monkeypatch):
+    simulator = HomeAssistantSimulator(token="test-token", transition_time=0.01)
+    await simulator.start()
+    monkeypatch.setattr(server_module, "HOMEASSISTANT_BASE_URL", simulator.url)
+    monkeypatch.setattr(server_module, "API_KEY", "test-token")
+    monkeypatch.setattr(server_module, "EVENT_STREAM_ENABLED", True)
+    yield simulator
+    await simulator.close()
+
+
+@pytest.mark.asyncio
+async def test_rule_reacts_to_event_stream(simulator):
+    ha_server = server_module.HomeAssistantMcpServer()
+    await ha_server.start()
+    await asyncio.wait_for(ha_server._event_stream.connected.wait(), 5)
+    simulator.set_state("lock.front_door", "unlocked")
+    await ha_server.handle_tool_call("add_rule", {
+        "entity_id": "alarm_control_panel.alarm_control_panel",
+        "state": "armed_away",
+        "tool": "lock-lock",
+        "arguments": {"entity_id": "front_door"}
+    })
+
+    await ha_server.handle_tool_call("alarm_control_panel-arm", {
+        "entity_id": "alarm_control_panel", "alarm_mode": "arm_away"
+    })
+    result = await ha_server.handle_tool_call(
+        "wait_for_state", {"entity_id": "lock.front_door", "state": "locked", "timeout": 5}
+    )
+    assert result["matched"]
+    assert (await ha_server.handle_tool_call("list_rules", {}))["rules"][0]["fired"] == 1
+    await ha_server.stop()
+
+
+@pytest.mark.asyncio
+async def test_rule_actions_stay_in_the_session_scope(monkeypatch):
+    monkeypatch.setattr(rules_module, "MIN_FIRE_INTERVAL_SECONDS", 0)
+    ha_server = server_module.HomeAssistantMcpServer()
+    session = object()
+    ha_server.open_session(session, {"domains": ["light"]})
+    for tool in ("lock-unlock", "execute_plan"):
+        with pytest.raises(ValueError):
+            await ha_server.handle_tool_call("add_rule", {
+                "entity_id": "light.porch", "state": "off", "tool": tool, "arguments": {}
+            }, session)
+    await ha_server.handle_tool_call("add_rule", {
+        "entity_id": "light.porch", "state": "off", "tool": "light-turn_on", "arguments": {"entity_id": "porch"}
+    }, session)
+
+    # Arguments are checked when the rule is added, not when it fires
+    with pytest.raises(ValueError, match="brightness_pct must be at most 100"):
+        await ha_server.handle_tool_call("add_rule", {
+            "entity_id": "light.porch", "state": "off", "tool": "light-turn_on",
+            "arguments": {"entity_id": "porch", "brightness_pct": 150}
+        }, session)
+    assert len((await ha_server.handle_tool_call("list_rules", {}))["rules"]) == 1
+
+    # Checked again when the rule fires
+    monkeypatch.setattr(ha_server._scopes, "_default", server_module.ToolProfile(domains=["lock"]))
+    ha_server._state_cache.set("light.porch", make_state("light.porch", "off"))
+    await settle(ha_server._rules)
+    assert "not in the scope" in (await ha_server.handle_tool_call("list_rules", {}))["rules"][0]["last_error"]
@@ -0,0 +1,162 @@
+import asyncio
+import gzip
+import httpx
+import pytest
+import sys
+import time
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent / 'src'))
+
+import home_assistant_mcp.server as server_module
+from home_assistant_mcp.metrics import metrics
+from home_assistant_mcp.profiling import profiler
+from home_assistant_mcp.server import HomeAssistantMcpServer, parse_number_settings
+from home_assistant_mcp.simulator import HomeAssistantSimulator
+
+
+def test_parse_number_settings():
+    assert parse_number_settings("mcp.server=0.1, home_assistant_mcp=5") == {"mcp.server": 0.1, "home_assistant_mcp": 5.0}
+    assert parse_number_settings("sensor=0.5,lock=30") == {"sensor": 0.5, "lock": 30.0}
+    assert parse_number_settings(None) == {}
+
+
+@pytest.mark.asyncio
+async def test_turn_light_on_success():
+    simulator = HomeAssistantSimulator()
+    server = HomeAssistantMcpServer(http_transport=simulator.http_transport())
+
+    result = await server.handle_tool_call("light-turn_on", {"entity_id": "ceiling_lights", "brightness_pct": 100})
+    assert result[0]["state"] == "on"
+    assert result[0]["attributes"]["brightness"] == 255
+    assert simulator.requests["POST /api/services/light/turn_on"] == 1
+
+
+@pytest.mark.asyncio
+async def test_turn_light_on_error():
+    simulator = HomeAssistantSimulator()
+    server = HomeAssistantMcpServer(http_transport=simulator.http_transport())
+
+    simulator.available = False
+    with pytest.raises(httpx.ConnectError):
+        await server.handle_tool_call("light-turn_on", {"entity_id": "ceiling_lights"})
+
+
+@pytest.mark.asyncio
+async def test_turn_light_on_no_brightness():
+    simulator = HomeAssistantSimulator()
+    server = HomeAssistantMcpServer(http_transport=simulator.http_transport())
+
+    await server.handle_tool_call("light-turn_on", {"entity_id": "ceiling_lights", "brightness_pct": 20})
+    await server.handle_tool_call("light-turn_off", {"entity_id": "ceiling_lights"})
+    result = await server.handle_tool_call("light-turn_on", {"entity_id": "ceiling_lights"})
+    assert result[0]["state"] == "on"
+    assert (await server.get_entity_state("light.ceiling_lights"))["state"] == "on"
+
+
+@pytest.mark.asyncio
+async def test_warm_up_primes_pool_and_state_cache():
+    simulator = HomeAssistantSimulator()
+    server = HomeAssistantMcpServer(http_transport=simulator.http_transport())
+    await server.warm_up()
+    assert server.ready.is_set()
+    assert simulator.requests["GET /api/config"] == 4
+    assert "lock.front_door" in server._state_cache
+
+
+@pytest.mark.asyncio
+async def test_start_serves_before_warm_up_finishes(monkeypatch):
+    monkeypatch.setattr(server_module, "EVENT_STREAM_ENABLED", False)
+    simulator = HomeAssistantSimulator(latency=0.2)
+    server = HomeAssistantMcpServer(http_transport=simulator.http_transport())
+    started = time.monotonic()
+    await server.start()
+    assert time.monotonic() - started < 0.1 and not server.ready.is_set()
+
+    # The first call waits for warm-up instead of racing it for connections
+    await server.handle_tool_call("lock-lock", {"entity_id": "front_door"})
+    assert server.ready.is_set() and simulator.requests["GET /api/config"] == 4
+    await server.stop()
+
+
+@pytest.mark.asyncio
+async def test_tool_call_deadline_cancels_upstream_request():
+    simulator = HomeAssistantSimulator(latency=30)
+    server = HomeAssistantMcpServer(http_transport=simulator.http_transport())
+    expired = metrics.counter("tool_calls.deadline_exceeded").value
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        await server.handle_tool_call("lock-lock", {"entity_id": "front_door"}, timeout=0.05)
+    assert time.monotonic() - started < 1
+    assert metrics.counter("tool_calls.deadline_exceeded").value == expired + 1
+    assert server._in_flight == 0
+
+    cancelled = metrics.counter("tool_calls.cancelled").value
+    task = asyncio.create_task(server.handle_tool_call("lock-get_state", {"entity_id": "front_door"}))
+    await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert metrics.counter("tool_calls.cancelled").value == cancelled + 1
+
+
+@pytest.mark.asyncio
+async def test_large_responses_arrive_compressed():
+    simulator = HomeAssistantSimulator(entities=500)
+    server = HomeAssistantMcpServer(http_transport=simulator.http_transport())
+    response = await server._request("GET", "/api/states")
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.num_bytes_downloaded < len(response.content) / 3
+    assert len(response.json()) == 505
+
+
+@pytest.mark.asyncio
+async def test_stop_drains_running_calls_and_refuses_new_ones():
+    simulator = HomeAssistantSimulator(latency=0.1)
+    server = HomeAssistantMcpServer(http_transport=simulator.http_transport())
+    running = asyncio.create_task(server.handle_tool_call("lock-lock", {"entity_id": "front_door"}))
+    await asyncio.sleep(0.01)
+
+    await server.stop()
+    assert running.done() and running.result()[0]["entity_id"] == "lock.front_door"
+    with pytest.raises(ValueError, match="shutting down"):
+        await server.handle_tool_call("lock-unlock", {"entity_id": "front_door"})
+
+
+@pytest.mark.asyncio
+async def test_stop_runs_every_step_when_one_fails(tmp_path, monkeypatch):
+    simulator = HomeAssistantSimulator()
+    (tmp_path / "profiles").write_text("not a directory")
+    monkeypatch.setattr(server_module, "PROFILE_DIR", str(tmp_path / "profiles"))
+    monkeypatch.setattr(server_module, "RECORD_FILE", str(tmp_path / "traffic.jsonl.gz"))
+    server = HomeAssistantMcpServer(http_transport=simulator.http_transport())
+    await server.handle_tool_call("lock-lock", {"entity_id": "front_door"})
+
+    async def fail():
+        raise RuntimeError("stuck")
+    monkeypatch.setattr(server._rules, "stop", fail)
+    profiler.start()
+    await server.stop()
+    assert not profiler.running and server._client.is_closed
+    assert "lock/lock" in gzip.open(tmp_path / "traffic.jsonl.gz", "rt").read()
+
+
+@pytest.mark.asyncio
+async def test_humidifier_tools():
+    simulator = HomeAssistantSimulator()
+    server = HomeAssistantMcpServer(http_transport=simulator.http_transport())
+
+    result = await server.handle_tool_call("humidifier-set_humidity", {"entity_id": "humidifier", "humidity": 55})
+    assert result[0]["attributes"]["humidity"] == 55
+    result = await server.handle_tool_call("humidifier-turn_off", {"entity_id": "humidifier"})
+    assert result[0]["state"] == "off"
+    await server.stop()
+
+
+@pytest.mark.asyncio
+async def test_metrics_report_process_usage():
+    simulator = HomeAssistantSimulator()
+    server = HomeAssistantMcpServer(http_transport=simulator.http_transport())
+    snapshot = metrics.snapshot()
+    assert snapshot["process.cpu_seconds"] > 0
+    assert snapshot["process.max_rss_mb"] > 1
+    await server.stop()
@@ -0,0 +1,113 @@
+import asyncio
+import httpx
+import json
+import pytest
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent / 'src'))
+
+from websockets.asyncio.client import connect
+
+from home_assistant_mcp.simulator import HomeAssistantSimulator
+
+
+def client(simulator, token="token"):
+    return httpx.AsyncClient(
+        transport=simulator.http_transport(),
+        base_url="http://simulator",
+        headers={"Authorization": f"Bearer {token}"}
+    )
+
+
+@pytest.mark.asyncio
+async def test_synthetic_entities_are_reproducible():
+    first, second = HomeAssistantSimulator(entities=3000, seed=7), HomeAssistantSimulator(entities=3000, seed=7)
+    assert len(first.all_states()) == 3005
+    assert [s["state"] for s in first.all_states()] == [s["state"] for s in second.all_states()]
+    assert len(first.area_entities("area_000")) == 20
+
+
+@pytest.mark.asyncio
+async def test_rest_api():
+    simulator = HomeAssistantSimulator(token="token", transition_time=0.01)
+    async with client(simulator) as http:
+        assert (await http.get("/api/states/lock.front_door")).json()["state"] == "locked"
+        assert (await http.get("/api/states/lock.missing")).status_code == 404
+        assert (await http.post("/api/services/lock/explode", json={})).status_code == 400
+
+        changed = (await http.post("/api/services/lock/unlock", json={"entity_id": "lock.front_door"})).json()
+        assert changed[0]["state"] == "unlocking"
+        await asyncio.sleep(0.05)
+        assert simulator.get_state("lock.front_door")["state"] == "unlocked"
+
+        history = (await http.get("/api/history/period", params={"filter_entity_id": "lock.front_door"})).json()
+        assert [s["state"] for s in history[0]] == ["locked", "unlocking", "unlocked"]
+
+        response = await http.post("/api/states/sensor.new", json={"state": "1", "attributes": {"unit_of_measurement": "W"}})
+        assert response.status_code == 201
+
+    async with client(simulator, token="wrong") as http:
+        assert (await http.get("/api/states")).status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_injected_faults():
+    simulator = HomeAssistantSimulator(seed=1)
+    async with client(simulator) as http:
+        simulator.fail_next(2, status=503)
+        assert [(await http.get("/api/states")).status_code for _ in range(3)] == [503, 503, 200]
+
+        simulator.error_rate = 1.0
+        assert (await http.get("/api/states")).status_code == 500
+        simulator.error_rate = 0.0
+
+        simulator.available = False
+        with pytest.raises(httpx.ConnectError):
+            await http.get("/api/states")
+
+
+@pytest.mark.asyncio
+async def test_template_rendering():
+    pytest.importorskip("jinja2")
+    simulator = HomeAssistantSimulator()
+    async with client(simulator) as http:
+        response = await http.post("/api/template", json={
+            "template": "{{ states.lock | selectattr('state', 'eq', 'locked') | map(attribute='entity_id') | list | tojson }}"
+        })
+        assert json.loads(response.text) == ["lock.front_door"]
+        response = await http.post("/api/template", json={
+            "template": "{{ areas | map('area_entities') | sum(start=[]) | tojson }}", "variables": {"areas": ["hallway"]}
+        })
+        assert sorted(json.loads(response.text)) == ["alarm_control_panel.alarm_control_panel", "lock.front_door"]
+
+
+@pytest.mark.asyncio
+async def test_websocket_api_with_coalescing_and_disconnect():
+    simulator = HomeAssistantSimulator(entities=100, transition_time=0)
+    await simulator.start()
+    async with connect(simulator.url.replace("http", "ws") + "/api/websocket") as ws:
+        assert json.loads(await ws.recv())["type"] == "auth_required"
+        await ws.send(json.dumps({"type": "auth", "access_token": "token"}))
+        assert json.loads(await ws.recv())["type"] == "auth_ok"
+
+        await ws.send(json.dumps({"id": 1, "type": "supported_features", "features": {"coalesce_messages": 1}}))
+        await ws.send(json.dumps({"id": 2, "type": "subscribe_events", "event_type": "state_changed"}))
+        await ws.send(json.dumps({
+            "id": 3, "type": "call_service", "domain": "lock", "service": "unlock",
+            "target": {"entity_id": "lock.front_door"}
+        }))
+        messages = []
+        while not any(m.get("id") == 3 and m["type"] == "result" for m in messages):
+            payload = json.loads(await ws.recv())
+            messages.extend(payload if isinstance(payload, list) else [payload])
+        events = [m["event"] for m in messages if m["type"] == "event"]
+        assert [event["data"]["new_state"]["state"] for event in events] == ["unlocking", "unlocked"]
+        # States a call changes carry the call's context
+        result = next(m for m in messages if m.get("id") == 3)
+        assert {event["data"]["new_state"]["context"]["id"] for event in events} == {result["result"]["context"]["id"]}
+
+        simulator.disconnect_websockets()
+        with pytest.raises(Exception):
+            while True:
+                await ws.recv()
+    await simulator.close()
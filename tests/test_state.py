@@ -0,0 +1,78 @@
+import gc
+import json
+import sys
+import tracemalloc
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent / 'src'))
+
+from home_assistant_mcp.simulator import HomeAssistantSimulator
+from home_assistant_mcp.state import StateCache, StateRecord
+
+
+def ha_state(entity_id, state, **attributes):
+    return {
+        "entity_id": entity_id,
+        "state": state,
+        "attributes": attributes,
+        "last_changed": "2024-05-01T10:00:00.123456+00:00",
+        "last_reported": "2024-05-01T10:00:05+00:00",
+        "last_updated": "2024-05-01T10:00:00.123456+00:00",
+        "context": {"id": "01HX0000000000000000000000", "parent_id": None, "user_id": None}
+    }
+
+
+def test_records_round_trip_exactly():
+    states = [
+        ha_state("light.kitchen", "on", brightness=255, rgb_color=[255, 0, 0], friendly_name="Kitchen"),
+        {**ha_state("lock.front_door", "locked"), "context": {"id": "a", "parent_id": "b", "user_id": "c"}},
+        {"entity_id": "sensor.legacy", "state": "1", "last_updated": "2024-05-01T10:00:00", "custom": True},
+        {"entity_id": "sensor.bare", "state": "2"},
+    ]
+    for state in states:
+        assert StateRecord(json.loads(json.dumps(state))).to_dict() == state
+
+
+def test_records_share_keys_and_timestamps():
+    first = StateRecord(ha_state("light.kitchen", "on", brightness=255, friendly_name="Kitchen"))
+    second = StateRecord(ha_state("light.hallway", "off", brightness=0, friendly_name="Hallway"))
+    assert first._keys is second._keys
+    assert first.domain is second.domain
+    assert first.last_changed is first.last_updated
+    assert first.attribute("brightness") == 255 and first.attribute("missing", "x") == "x"
+    assert first.timestamp("last_reported") == "2024-05-01T10:00:05+00:00"
+
+
+def test_cache_stores_records_and_returns_dicts():
+    cache = StateCache()
+    changes = []
+    cache.add_listener(lambda entity_id, old, new: changes.append(new))
+    state = ha_state("light.kitchen", "on", friendly_name="Kitchen")
+    cache.replace_all([state])
+    cache.replace_all([json.loads(json.dumps(state))])
+
+    assert len(changes) == 1 and isinstance(changes[0], StateRecord)
+    assert cache.get("light.kitchen") == state
+    assert cache.get_domain("light") == [state] and cache.get_domain("lock") == []
+    assert cache.get_record("light.kitchen").attribute("friendly_name") == "Kitchen"
+
+
+def retained(build):
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, result
+
+
+def test_records_use_less_memory_than_dicts():
+    body = json.dumps(HomeAssistantSimulator(entities=2000, seed=3).all_states())
+    dict_size, states = retained(lambda: json.loads(body))
+    # Interned once beforehand: how much the interpreter's table of interned strings
+    # grows within the measurement depends on what earlier tests interned
+    interned = [StateRecord(state) for state in json.loads(body)]
+    record_size, records = retained(lambda: [StateRecord(state) for state in json.loads(body)])
+    del interned
+    assert record_size < dict_size * 0.6
+    assert [record.to_dict() for record in records] == states
@@ -0,0 +1,56 @@
+import httpx
+import pytest
+from unittest.mock import patch
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent / 'src'))
+
+from home_assistant_mcp.server import HomeAssistantMcpServer
+from home_assistant_mcp.state import StateCache
+from home_assistant_mcp.store import PersistentStateStore
+
+
+def make_state(entity_id, state):
+    return {"entity_id": entity_id, "state": state, "attributes": {}, "last_updated": state}
+
+
+def test_changes_are_persisted_and_reloaded(tmp_path):
+    path = str(tmp_path / "states.db")
+    cache = StateCache()
+    store = PersistentStateStore(path, flush_interval=60)
+    store.attach(cache)
+
+    cache.set("lock.front_door", make_state("lock.front_door", "unlocked"))
+    cache.set("lock.front_door", make_state("lock.front_door", "locked"))
+    cache.set("light.kitchen", make_state("light.kitchen", "on"))
+    cache.set("light.kitchen", None)
+    store.close()
+
+    reloaded = PersistentStateStore(path).load()
+    assert reloaded == [make_state("lock.front_door", "locked")]
+
+
+def test_store_is_detached_after_close(tmp_path):
+    path = str(tmp_path / "states.db")
+    cache = StateCache()
+    store = PersistentStateStore(path)
+    store.attach(cache)
+    store.close()
+
+    cache.set("lock.front_door", make_state("lock.front_door", "locked"))
+    assert PersistentStateStore(path).load() == []
+
+
+@pytest.mark.asyncio
+async def test_unreachable_home_assistant_serves_labeled_last_known_state():
+    server = HomeAssistantMcpServer()
+    server._state_cache.set("lock.front_door", make_state("lock.front_door", "locked"))
+
+    with patch('httpx.AsyncClient.request', side_effect=httpx.ConnectError('Connection refused')):
+        state = await server.get_entity_state("lock.front_door")
+    assert state["state"] == "locked"
+    assert state["last_known"] is True
+
+    with patch('httpx.AsyncClient.request', side_effect=httpx.ConnectError('Connection refused')):
+        with pytest.raises(httpx.ConnectError):
+            await server.get_entity_state("lock.back_door")
@@ -0,0 +1,231 @@
+import asyncio
+import base64
+import json
+import pytest
+import sys
+import tracemalloc
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent / 'src'))
+
+from mcp.types import Tool
+from home_assistant_mcp.compression import CODECS, COMPRESSED_METHOD, compress, decompress, envelope, open_envelope
+from home_assistant_mcp.tcp import TcpTransport
+
+
+class FakeHaServer:
+    def __init__(self):
+        self.closed_sessions = []
+        self.cancelled = []
+        self.timeouts = []
+
+    def open_session(self, session, profile_settings=None):
+        pass
+
+    async def list_tools(self, session, cursor=None):
+        return [Tool(name="lock-lock", description="Lock a lock", inputSchema={"type": "object"})], None
+
+    async def handle_tool_call(self, name, arguments, session=None, timeout=None):
+        self.timeouts.append(timeout)
+        try:
+            await asyncio.sleep(arguments.get("delay", 0))
+        except asyncio.CancelledError:
+            self.cancelled.append(arguments["entity_id"])
+            raise
+        if name != "lock-lock":
+            raise ValueError(f"Unsupported domain: {name}")
+        return {"locked": arguments["entity_id"]}
+
+    def close_session(self, session):
+        self.closed_sessions.append(session)
+
+
+def compressed(data):
+    """An envelope however little compression saves"""
+    return json.dumps({"jsonrpc": "2.0", "method": COMPRESSED_METHOD, "params": {
+        "encoding": "gzip", "data": base64.b64encode(compress(data, "gzip")).decode()
+    }}).encode()
+
+
+def request(message_id, method, **params):
+    return json.dumps({"jsonrpc": "2.0", "id": message_id, "method": method, "params": params}).encode() + b"\n"
+
+
+async def read_responses(reader, count):
+    responses = [json.loads(await reader.readline()) for _ in range(count)]
+    return {response["id"]: response for response in responses}
+
+
+@pytest.mark.asyncio
+async def test_pipelined_requests_are_handled_concurrently():
+    transport = TcpTransport(FakeHaServer(), port=0)
+    await transport.start()
+    reader, writer = await asyncio.open_connection(transport.host, transport.port)
+
+    # Several requests in one packet, plus one split across two writes
+    writer.write(
+        request(1, "tools/call", name="lock-lock", arguments={"entity_id": "slow", "delay": 0.2})
+        + request(2, "tools/call", name="lock-lock", arguments={"entity_id": "fast"})
+        + request(3, "tools/list")
+    )
+    split = request(4, "tools/call", name="light-explode", arguments={})
+    writer.write(split[:10])
+    await writer.drain()
+    writer.write(split[10:])
+
+    first = json.loads(await reader.readline())
+    assert first["id"] != 1
+    responses = await read_responses(reader, 3)
+    responses[first["id"]] = first
+
+    assert json.loads(responses[1]["result"]["content"][0]["text"]) == {"locked": "slow"}
+    assert responses[3]["result"]["tools"][0]["name"] == "lock-lock"
+    assert responses[4]["result"]["isError"] is True
+
+    writer.close()
+    await transport.close()
+
+
+@pytest.mark.asyncio
+async def test_protocol_errors():
+    ha_server = FakeHaServer()
+    transport = TcpTransport(ha_server, port=0, max_message_bytes=1024)
+    await transport.start()
+    reader, writer = await asyncio.open_connection(transport.host, transport.port)
+
+    writer.write(b"not json\n" + request(1, "prompts/list"))
+    assert json.loads(await reader.readline())["error"]["code"] == -32700
+    assert json.loads(await reader.readline())["error"]["code"] == -32601
+
+    writer.write(request(2, "tools/call", arguments={}) + request(5, "resources/read") + request(6, "resources/subscribe", uri=7))
+    responses = await read_responses(reader, 3)
+    assert [responses[message_id]["error"]["code"] for message_id in (2, 5, 6)] == [-32602] * 3
+
+    # A batch gets one array; a reused id of a request still running is rejected
+    batch = [json.loads(request(3, "tools/call", name="lock-lock", arguments={"entity_id": "a", "delay": 0.05})),
+             json.loads(request(4, "ping")), {"jsonrpc": "2.0", "method": "notifications/initialized"}]
+    writer.write(json.dumps(batch).encode() + b"\n" + request(3, "ping"))
+    assert json.loads(await reader.readline()) == {"jsonrpc": "2.0", "id": 3, "error": {"code": -32600, "message": "Request 3 is already in flight"}}
+    responses = json.loads(await reader.readline())
+    assert [response["id"] for response in responses] == [3, 4]
+
+    writer.write(b"[" + b" " * 2048 + b"]\n")
+    assert json.loads(await reader.readline())["error"]["message"] == "Message too large"
+    assert await reader.readline() == b""
+    await asyncio.sleep(0.01)
+    assert transport.connection_count == 0
+    assert len(ha_server.closed_sessions) == 1
+
+    writer.close()
+    await transport.close()
+
+
+@pytest.mark.asyncio
+async def test_close_drains_in_flight_requests():
+    transport = TcpTransport(FakeHaServer(), port=0)
+    await transport.start()
+    reader, writer = await asyncio.open_connection(transport.host, transport.port)
+    writer.write(request(1, "tools/call", name="lock-lock", arguments={"entity_id": "front_door", "delay": 0.1}))
+    await writer.drain()
+    await asyncio.sleep(0.02)
+
+    closing = asyncio.create_task(transport.close(drain_timeout=5))
+    await asyncio.sleep(0)
+    writer.write(request(2, "ping"))
+    responses = await read_responses(reader, 2)
+    assert responses[2]["error"]["code"] == -32000
+    assert json.loads(responses[1]["result"]["content"][0]["text"]) == {"locked": "front_door"}
+    await closing
+    with pytest.raises(OSError):
+        await asyncio.open_connection(transport.host, transport.port)
+
+
+@pytest.mark.asyncio
+async def test_negotiated_compression_of_large_messages():
+    transport = TcpTransport(FakeHaServer(), port=0, compress_min_bytes=512)
+    await transport.start()
+    reader, writer = await asyncio.open_connection(transport.host, transport.port)
+
+    writer.write(request(1, "initialize", capabilities={"experimental": {"homeassistant/compression": {"encodings": ["zstd", "gzip"]}}}))
+    capabilities = json.loads(await reader.readline())["result"]["capabilities"]
+    assert capabilities["experimental"]["homeassistant/compression"] == {"encoding": "gzip", "min_bytes": 512}
+
+    # Requests may be compressed too
+    large = request(2, "tools/call", name="lock-lock", arguments={"entity_id": "front_door " * 200})
+    writer.write(envelope(large.rstrip(), "gzip", 0) + b"\n" + request(3, "tools/call", name="lock-lock", arguments={"entity_id": "shed"}))
+    lines = [await reader.readline() for _ in range(2)]
+    small = next(json.loads(line) for line in lines if b'"id": 3' in line)
+    assert json.loads(small["result"]["content"][0]["text"]) == {"locked": "shed"}
+    wrapped = next(json.loads(line) for line in lines if b'"id": 3' not in line)
+    assert wrapped["method"] == COMPRESSED_METHOD and len(json.dumps(wrapped)) < len(large) / 3
+    assert json.loads(open_envelope(wrapped["params"]))["id"] == 2
+
+    bomb = envelope(b" " * 2_000_000, "gzip", 0)
+    writer.write(bomb + b"\n")
+    assert json.loads(await reader.readline())["error"]["code"] == -32600
+
+    writer.close()
+    await transport.close()
+
+
+@pytest.mark.asyncio
+async def test_compressed_messages_in_batches():
+    transport = TcpTransport(FakeHaServer(), port=0)
+    await transport.start()
+    reader, writer = await asyncio.open_connection(transport.host, transport.port)
+
+    # A compressed request in a batch is answered in the batch's array
+    batch = [json.loads(compressed(request(1, "ping").rstrip())), json.loads(request(2, "ping"))]
+    writer.write(json.dumps(batch).encode() + b"\n")
+    assert [response["id"] for response in json.loads(await reader.readline())] == [1, 2]
+
+    nested = compressed(compressed(request(3, "ping").rstrip()))
+    writer.write(nested + b"\n")
+    assert json.loads(await reader.readline())["error"]["message"] == "Compressed messages cannot be nested"
+    writer.write(b"[" + nested + b"]\n")
+    assert json.loads(await reader.readline())[0]["error"]["message"] == "Compressed messages cannot be nested"
+
+    writer.close()
+    await transport.close()
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "deflate", "br"])
+def test_decompression_stops_at_the_limit(encoding):
+    if encoding not in CODECS:
+        pytest.skip(f"{encoding} is not available")
+    bomb = compress(b"\0" * 50_000_000, encoding)
+    assert len(bomb) < 100_000
+    tracemalloc.start()
+    try:
+        with pytest.raises(ValueError, match="exceeds 1000000 bytes"):
+            decompress(bomb, encoding, max_bytes=1_000_000)
+        assert tracemalloc.get_traced_memory()[1] < 10_000_000
+    finally:
+        tracemalloc.stop()
+    assert decompress(compress(b"{}", encoding), encoding, max_bytes=2) == b"{}"
+
+
+@pytest.mark.asyncio
+async def test_cancelled_and_abandoned_requests_stop_running():
+    ha_server = FakeHaServer()
+    transport = TcpTransport(ha_server, port=0, max_in_flight=2)
+    await transport.start()
+    reader, writer = await asyncio.open_connection(transport.host, transport.port)
+
+    call = json.loads(request(1, "tools/call", name="lock-lock", arguments={"entity_id": "slow", "delay": 10}))
+    call["params"]["_meta"] = {"homeassistant/timeout": 2.5}
+    writer.write(json.dumps(call).encode() + b"\n")
+    await asyncio.sleep(0.05)
+    writer.write(json.dumps({"jsonrpc": "2.0", "method": "notifications/cancelled", "params": {"requestId": 1}}).encode() + b"\n")
+    # The cancelled request answers nothing and its slot is free again
+    writer.write(request(2, "tools/call", name="lock-lock", arguments={"entity_id": "held", "delay": 10}))
+    writer.write(request(3, "ping"))
+    assert json.loads(await asyncio.wait_for(reader.readline(), 1))["id"] == 3
+    assert ha_server.cancelled == ["slow"] and ha_server.timeouts[0] == 2.5
+
+    writer.close()
+    for _ in range(100):
+        if "held" in ha_server.cancelled:
+            break
+        await asyncio.sleep(0.01)
+    assert ha_server.cancelled == ["slow", "held"]
+    await transport.close()
@@ -0,0 +1,58 @@
+import pytest
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent / 'src'))
+
+from home_assistant_mcp.cache import TTLCache
+from home_assistant_mcp.services.template import TemplateService, is_cacheable_template
+
+
+class FakeRenderer:
+    def __init__(self):
+        self.calls = 0
+
+    async def __call__(self, template, variables=None):
+        self.calls += 1
+        return f"rendered {self.calls}"
+
+
+@pytest.mark.asyncio
+async def test_pure_templates_are_cached():
+    render = FakeRenderer()
+    service = TemplateService(render)
+    template = "{{ states.lock | selectattr('state', 'eq', 'unlocked') | list | count }}"
+
+    first = await service.render_template(template)
+    second = await service.render_template(template)
+    assert first == {"result": "rendered 1", "cached": False}
+    assert second == {"result": "rendered 1", "cached": True}
+    assert render.calls == 1
+
+    await service.render_template(template, variables={"x": 1})
+    assert render.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_volatile_templates_are_not_cached():
+    render = FakeRenderer()
+    service = TemplateService(render)
+
+    await service.render_template("{{ now().hour }}")
+    await service.render_template("{{ now().hour }}")
+    assert render.calls == 2
+    assert not is_cacheable_template("{{ as_timestamp() }}")
+    assert is_cacheable_template("{{ as_timestamp(states.sun.sun.last_changed) }}")
+
+
+def test_ttl_cache_expiry_and_lru_eviction():
+    now = [0.0]
+    cache = TTLCache(max_entries=2, ttl=1.0, clock=lambda: now[0])
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    now[0] = 2.0
+    assert cache.get("a") is None
+    assert (cache.hits, cache.misses) == (2, 2)
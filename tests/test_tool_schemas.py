@@ -0,0 +1,101 @@
+import inspect
+import json
+import pytest
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent / 'src'))
+
+from home_assistant_mcp.profiles import SCOPE_TOOL
+from home_assistant_mcp.server import HomeAssistantMcpServer
+from pydantic import BaseModel, Field
+from home_assistant_mcp.services._base import ControlModel
+from home_assistant_mcp.services.alarm_control_panel import AlarmControlPanelControl
+from home_assistant_mcp.services.lock import LockControl
+
+
+def walk(node):
+    if isinstance(node, dict):
+        yield node
+        for value in node.values():
+            yield from walk(value)
+    elif isinstance(node, list):
+        for item in node:
+            yield from walk(item)
+
+
+def test_schemas_are_minimal_json_schema():
+    server = HomeAssistantMcpServer()
+    for tool in server.get_all_tools():
+        schema = tool.inputSchema
+        assert schema["type"] == "object"
+        assert set(schema.get("required", [])) <= set(schema["properties"])
+        for node in walk(schema):
+            assert not {"parameters", "optional", "title", "$ref", "$defs"} & set(node)
+
+
+def test_schema_properties_match_handlers():
+    server = HomeAssistantMcpServer()
+    for tool in server.get_all_tools():
+        if tool.name == SCOPE_TOOL:
+            continue
+        parameters = inspect.signature(server._resolve_tool(tool.name)).parameters
+        assert set(tool.inputSchema["properties"]) <= set(parameters), tool.name
+        required = {name for name, p in parameters.items() if p.default is inspect.Parameter.empty}
+        assert required <= set(tool.inputSchema.get("required", [])), tool.name
+
+
+def test_schemas_are_not_shared():
+    schema = LockControl.get_llm_schema()
+    schema["properties"]["entity_id"]["description"] = "changed"
+    assert LockControl.get_llm_schema() != schema
+    arm = AlarmControlPanelControl.get_llm_schema(["code", "alarm_mode"])
+    disarm = AlarmControlPanelControl.get_llm_schema(["code"])
+    assert arm["properties"]["code"] == disarm["properties"]["code"]
+    assert arm["required"] == ["entity_id", "alarm_mode"]
+    assert "enum" in arm["properties"]["alarm_mode"]
+
+
+def test_fields_named_like_annotations_keep_their_schema():
+    class Scene(BaseModel):
+        title: str
+        default: int = 0
+
+    class SceneControl(ControlModel):
+        entity_id: str = Field(description="Scene ID")
+        scene: Scene = Field(description="Scene to apply")
+        features = {"scene": ["scene"]}
+
+    scene = SceneControl.get_llm_schema(["scene"])["properties"]["scene"]
+    assert scene["properties"] == {"title": {"type": "string"}, "default": {"type": "integer", "default": 0}}
+    assert "title" not in scene
+
+
+def test_payload_sizes():
+    server = HomeAssistantMcpServer()
+    tools = server.get_all_tools()
+    sizes = server.tool_payload_sizes(tools)
+    lock = next(tool for tool in tools if tool.name == "lock-lock")
+    assert sizes["lock-lock"] == len(json.dumps(lock.model_dump(exclude_none=True), separators=(",", ":")))
+    assert sizes["lock-lock"] < 250
+
+
+@pytest.mark.asyncio
+async def test_arguments_are_validated_against_the_schema():
+    server = HomeAssistantMcpServer()
+    for arguments in (
+        {"entity_id": "ceiling_lights", "brightness": "max"},
+        {"entity_id": "ceiling_lights", "rgb_color": [255, 0]},
+        {"entity_id": "ceiling_lights", "transition_time": 1},
+        {},
+    ):
+        with pytest.raises(ValueError):
+            await server.handle_tool_call("light-turn_on", arguments)
+
+    # A session can only be given by the server, not smuggled in with the arguments
+    session = object()
+    server.open_session(session, {"domains": ["light"]})
+    with pytest.raises(ValueError, match="session"):
+        await server.handle_tool_call("execute_plan", {
+            "steps": [{"id": "open", "tool": "lock-unlock", "arguments": {"entity_id": "front_door"}}],
+            "session": None
+        }, session)
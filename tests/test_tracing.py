@@ -0,0 +1,57 @@
+import json
+import pytest
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent / 'src'))
+
+from home_assistant_mcp.tracing import Tracer, JsonLinesExporter
+
+
+class ListExporter:
+    def __init__(self):
+        self.spans = []
+
+    def export(self, span):
+        self.spans.append(span)
+
+    def shutdown(self):
+        pass
+
+
+def test_nested_spans_share_trace():
+    exporter = ListExporter()
+    tracer = Tracer(exporter, sample_rate=1.0)
+
+    with tracer.span("handle_tool_call", tool="lock-lock") as root:
+        with tracer.span("ha.http", path="/api/services/lock/lock") as child:
+            child.set_attribute("status", 200)
+
+    child_span, root_span = exporter.spans
+    assert root_span is root and child_span is child
+    assert child_span.trace_id == root_span.trace_id
+    assert child_span.parent_id == root_span.span_id
+    assert child_span.attributes == {"path": "/api/services/lock/lock", "status": 200}
+
+
+def test_unsampled_traces_record_nothing():
+    exporter = ListExporter()
+    tracer = Tracer(exporter, sample_rate=0.0)
+
+    with tracer.span("handle_tool_call"):
+        with tracer.span("ha.http") as child:
+            child.set_attribute("status", 200)
+    assert exporter.spans == []
+
+
+def test_errors_are_recorded(tmp_path):
+    path = tmp_path / "spans.jsonl"
+    tracer = Tracer(JsonLinesExporter(str(path)), sample_rate=1.0)
+
+    with pytest.raises(ValueError):
+        with tracer.span("handle_tool_call", tool="light-explode"):
+            raise ValueError("Unsupported service")
+    tracer.shutdown()
+
+    (span,) = [json.loads(line) for line in path.read_text().splitlines()]
+    assert span["name"] == "handle_tool_call"
+    assert span["error"] == "ValueError: Unsupported service"
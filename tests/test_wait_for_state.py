@@ -0,0 +1,77 @@
+import asyncio
+import pytest
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent / 'src'))
+
+from home_assistant_mcp.server import HomeAssistantMcpServer
+from home_assistant_mcp.simulator import HomeAssistantSimulator
+from home_assistant_mcp.state import StateCache
+from home_assistant_mcp.services.state import StateService
+
+
+def make_state(state, **attributes):
+    return {"entity_id": "lock.front_door", "state": state, "attributes": attributes}
+
+
+async def no_fetch(entity_id):
+    raise AssertionError("unexpected REST fetch")
+
+
+@pytest.mark.asyncio
+async def test_wait_returns_on_state_change():
+    cache = StateCache()
+    cache.live = True
+    cache.set("lock.front_door", make_state("locking"))
+    service = StateService(cache, get_state=no_fetch)
+
+    async def finish_locking():
+        await asyncio.sleep(0.05)
+        cache.set("lock.front_door", make_state("locked"))
+
+    asyncio.create_task(finish_locking())
+    result = await service.wait_for_state("lock.front_door", state="locked", timeout=5)
+    assert result["matched"] is True
+    assert result["state"]["state"] == "locked"
+    assert result["elapsed"] < 1
+
+
+@pytest.mark.asyncio
+async def test_wait_times_out_with_last_state():
+    cache = StateCache()
+    cache.live = True
+    cache.set("lock.front_door", make_state("locking"))
+    service = StateService(cache, get_state=no_fetch)
+
+    result = await service.wait_for_state("lock.front_door", state=["locked", "jammed"], timeout=0.05)
+    assert result["matched"] is False
+    assert result["state"]["state"] == "locking"
+
+
+@pytest.mark.asyncio
+async def test_wait_polls_without_event_stream(monkeypatch):
+    monkeypatch.setattr("home_assistant_mcp.services.state.POLL_INTERVAL_SECONDS", 0.01)
+    states = iter([make_state("heat", temperature=68), make_state("heat", temperature=70)])
+
+    async def get_state(entity_id):
+        return next(states)
+
+    service = StateService(StateCache(), get_state=get_state)
+    result = await service.wait_for_state("lock.front_door", attribute="temperature", value="70", timeout=1)
+    assert result["matched"] is True
+
+
+@pytest.mark.asyncio
+async def test_wait_through_server_sees_transition_despite_read_cache(monkeypatch):
+    monkeypatch.setattr("home_assistant_mcp.services.state.POLL_INTERVAL_SECONDS", 0.05)
+    simulator = HomeAssistantSimulator(transition_time=0.2)
+    server = HomeAssistantMcpServer(http_transport=simulator.http_transport())
+
+    assert (await server.handle_tool_call("lock-unlock", {"entity_id": "front_door"}))[0]["state"] == "unlocking"
+    # The read cache keeps lock states for 10s; polling must not be answered from it
+    assert (await server.handle_tool_call("lock-get_state", {"entity_id": "front_door"}))["state"] == "unlocking"
+    result = await server.handle_tool_call(
+        "wait_for_state", {"entity_id": "lock.front_door", "state": "unlocked", "timeout": 2}
+    )
+    assert result["matched"] and result["elapsed"] < 1
+    assert (await server.handle_tool_call("lock-get_state", {"entity_id": "front_door"}))["state"] == "unlocked"